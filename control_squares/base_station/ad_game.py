@@ -34,6 +34,7 @@ from battlepoint_core import (
 from battlepoint_game import BaseGame
 from settings import ThreeCPOptions, ControlSquareMapping
 from ble_scanner import EnhancedBLEScanner
+from state_bus import VersionedState
 
 
 class CPOwnerState(Enum):
@@ -165,6 +166,9 @@ class ADGame(BaseGame):
         """Start the game."""
         # self.reset_game() is called by backend at start_game, then we start here.
         self._start_time_ms = self.clock.milliseconds()
+        # progress starts now, not when init ran before the countdown
+        for cp in self.control_points:
+            cp.restart_clock()
         if self.events:
             self.events.game_started()
 
@@ -244,6 +248,13 @@ class ADGame(BaseGame):
         remaining = total_limit - elapsed
         return max(0, remaining)
 
+    def next_event_ms(self) -> Optional[int]:
+        """Clock time the round timer (including added time) runs out."""
+        if not self.is_running() or self._winner != Team.NOBODY:
+            return None
+        base_limit = self.options_ad.time_limit_seconds if self.options_ad else 600
+        return self._start_time_ms + (base_limit + self.time_added_total) * 1000
+
     def check_victory(self) -> Team:
         """
         Check if either team has won.
@@ -353,6 +364,7 @@ class ADBackend:
         self._countdown_total = 0
         self._countdown_started_ms = 0
         self.game_id: int = 0
+        self.state_versions = VersionedState()
 
         # Manual control per CP
         self.manual_control: bool = False
@@ -369,6 +381,14 @@ class ADBackend:
         """Configure game options."""
         options.validate()
         self.options = options
+        self.scanner.configure_presence(
+            confirm_adverts=options.presence_confirm_adverts,
+            min_timeout_ms=options.presence_min_timeout_ms,
+            max_timeout_ms=options.presence_max_timeout_ms,
+            rssi_alpha=options.presence_rssi_alpha,
+            interval_alpha=options.presence_interval_alpha,
+            min_rssi=options.presence_min_rssi,
+        )
 
         # Determine which CPs are "used" based on control_square_mapping
         mapping: ControlSquareMapping = self.options.control_square_mapping
@@ -532,6 +552,45 @@ class ADBackend:
 
     # ---------- STATE / MANUAL CONTROL ----------
 
+    def get_state_since(self, version: int) -> dict:
+        """get_state() as a delta against `version`, see VersionedState.since."""
+        return self.state_versions.since(
+            version, self.get_state, self.clock.milliseconds(), self.state_key()
+        )
+
+    def next_wakeup_ms(self) -> Optional[int]:
+        """Earliest clock time update() has something to do; see TickScheduler."""
+        if self._phase == GamePhase.COUNTDOWN:
+            elapsed = self.clock.milliseconds() - self._countdown_started_ms
+            return self._countdown_started_ms + (max(0, elapsed) // 1000 + 1) * 1000
+        if self._phase != GamePhase.RUNNING or not self.game:
+            return None
+        times = [self.game.next_event_ms()]
+        times += [cp.next_event_ms() for cp in self.control_points]
+        return min((t for t in times if t is not None), default=None)
+
+    def state_key(self) -> tuple:
+        """
+        Cheap fingerprint of what get_state() shows: an equal key means an
+        equal state. A field added to get_state() needs its input here too;
+        test_state_key_moves_whenever_get_state_does plays a match to check.
+        """
+        key = (self._phase, self._running, self.game_id, self.event_manager.last_seq())
+        if not self.game or self._phase == GamePhase.IDLE:
+            return key
+        return key + (
+            (self.clock.milliseconds() - self._countdown_started_ms) // 1000
+            if self._phase == GamePhase.COUNTDOWN else 0,
+            self.game.get_remaining_seconds(),
+            self.options.time_limit_seconds,
+            self.game.time_added_total,
+            self.game.is_over(),
+            self.game.get_winner(),
+            tuple(self.game.cp_owners),
+            tuple(self.game.cp_used),
+            tuple(cp.state_key() for cp in self.game.control_points),
+        )
+
     def get_state(self) -> dict:
         """Get current game state for API."""
         events = [ev.to_display() for ev in self.event_manager.get_events(100)]
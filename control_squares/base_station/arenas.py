@@ -0,0 +1,356 @@
+"""
+Several independent matches on one base station.
+
+An arena is one field: its own backend (KOTH, 3CP or AD), the control
+squares that belong to it (a ControlSquareMapping), its own EventManager
+and sound routing, and its own state_bus topic "arena/<id>". Every arena
+reads the one shared EnhancedBLEScanner through a ScannerLease, so the
+radio runs while any arena (or the single-field pages) has a game going,
+and one field finishing does not blind the others.
+
+A tile belongs to at most one arena; ArenaRegistry refuses overlapping
+mappings. The arena list persists in arenas.json through the SettingsStore
+and is restored by load() at startup.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from ad_game import ADBackend
+from battlepoint_game import EnhancedGameBackend
+from state_bus import StateBus, state_bus
+from settings import (
+    ControlSquareMapping,
+    SettingsStore,
+    ThreeCPOptions,
+    koth_options_from_dict,
+    koth_options_to_dict,
+    settings_store,
+)
+from threecp_game import ThreeCPBackend
+from tick_scheduler import backend_phase
+
+ARENA_MODES = ("koth", "3cp", "ad")
+ARENAS_FILE = "arenas.json"
+MAX_ARENAS = 8
+_ARENA_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,23}$")
+
+
+class ScannerLease:
+    """
+    One holder's claim on a shared scanner. start_scanning() adds the
+    holder, stop_scanning() removes it and only stops the radio once no
+    holder is left. configure_presence() only touches the holder's own
+    squares. Everything else is passed through to the scanner.
+    """
+
+    def __init__(self, scanner, holders: Set[str], holder: str):
+        self._scanner = scanner
+        self._holders = holders
+        self.holder = holder
+        # the squares the holder's arena maps, see Arena.configure()
+        self.squares: Set[int] = set()
+
+    def __getattr__(self, name):
+        return getattr(self._scanner, name)
+
+    async def start_scanning(self):
+        self._holders.add(self.holder)
+        await self._scanner.start_scanning()
+
+    async def stop_scanning(self):
+        self._holders.discard(self.holder)
+        if not self._holders:
+            await self._scanner.stop_scanning()
+
+    def configure_presence(self, **changes):
+        self._scanner.configure_presence(scope=self.holder, squares=self.squares, **changes)
+
+    async def release(self):
+        """Give up the claim for good: stop scanning for this holder and drop its presence settings."""
+        await self.stop_scanning()
+        self._scanner.clear_presence(self.holder)
+
+
+class SilentSound:
+    """Sound system that plays nothing, for arenas built without a sound factory."""
+
+    volume = 0
+
+    def play(self, sound_id: int):
+        pass
+
+    def queue(self, sound_id: int):
+        pass
+
+    def loop(self, sound_id: int):
+        pass
+
+    def play_menu_track(self):
+        pass
+
+    def set_volume(self, volume: int):
+        pass
+
+    def stop(self):
+        pass
+
+
+@dataclass
+class ArenaConfig:
+    arena_id: str
+    name: str = ""
+    mode: str = "koth"
+    # KOTH uses cp_1_squares as the hill; 3CP/AD use all three
+    mapping: ControlSquareMapping = field(default_factory=ControlSquareMapping)
+    # also play through the base station speaker (only one arena should)
+    local_sound: bool = False
+    # mode options as koth_options_to_dict() / ThreeCPOptions.to_dict()
+    options: dict = field(default_factory=dict)
+
+    def validate(self):
+        if not _ARENA_ID.match(self.arena_id or ""):
+            raise ValueError(f"arena id {self.arena_id!r} must be 1-24 of a-z, 0-9, '-', '_'")
+        if self.mode not in ARENA_MODES:
+            raise ValueError(f"arena mode {self.mode!r}, expected one of {ARENA_MODES}")
+
+    def squares(self) -> Set[int]:
+        cps = (1,) if self.mode == "koth" else (1, 2, 3)
+        return {int(s) for cp in cps for s in self.mapping.get_squares_for_cp(cp)}
+
+    def to_dict(self) -> dict:
+        return {
+            "arena_id": self.arena_id,
+            "name": self.name,
+            "mode": self.mode,
+            "mapping": self.mapping.to_dict(),
+            "local_sound": self.local_sound,
+            "options": dict(self.options),
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "ArenaConfig":
+        return ArenaConfig(
+            arena_id=str(data.get("arena_id", "")),
+            name=data.get("name", ""),
+            mode=data.get("mode", "koth"),
+            mapping=ControlSquareMapping.from_dict(data.get("mapping", {})),
+            local_sound=bool(data.get("local_sound", False)),
+            options=dict(data.get("options", {})),
+        )
+
+
+# sound_factory(config) -> (sound system for the backend, browser bus for its pages or None)
+SoundFactory = Callable[[ArenaConfig], Tuple[object, Optional[object]]]
+
+
+def _silent(_config: ArenaConfig):
+    return SilentSound(), None
+
+
+class Arena:
+    """One field: a backend bound to its own squares, events and sound."""
+
+    def __init__(self, config: ArenaConfig, backend, sound_system, browser_bus=None):
+        self.config = config
+        self.backend = backend
+        self.sound_system = sound_system
+        self.browser_bus = browser_bus
+
+    @property
+    def arena_id(self) -> str:
+        return self.config.arena_id
+
+    @property
+    def mode(self) -> str:
+        return self.config.mode
+
+    @property
+    def topic(self) -> str:
+        return f"arena/{self.config.arena_id}"
+
+    @property
+    def event_manager(self):
+        return self.backend.event_manager
+
+    def configure(self, options: Optional[dict] = None):
+        """Apply mode options (default: the saved ones) with this arena's mapping."""
+        options = dict(self.config.options if options is None else options)
+        if isinstance(self.backend.scanner, ScannerLease):
+            self.backend.scanner.squares = self.config.squares()
+        if self.mode == "koth":
+            go = koth_options_from_dict(options)
+            self.backend.configure(go)
+            self.backend.square_ids = list(self.config.mapping.cp_1_squares)
+            self.config.options = koth_options_to_dict(go)
+        else:
+            opts = ThreeCPOptions.from_dict(options)
+            opts.control_square_mapping = self.config.mapping
+            self.backend.configure(opts)
+            self.config.options = opts.to_dict()
+
+    def get_options(self) -> dict:
+        data = dict(self.config.options)
+        if self.mode != "koth":
+            data["control_square_mapping"] = self.config.mapping.to_dict()
+        return data
+
+    def get_summary(self) -> dict:
+        return {
+            "arena_id": self.arena_id,
+            "name": self.config.name or self.arena_id,
+            "mode": self.mode,
+            "topic": self.topic,
+            "squares": sorted(self.config.squares()),
+            "phase": backend_phase(self.backend),
+            "game_id": self.backend.game_id,
+            "local_sound": self.config.local_sound,
+        }
+
+
+class ArenaRegistry:
+    """
+    The arenas hosted by this base station, all fed by one scanner.
+
+    attach() hands every arena (present and future) to a TickScheduler
+    under its topic, with publisher_factory(backend, topic) as its
+    after-tick hook.
+    """
+
+    def __init__(
+        self,
+        scanner,
+        sound_factory: Optional[SoundFactory] = None,
+        store: Optional[SettingsStore] = None,
+        path: str = ARENAS_FILE,
+        max_arenas: int = MAX_ARENAS,
+        bus: Optional[StateBus] = None,
+    ):
+        self.scanner = scanner
+        self.bus = bus if bus is not None else state_bus
+        self.sound_factory = sound_factory if sound_factory is not None else _silent
+        self.store = store if store is not None else settings_store
+        self.path = path
+        self.max_arenas = max_arenas
+        self.arenas: Dict[str, Arena] = {}
+        self._scan_holders: Set[str] = set()
+        self._scheduler = None
+        self._publisher_factory = None
+
+    def lease(self, holder: str) -> ScannerLease:
+        """A scanner handle for `holder` that only stops the radio when nobody else needs it."""
+        return ScannerLease(self.scanner, self._scan_holders, holder)
+
+    def attach(self, scheduler, publisher_factory=None):
+        self._scheduler = scheduler
+        self._publisher_factory = publisher_factory
+        for arena in self.arenas.values():
+            self._schedule(arena)
+
+    def _schedule(self, arena: Arena):
+        if self._scheduler is None:
+            return
+        after = self._publisher_factory(arena.backend, arena.topic) if self._publisher_factory else None
+        self._scheduler.register(arena.topic, arena.backend, after)
+
+    # ---------- membership ----------
+
+    def get(self, arena_id: str) -> Optional[Arena]:
+        return self.arenas.get(arena_id)
+
+    def claimed_squares(self, exclude: Optional[str] = None) -> Dict[int, str]:
+        """square id -> arena id, for every arena but `exclude`."""
+        return {
+            sq: arena_id
+            for arena_id, arena in self.arenas.items()
+            if arena_id != exclude
+            for sq in arena.config.squares()
+        }
+
+    def _check_squares(self, config: ArenaConfig):
+        claimed = self.claimed_squares(exclude=config.arena_id)
+        clashes = sorted(sq for sq in config.squares() if sq in claimed)
+        if clashes:
+            owners = ", ".join(f"CS-{sq:02d} ({claimed[sq]})" for sq in clashes)
+            raise ValueError(f"arena {config.arena_id}: squares already in use: {owners}")
+
+    def add(self, config: ArenaConfig, save: bool = True) -> Arena:
+        config.validate()
+        if config.arena_id in self.arenas:
+            raise ValueError(f"arena {config.arena_id} already exists")
+        if len(self.arenas) >= self.max_arenas:
+            raise ValueError(f"at most {self.max_arenas} arenas")
+        self._check_squares(config)
+
+        sound_system, browser_bus = self.sound_factory(config)
+        scanner = self.lease(f"arena/{config.arena_id}")
+        if config.mode == "koth":
+            backend = EnhancedGameBackend(sound_system=sound_system, scanner=scanner)
+        elif config.mode == "3cp":
+            backend = ThreeCPBackend(sound_system=sound_system, scanner=scanner)
+        else:
+            backend = ADBackend(sound_system=sound_system, scanner=scanner)
+
+        arena = Arena(config, backend, sound_system, browser_bus)
+        arena.configure()
+        self.arenas[config.arena_id] = arena
+        self._schedule(arena)
+        print(f"[ARENA] added {config.arena_id} ({config.mode}) squares={sorted(config.squares())}")
+        if save:
+            self.save()
+        return arena
+
+    async def remove(self, arena_id: str) -> bool:
+        """Stop the arena's game and release its scheduler entry, scanner lease and state topic."""
+        arena = self.arenas.pop(arena_id, None)
+        if arena is None:
+            return False
+        if arena.backend.game is not None:
+            arena.backend.stop_game()
+        if self._scheduler is not None:
+            self._scheduler.unregister(arena.topic)
+        await arena.backend.scanner.release()
+        self.bus.close(arena.topic)
+        print(f"[ARENA] removed {arena_id}")
+        self.save()
+        return True
+
+    def set_mapping(self, arena_id: str, mapping: ControlSquareMapping) -> Arena:
+        arena = self.arenas[arena_id]
+        candidate = ArenaConfig(arena.arena_id, arena.config.name, arena.mode, mapping)
+        self._check_squares(candidate)
+        arena.config.mapping = mapping
+        arena.configure()
+        self.save()
+        return arena
+
+    def configure(self, arena_id: str, options: dict) -> Arena:
+        arena = self.arenas[arena_id]
+        arena.configure(options)
+        self.save()
+        return arena
+
+    # ---------- persistence ----------
+
+    def save(self) -> bool:
+        try:
+            self.store.put(self.path, {"arenas": [a.config.to_dict() for a in self.arenas.values()]})
+            return True
+        except Exception as e:
+            print(f"[ARENA] error saving {self.path}: {e}")
+            return False
+
+    def load(self) -> List[Arena]:
+        """Re-create the saved arenas; ones that no longer validate are skipped."""
+        data = self.store.get(self.path) or {}
+        loaded = []
+        for item in data.get("arenas", []):
+            try:
+                loaded.append(self.add(ArenaConfig.from_dict(item), save=False))
+            except Exception as e:
+                print(f"[ARENA] skipping saved arena {item.get('arena_id')!r}: {e}")
+        return loaded
+
+    def get_summary(self) -> List[dict]:
+        return [a.get_summary() for a in self.arenas.values()]
@@ -1,14 +1,23 @@
 import asyncio
 import sys
+import time
 
 
-from nicegui import ui, app
-from sound_bus import BrowserSoundBus,CompositeSoundSystem
+from nicegui import ui, app, Client
+from sound_bus import browser_sound_bus, BrowserSoundBus, CompositeSoundSystem
 from battlepoint_game import EnhancedGameBackend,SoundSystem
 from threecp_game import ThreeCPBackend
 from clock_game import ClockBackend
 from ad_game import ADBackend
-from settings import UnifiedSettingsManager, ThreeCPOptions
+from settings import UnifiedSettingsManager, ThreeCPOptions, ControlSquareMapping
+from arenas import ArenaRegistry, ArenaConfig
+from ble_scanner import BleLogLevel
+from ble_process import scanner_from_env
+from battlepoint_core import RealClock
+from state_bus import state_bus, VersionedState
+from tick_scheduler import TickScheduler
+from metrics import REGISTRY, CONTENT_TYPE, Gauge
+from starlette.responses import Response
 import aiohttp
 
 
@@ -17,19 +26,37 @@ if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
-browser_sound_bus = BrowserSoundBus(base_url='/sounds')
 native_sound = SoundSystem(base_dir='sounds')
+native_sound.warm_up()
 composite_sound = CompositeSoundSystem(
     local=native_sound,
     browser=browser_sound_bus,
 )
 
+
+
+def arena_sound(config: ArenaConfig):
+    """Each arena gets its own browser bus; only a local_sound arena uses the speaker."""
+    bus = BrowserSoundBus(base_url='/sounds')
+    if config.local_sound:
+        return CompositeSoundSystem(local=native_sound, browser=bus), bus
+    return bus, bus
+
+
+# the one radio scanner; BP_BLE_PROCESS=1 runs it in its own process (see ble_process)
+shared_scanner = scanner_from_env(RealClock())
+
 # Create backends for all modes
-koth_backend = EnhancedGameBackend(sound_system = composite_sound)
+koth_backend = EnhancedGameBackend(sound_system = composite_sound, scanner=shared_scanner)
+
+# every backend (the single-field modes and each arena) shares this one
+# scanner through a lease, so one game stopping doesn't stop the radio
+arena_registry = ArenaRegistry(shared_scanner, sound_factory=arena_sound)
+koth_backend.scanner = arena_registry.lease('koth')
 
 threecp_backend = ThreeCPBackend(
     sound_system=koth_backend.sound_system,
-    scanner=koth_backend.scanner,
+    scanner=arena_registry.lease('3cp'),
 )
 
 clock_backend = ClockBackend(
@@ -38,7 +65,7 @@ clock_backend = ClockBackend(
 
 ad_backend = ADBackend(
     sound_system=koth_backend.sound_system,
-    scanner=koth_backend.scanner,
+    scanner=arena_registry.lease('ad'),
 )
 composite_sound.play_menu_track()
 settings_manager = UnifiedSettingsManager()
@@ -59,6 +86,9 @@ if threecp_saved:
     opts, vol, _ = threecp_saved
     threecp_backend.configure(opts)
 
+# ---- Arenas saved from last time ----
+arena_registry.load()
+
 # Shared HTTP session helper (used by pages / debug)
 _session: aiohttp.ClientSession | None = None
 
@@ -74,6 +104,9 @@ from pages.ad import ad_game_ui
 from pages.clock import clock_game_ui
 from pages.settings import settings_ui
 from pages.debug import debug_ui
+from pages.arena import install_arena_pages
+
+install_arena_pages(arena_registry)
 
 
 @app.get("/api/manual/state")
@@ -88,6 +121,7 @@ async def generic_manual_mode(enabled: bool):
     """Global manual mode toggle for debug page (uses KOTH backend)."""
     print(f"[DEBUG] /api/manual/mode/{enabled} called (alias -> KOTH)")
     koth_backend.set_manual_control(enabled)
+    tick_scheduler.wake('koth')
     return koth_backend.get_manual_state()
 
 
@@ -125,6 +159,26 @@ async def bluetooth_devices():
         return {"scanning": False, "device_count": 0, "devices": []}
 
 
+@app.get("/api/bluetooth/log")
+async def bluetooth_log(limit: int = 100):
+    """Recent scanner diagnostics from the in-memory ring buffer."""
+    # in process mode this is a round trip to the scanner child
+    return await asyncio.get_running_loop().run_in_executor(None, koth_backend.scanner.log.get_state, limit)
+
+
+@app.post("/api/bluetooth/log/level/{level}")
+async def bluetooth_log_level(level: str):
+    """Change scanner log level (OFF, WARN, INFO, DEBUG)."""
+    try:
+        new_level = BleLogLevel[level.upper()]
+    except KeyError:
+        return {"status": "error", "reason": f"unknown level {level}"}
+    log = koth_backend.scanner.log
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, log.set_level, new_level)
+    return await loop.run_in_executor(None, log.get_state, 0)
+
+
 @app.get("/api/koth/manual/state")
 async def koth_manual_state():
     print("[DEBUG] /api/koth/manual/state called")
@@ -136,15 +190,32 @@ async def koth_get_state():
     return koth_backend.get_state()
 
 
+@app.get("/api/koth/state/since/{version}")
+async def koth_get_state_since(version: int):
+    return koth_backend.get_state_since(version)
+
+
+@app.get("/api/koth/events/after/{seq}")
+async def koth_events_after(seq: int):
+    """Events newer than `seq`; pass the last seq you got back next time."""
+    em = koth_backend.event_manager
+    return {
+        "last_seq": em.last_seq(),
+        "events": [{"seq": ev.seq, "text": ev.to_display()} for ev in em.get_events_after(seq)],
+    }
+
+
 @app.post("/api/koth/start")
 async def koth_start():
     koth_backend.start_game()
+    tick_scheduler.wake('koth')
     return {"status": "started"}
 
 
 @app.post("/api/koth/stop")
 async def koth_stop():
     koth_backend.stop_game()
+    tick_scheduler.wake('koth')
     return {"status": "stopped"}
 
 
@@ -160,8 +231,15 @@ async def koth_configure(options: dict):
         ),
         time_limit_seconds=options.get('time_limit_seconds', 60),
         start_delay_seconds=options.get('start_delay_seconds', 5),
+        presence_confirm_adverts=options.get('presence_confirm_adverts', 2),
+        presence_min_timeout_ms=options.get('presence_min_timeout_ms', 300),
+        presence_max_timeout_ms=options.get('presence_max_timeout_ms', 1000),
+        presence_rssi_alpha=options.get('presence_rssi_alpha', 0.3),
+        presence_interval_alpha=options.get('presence_interval_alpha', 0.2),
+        presence_min_rssi=options.get('presence_min_rssi', -128),
     )
     koth_backend.configure(go)
+    tick_scheduler.wake('koth')
     return {"status": "configured"}
 
 
@@ -197,6 +275,12 @@ async def koth_load_settings():
         "capture_button_threshold_seconds": options.capture_button_threshold_seconds,
         "time_limit_seconds": options.time_limit_seconds,
         "start_delay_seconds": options.start_delay_seconds,
+        "presence_confirm_adverts": options.presence_confirm_adverts,
+        "presence_min_timeout_ms": options.presence_min_timeout_ms,
+        "presence_max_timeout_ms": options.presence_max_timeout_ms,
+        "presence_rssi_alpha": options.presence_rssi_alpha,
+        "presence_interval_alpha": options.presence_interval_alpha,
+        "presence_min_rssi": options.presence_min_rssi,
         "volume": volume,
     }
 
@@ -206,6 +290,7 @@ async def koth_load_settings():
 async def koth_set_manual(enabled: bool):
     print(f"[DEBUG] /api/koth/manual/mode called with enabled={enabled}")
     koth_backend.set_manual_control(enabled)
+    tick_scheduler.wake('koth')
     state = koth_backend.get_manual_state()
     print(f"[DEBUG] KOTH manual state after set_manual_control: {state}")
     return state
@@ -214,12 +299,14 @@ async def koth_set_manual(enabled: bool):
 @app.post("/api/koth/manual/red/{on}")
 async def koth_manual_red(on: bool):
     koth_backend.set_manual_state(red=on)
+    tick_scheduler.wake('koth')
     return koth_backend.get_manual_state()
 
 
 @app.post("/api/koth/manual/blu/{on}")
 async def koth_manual_blu(on: bool):
     koth_backend.set_manual_state(blu=on)
+    tick_scheduler.wake('koth')
     return koth_backend.get_manual_state()
 
 
@@ -232,15 +319,32 @@ async def threecp_get_state():
     return threecp_backend.get_state()
 
 
+@app.get("/api/3cp/state/since/{version}")
+async def threecp_get_state_since(version: int):
+    return threecp_backend.get_state_since(version)
+
+
+@app.get("/api/3cp/events/after/{seq}")
+async def threecp_events_after(seq: int):
+    """Events newer than `seq`; pass the last seq you got back next time."""
+    em = threecp_backend.event_manager
+    return {
+        "last_seq": em.last_seq(),
+        "events": [{"seq": ev.seq, "text": ev.to_display()} for ev in em.get_events_after(seq)],
+    }
+
+
 @app.post("/api/3cp/start")
 async def threecp_start():
     threecp_backend.start_game()
+    tick_scheduler.wake('3cp')
     return {"status": "started"}
 
 
 @app.post("/api/3cp/stop")
 async def threecp_stop():
     threecp_backend.stop_game()
+    tick_scheduler.wake('3cp')
     return {"status": "stopped"}
 
 
@@ -248,6 +352,7 @@ async def threecp_stop():
 async def threecp_configure(options: dict):
     opts = ThreeCPOptions.from_dict(options)
     threecp_backend.configure(opts)
+    tick_scheduler.wake('3cp')
     return {"status": "configured"}
 
 
@@ -255,6 +360,7 @@ async def threecp_configure(options: dict):
 async def threecp_save_settings(options: dict):
     opts = ThreeCPOptions.from_dict(options)
     threecp_backend.configure(opts)
+    tick_scheduler.wake('3cp')
     success = settings_manager.save_3cp_settings(opts, volume=10)
     return {"status": "saved" if success else "error"}
 
@@ -286,6 +392,7 @@ async def threecp_manual_state():
 async def threecp_set_manual(enabled: bool):
     print(f"[DEBUG] /api/3cp/manual/mode called with enabled={enabled}")
     threecp_backend.set_manual_control(enabled)
+    tick_scheduler.wake('3cp')
     state = threecp_backend.get_manual_state()
     print(f"[DEBUG] 3CP manual state after set_manual_control: {state}")
     return state
@@ -296,6 +403,7 @@ async def threecp_manual_set(cp_index: int, team: str, on: bool):
     """Set manual state for a CP/team explicitly (no server-side toggling)."""
     if 0 <= cp_index < 3 and team in ['red', 'blu']:
         threecp_backend.set_manual_state(cp_index, **{team: on})
+        tick_scheduler.wake('3cp')
     return threecp_backend.get_manual_state()
 
 
@@ -309,15 +417,32 @@ async def ad_get_state():
     return ad_backend.get_state()
 
 
+@app.get("/api/ad/state/since/{version}")
+async def ad_get_state_since(version: int):
+    return ad_backend.get_state_since(version)
+
+
+@app.get("/api/ad/events/after/{seq}")
+async def ad_events_after(seq: int):
+    """Events newer than `seq`; pass the last seq you got back next time."""
+    em = ad_backend.event_manager
+    return {
+        "last_seq": em.last_seq(),
+        "events": [{"seq": ev.seq, "text": ev.to_display()} for ev in em.get_events_after(seq)],
+    }
+
+
 @app.post("/api/ad/start")
 async def ad_start():
     ad_backend.start_game()
+    tick_scheduler.wake('ad')
     return {"status": "started"}
 
 
 @app.post("/api/ad/stop")
 async def ad_stop():
     ad_backend.stop_game()
+    tick_scheduler.wake('ad')
     return {"status": "stopped"}
 
 
@@ -326,6 +451,7 @@ async def ad_configure(options: dict):
     # Reuse ThreeCPOptions structure for AD
     opts = ThreeCPOptions.from_dict(options)
     ad_backend.configure(opts)
+    tick_scheduler.wake('ad')
     return {"status": "configured"}
 
 
@@ -334,6 +460,7 @@ async def ad_save_settings(options: dict):
     # Configure from incoming options and then let AD backend persist if it supports it
     o = ThreeCPOptions.from_dict(options)
     ad_backend.configure(o)
+    tick_scheduler.wake('ad')
 
     success = settings_manager.save_ad_settings(o)
     return {"status": "saved" if success else "error"}
@@ -365,6 +492,7 @@ async def ad_manual_state():
 async def ad_set_manual(enabled: bool):
     print(f"[DEBUG] /api/ad/manual/mode called with enabled={enabled}")
     ad_backend.set_manual_control(enabled)
+    tick_scheduler.wake('ad')
     state = ad_backend.get_manual_state()
     print(f"[DEBUG] AD manual state after set_manual_control: {state}")
     return state
@@ -374,6 +502,7 @@ async def ad_set_manual(enabled: bool):
 async def ad_manual_set(cp_index: int, team: str, on: bool):
     if 0 <= cp_index < 3 and team in ['red', 'blu']:
         ad_backend.set_manual_state(cp_index, **{team: on})
+        tick_scheduler.wake('ad')
     return ad_backend.get_manual_state()
 
 
@@ -392,36 +521,264 @@ async def clock_get_state():
 async def clock_configure(options: dict):
     total = int(options.get('time_limit_seconds', 60) or 60)
     clock_backend.configure(total)
+    tick_scheduler.wake('clock')
     return {"status": "configured"}
 
 
 @app.post("/api/clock/start")
 async def clock_start():
     clock_backend.start_game()
+    tick_scheduler.wake('clock')
     return {"status": "started"}
 
 
 @app.post("/api/clock/stop")
 async def clock_stop():
     clock_backend.stop_game()
+    tick_scheduler.wake('clock')
     return {"status": "stopped"}
 
 
+# ========================================================================
+# API ENDPOINTS - ARENAS (several fields on one base station, see arenas.py)
+# ========================================================================
+
+def _arena_or_error(arena_id: str):
+    arena = arena_registry.get(arena_id)
+    if arena is None:
+        return None, {"status": "error", "reason": f"unknown arena {arena_id}"}
+    return arena, None
+
+
+@app.get("/api/arenas")
+async def arenas_list():
+    return {"arenas": arena_registry.get_summary()}
+
+
+@app.post("/api/arenas")
+async def arenas_add(config: dict):
+    """Add an arena: {"arena_id", "name", "mode": koth|3cp|ad, "mapping", "local_sound", "options"}."""
+    try:
+        arena = arena_registry.add(ArenaConfig.from_dict(config))
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    return {"status": "added", "arena": arena.get_summary()}
+
+
+@app.delete("/api/arena/{arena_id}")
+async def arena_remove(arena_id: str):
+    removed = await arena_registry.remove(arena_id)
+    return {"status": "removed" if removed else "not_found"}
+
+
+@app.get("/api/arena/{arena_id}/state")
+async def arena_get_state(arena_id: str):
+    arena, err = _arena_or_error(arena_id)
+    return err or arena.backend.get_state()
+
+
+@app.get("/api/arena/{arena_id}/state/since/{version}")
+async def arena_get_state_since(arena_id: str, version: int):
+    arena, err = _arena_or_error(arena_id)
+    return err or arena.backend.get_state_since(version)
+
+
+@app.get("/api/arena/{arena_id}/events/after/{seq}")
+async def arena_events_after(arena_id: str, seq: int):
+    """Events newer than `seq`; pass the last seq you got back next time."""
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    em = arena.event_manager
+    return {
+        "last_seq": em.last_seq(),
+        "events": [{"seq": ev.seq, "text": ev.to_display()} for ev in em.get_events_after(seq)],
+    }
+
+
+@app.post("/api/arena/{arena_id}/start")
+async def arena_start(arena_id: str):
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    arena.backend.start_game()
+    tick_scheduler.wake(arena.topic)
+    return {"status": "started"}
+
+
+@app.post("/api/arena/{arena_id}/stop")
+async def arena_stop(arena_id: str):
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    arena.backend.stop_game()
+    tick_scheduler.wake(arena.topic)
+    return {"status": "stopped"}
+
+
+@app.post("/api/arena/{arena_id}/configure")
+async def arena_configure(arena_id: str, options: dict):
+    """Set and save this arena's mode options; its squares come from its mapping."""
+    if arena_registry.get(arena_id) is None:
+        return {"status": "error", "reason": f"unknown arena {arena_id}"}
+    try:
+        arena = arena_registry.configure(arena_id, options)
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    tick_scheduler.wake(arena.topic)
+    return {"status": "configured"}
+
+
+@app.get("/api/arena/{arena_id}/settings/load")
+async def arena_load_settings(arena_id: str):
+    arena, err = _arena_or_error(arena_id)
+    return err or arena.get_options()
+
+
+@app.post("/api/arena/{arena_id}/mapping")
+async def arena_set_mapping(arena_id: str, mapping: dict):
+    if arena_registry.get(arena_id) is None:
+        return {"status": "error", "reason": f"unknown arena {arena_id}"}
+    try:
+        arena = arena_registry.set_mapping(arena_id, ControlSquareMapping.from_dict(mapping))
+    except ValueError as e:
+        return {"status": "error", "reason": str(e)}
+    tick_scheduler.wake(arena.topic)
+    return {"status": "configured", "arena": arena.get_summary()}
+
+
+@app.get("/api/arena/{arena_id}/manual/state")
+async def arena_manual_state(arena_id: str):
+    arena, err = _arena_or_error(arena_id)
+    return err or arena.backend.get_manual_state()
+
+
+@app.post("/api/arena/{arena_id}/manual/mode/{enabled}")
+async def arena_set_manual(arena_id: str, enabled: bool):
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    arena.backend.set_manual_control(enabled)
+    tick_scheduler.wake(arena.topic)
+    return arena.backend.get_manual_state()
+
+
+@app.post("/api/arena/{arena_id}/manual/red/{on}")
+async def arena_manual_red(arena_id: str, on: bool):
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    if arena.mode != 'koth':
+        return {"status": "error", "reason": "use /manual/{cp_index}/red/{on} for multi-point arenas"}
+    arena.backend.set_manual_state(red=on)
+    tick_scheduler.wake(arena.topic)
+    return arena.backend.get_manual_state()
+
+
+@app.post("/api/arena/{arena_id}/manual/blu/{on}")
+async def arena_manual_blu(arena_id: str, on: bool):
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    if arena.mode != 'koth':
+        return {"status": "error", "reason": "use /manual/{cp_index}/blu/{on} for multi-point arenas"}
+    arena.backend.set_manual_state(blu=on)
+    tick_scheduler.wake(arena.topic)
+    return arena.backend.get_manual_state()
+
+
+@app.post("/api/arena/{arena_id}/manual/{cp_index}/{team}/{on}")
+async def arena_manual_set(arena_id: str, cp_index: int, team: str, on: bool):
+    arena, err = _arena_or_error(arena_id)
+    if err:
+        return err
+    if arena.mode == 'koth':
+        return {"status": "error", "reason": "use /manual/red|blu/{on} for KOTH arenas"}
+    if 0 <= cp_index < 3 and team in ['red', 'blu']:
+        arena.backend.set_manual_state(cp_index, **{team: on})
+        tick_scheduler.wake(arena.topic)
+    return arena.backend.get_manual_state()
+
+
 # ========================================================================
 # GAME LOOPS
 # ========================================================================
-def start_backend_loop(backend, interval: float = 0.1):
-    async def loop():
-        while True:
-            backend.update()
-            await asyncio.sleep(interval)
-    asyncio.create_task(loop())
+GET_STATE_SECONDS = REGISTRY.histogram(
+    "bp_get_state_seconds", "backend.get_state() time when publishing a tick", ("backend",)
+)
+
+
+def state_publisher(backend, topic: str):
+    # shared with get_state_since(), so HTTP pollers and pages reuse one build
+    versions = getattr(backend, "state_versions", None) or VersionedState()
+    state_key = getattr(backend, "state_key", None)
+    timing = GET_STATE_SECONDS.labels(topic)
+    published = 0
+
+    def publish():
+        # one snapshot per tick, shared by every page showing this mode;
+        # get_state() is only rebuilt when the backend's state_key() moved,
+        # and identical snapshots are not re-published, so pages don't re-render
+        nonlocal published
+        if not state_bus.has_subscribers(topic):
+            return
+        key = state_key() if state_key is not None else None
+        if versions.stale(key):
+            started = time.perf_counter()
+            state = backend.get_state()
+            timing.observe(time.perf_counter() - started)
+            versions.refresh(state, key)
+        if versions.version != published:
+            published = versions.version
+            state_bus.publish(topic, versions.state)
+    return publish
+
+
+tick_scheduler = TickScheduler()
+for _topic, _backend in (
+    ('koth', koth_backend),
+    ('3cp', threecp_backend),
+    ('ad', ad_backend),
+    ('clock', clock_backend),
+):
+    tick_scheduler.register(_topic, _backend, state_publisher(_backend, _topic))
+arena_registry.attach(tick_scheduler, state_publisher)
+
 
 async def start_game_loops():
-    start_backend_loop(koth_backend)
-    start_backend_loop(threecp_backend)
-    start_backend_loop(ad_backend)
-    start_backend_loop(clock_backend)
+    tick_scheduler.start()
+
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    return tick_scheduler.get_stats()
+
+
+def client_metrics():
+    """Connected NiceGUI pages, plus registered and sound-enabled pages per browser sound bus."""
+    connected = Gauge("bp_clients_connected", "NiceGUI clients with an open websocket")
+    connected.set(sum(1 for c in list(Client.instances.values()) if c.has_socket_connection))
+    registered = Gauge("bp_sound_bus_clients", "Clients registered on a browser sound bus", ("bus",))
+    enabled = Gauge("bp_sound_clients_enabled", "Clients with browser sound enabled", ("bus",))
+    buses = [("main", browser_sound_bus)] + [
+        (arena.topic, arena.browser_bus)
+        for arena in arena_registry.arenas.values()
+        if arena.browser_bus is not None
+    ]
+    for name, bus in buses:
+        registered.labels(name).set(len(bus.clients))
+        enabled.labels(name).set(len(bus.enabled))
+    return [connected, registered, enabled]
+
+
+REGISTRY.add_collector(client_metrics)
+REGISTRY.add_collector(shared_scanner.collect_metrics)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text format: tick times, get_state, BLE adverts/gaps, clients, sound latency."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 app.on_startup(start_game_loops)
@@ -1,5 +1,8 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from collections import deque
+from itertools import islice
+from typing import Optional
 import time
 
 
@@ -94,6 +97,13 @@ class GameOptions:
     capture_button_threshold_seconds: int = 5
     time_limit_seconds: int = 60
     start_delay_seconds: int = 5
+    # BLE presence filter, see ble_scanner.PresenceSettings
+    presence_confirm_adverts: int = 2
+    presence_min_timeout_ms: int = 300
+    presence_max_timeout_ms: int = 1000
+    presence_rssi_alpha: float = 0.3
+    presence_interval_alpha: float = 0.2
+    presence_min_rssi: int = -128  # RSSI floor; -128 = none
 
     def time_limit_millis(self) -> int:
         return self.time_limit_seconds * 1000
@@ -103,6 +113,12 @@ class GameOptions:
             self.capture_seconds = self.time_limit_seconds - 1
         if self.capture_button_threshold_seconds >= self.capture_seconds:
             self.capture_button_threshold_seconds = self.capture_seconds - 1
+        if self.presence_confirm_adverts < 1:
+            self.presence_confirm_adverts = 1
+        if self.presence_min_timeout_ms > self.presence_max_timeout_ms:
+            self.presence_min_timeout_ms = self.presence_max_timeout_ms
+        self.presence_rssi_alpha = min(1.0, max(0.01, self.presence_rssi_alpha))
+        self.presence_interval_alpha = min(1.0, max(0.01, self.presence_interval_alpha))
 
 
 class Clock:
@@ -123,6 +139,9 @@ from enum import Enum
 import re
 
 MAX_PLAYERS_PER_TEAM = 3  # clamp
+# a read this long after the last sighting (or the threshold, if longer)
+# ends the visit, even with a zero button threshold
+PRESENCE_RUN_GAP_MS = 1000
 
 class Proximity:
     """
@@ -142,6 +161,10 @@ class Proximity:
 
         self._last_red_seen_ms = -1
         self._last_blu_seen_ms = -1
+        # first sighting of the current visit; -1 once a read saw it lapse.
+        # A stall with no reads doesn't end a visit: nobody saw the team go.
+        self._red_since_ms = -1
+        self._blu_since_ms = -1
 
         self._observed_red_count = 0   # last observed (without decay)
         self._observed_blu_count = 0
@@ -154,8 +177,12 @@ class Proximity:
         blu_count = max(0, min(MAX_PLAYERS_PER_TEAM, int(blu_count)))
 
         if red_count > 0:
+            if self._red_since_ms < 0 or self._observed_red_count == 0:
+                self._red_since_ms = now
             self._last_red_seen_ms = now
         if blu_count > 0:
+            if self._blu_since_ms < 0 or self._observed_blu_count == 0:
+                self._blu_since_ms = now
             self._last_blu_seen_ms = now
 
         self._observed_red_count = red_count
@@ -190,17 +217,46 @@ class Proximity:
     def get_red_count(self) -> int:
         if self._last_red_seen_ms < 0:
             return 0
-        if (self.clock.milliseconds() - self._last_red_seen_ms) > self._threshold_ms():
+        age = self.clock.milliseconds() - self._last_red_seen_ms
+        if age > self._threshold_ms():
+            if age > PRESENCE_RUN_GAP_MS:
+                self._red_since_ms = -1
             return 0
         return self._observed_red_count
 
     def get_blu_count(self) -> int:
         if self._last_blu_seen_ms < 0:
             return 0
-        if (self.clock.milliseconds() - self._last_blu_seen_ms) > self._threshold_ms():
+        age = self.clock.milliseconds() - self._last_blu_seen_ms
+        if age > self._threshold_ms():
+            if age > PRESENCE_RUN_GAP_MS:
+                self._blu_since_ms = -1
             return 0
         return self._observed_blu_count
 
+    def present_since_ms(self, team: Team) -> Optional[int]:
+        """When `team` arrived, if it is on the point now; None if it isn't."""
+        if team == Team.RED and self.is_red_close():
+            return self._red_since_ms
+        if team == Team.BLU and self.is_blu_close():
+            return self._blu_since_ms
+        return None
+
+    def present_until_ms(self, team: Team) -> Optional[int]:
+        """
+        When `team`'s presence ends (or ended): its last sighting if the
+        latest count says it left, else last sighting plus the threshold.
+        """
+        if team == Team.RED:
+            seen, count = self._last_red_seen_ms, self._observed_red_count
+        elif team == Team.BLU:
+            seen, count = self._last_blu_seen_ms, self._observed_blu_count
+        else:
+            return None
+        if seen < 0:
+            return None
+        return seen + self._threshold_ms() if count > 0 else seen
+
     # ---- legacy bool API ----
     def is_red_close(self) -> bool:
         return self.get_red_count() > 0
@@ -279,6 +335,10 @@ class LedMeter:
             'reversed': self._reversed,
         }
 
+    def state_key(self) -> tuple:
+        """Everything to_dict() shows, as a cheap comparable tuple."""
+        return (self._value, self._max_value, self._fg_color, self._bg_color, self._reversed)
+
 
 
 class CooldownTimer:
@@ -298,17 +358,25 @@ class CooldownTimer:
         return not self.can_run()
 
 
+# events kept by EventManager; older ones fall off the front
+EVENT_LOG_SIZE = 200
+
+
 @dataclass
 class GameEvent:
     ts_ms: int     # absolute time in ms (from your Clock)
     text: str
+    seq: int = 0   # EventManager sequence number, increases forever
+    # "HH:MM:SS — message", rendered once when the event is created
+    display: str = field(default="", compare=False)
+
+    def __post_init__(self):
+        if not self.display:
+            lt = time.localtime(self.ts_ms / 1000.0)
+            self.display = f"{time.strftime('%H:%M:%S', lt)} — {self.text}"
 
     def to_display(self) -> str:
-        # render as "HH:MM:SS — message"
-        sec = self.ts_ms / 1000.0
-        lt = time.localtime(sec)
-        ts = time.strftime("%H:%M:%S", lt)
-        return f"{ts} — {self.text}"
+        return self.display
 
 class EventManager:
     def __init__(self, clock: Clock, sound_system=None):
@@ -320,8 +388,10 @@ class EventManager:
         self.end_time_timer = CooldownTimer(900, clock)
         self.cp_alert_interval_ms = 5000
 
-        # now this is a list of GameEvent, not plain str
-        self.events: list[GameEvent] = []
+        # ring of the last EVENT_LOG_SIZE GameEvents; seq keeps counting
+        # across clears so get_events_after() cursors stay valid
+        self.events: deque[GameEvent] = deque(maxlen=EVENT_LOG_SIZE)
+        self._next_seq = 1
 
         self.sound_system = sound_system
 
@@ -334,7 +404,8 @@ class EventManager:
         self.cp_alert_interval_ms = cp_alert_interval_seconds * 1000
 
     def _add_event(self, event: str):
-        ev = GameEvent(ts_ms=self.clock.milliseconds(), text=event)
+        ev = GameEvent(ts_ms=self.clock.milliseconds(), text=event, seq=self._next_seq)
+        self._next_seq += 1
         self.events.append(ev)
         print(f"[EVENT] {ev.to_display()}")
 
@@ -444,9 +515,28 @@ class EventManager:
 
     # ---- simple API from EventManager side ----
     def get_events(self, limit: int = 100) -> list[GameEvent]:
-        if limit <= 0:
-            return self.events[:]
-        return self.events[-limit:]
+        events = self.events
+        if limit <= 0 or limit >= len(events):
+            return list(events)
+        return list(islice(events, len(events) - limit, None))
+
+    def get_events_after(self, seq: int) -> list[GameEvent]:
+        """Events with a sequence number greater than `seq`, oldest first."""
+        events = self.events
+        if not events or seq >= events[-1].seq:
+            return []
+        # seqs are contiguous within the ring
+        start = max(0, seq - events[0].seq + 1)
+        return list(islice(events, start, None))
+
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+
+# longest gap ControlPoint.update() integrates in one go; anything longer is
+# a wall clock jump, not a stalled loop. Within it, only the time the teams
+# were actually on the point (Proximity.present_since/until_ms) is credited.
+MAX_STEP_MS = 10_000
 
 
 class ControlPoint:
@@ -463,6 +553,11 @@ class ControlPoint:
         self._enable_red_capture = True
         self._enable_blu_capture = True
         self._should_contest_message = True
+        # progress per ms while capturing (player count), from the last update
+        self._rate = 1
+        # exact time of the last ownership change and who owned it before
+        self._captured_at_ms: Optional[int] = None
+        self._previous_owner = Team.NOBODY
 
 
     def init(self, seconds_to_capture: int):
@@ -476,6 +571,13 @@ class ControlPoint:
         self._enable_red_capture = True
         self._enable_blu_capture = True
         self._should_contest_message = True
+        self._rate = 1
+        self._captured_at_ms = None
+        self._previous_owner = Team.NOBODY
+
+    def restart_clock(self):
+        """Don't integrate the time since the last update (e.g. a start countdown)."""
+        self._last_update_time = self.clock.milliseconds()
 
     def set_red_capture(self, enabled: bool):
         self._enable_red_capture = enabled
@@ -509,7 +611,9 @@ class ControlPoint:
     def set_owner(self, team: Team):
         self._owner = team
 
-
+    def state_key(self) -> tuple:
+        """Owner, capture and progress as a cheap comparable tuple, for backend state_key()."""
+        return (self._owner, self._on, self._capturing, self._contested, self.get_capture_progress_percent())
 
     def update(self, proximity: Proximity):
         red_on = proximity.is_red_close()
@@ -548,14 +652,15 @@ class ControlPoint:
                     self._capturing = self._on
                     self.event_manager.control_point_being_captured(self._capturing)
 
-        millis_since_last = self.clock.milliseconds() - self._last_update_time
+        now = self.clock.milliseconds()
+        millis_since_last = now - self._last_update_time
         if millis_since_last < 0:
             millis_since_last = 0
 
-        APPLY_DT_MAX_MS = 1000
-        dt = min(millis_since_last, APPLY_DT_MAX_MS)
-        if dt > APPLY_DT_MAX_MS:
-            dt = APPLY_DT_MAX_MS
+        # integrate the whole gap, so a stalled loop doesn't lose capture
+        # time; only a wall clock jump (NTP on boot) is clamped
+        dt = min(millis_since_last, MAX_STEP_MS)
+        start = now - dt
 
         capture_ms = self._seconds_to_capture * 1000
 
@@ -565,10 +670,23 @@ class ControlPoint:
 
         if is_one_team_on:
             if self._capturing == self._on:
+                # a team that arrived part way through the gap (e.g. during a
+                # stalled loop) is credited from its first sighting only
+                since = proximity.present_since_ms(self._on)
+                if since is not None and since > start:
+                    start = since
+                    dt = now - since
                 if self._on == Team.RED:
-                    self._inc_capture(dt * max(1, red_count))
+                    self._rate = max(1, red_count)
+                else:
+                    self._rate = max(1, blu_count)
+                # capture completes part way through dt: stamp the exact time
+                needed_ms = -(-(capture_ms - self._value) // self._rate)
+                if needed_ms <= dt:
+                    self._value = capture_ms
+                    self._check_capture(start + needed_ms)
                 else:
-                    self._inc_capture(dt * max(1, blu_count))
+                    self._inc_capture(dt * self._rate)
             else:
                 # reverse/decay is not amplified; we count normal time
                 self._dec_capture(dt)
@@ -579,19 +697,40 @@ class ControlPoint:
                 and prev_on == prev_capturing
                 and prev_value > 0
             ):
+                # the capturers count until their presence lapsed, not until now
+                until = proximity.present_until_ms(prev_capturing)
+                credited = dt if until is None else max(0, min(now, until) - start)
                 remaining = capture_ms - prev_value
-                if remaining <= dt:
-                    self._owner = prev_capturing
-                    self._capturing = Team.NOBODY
-                    self._value = 0
-                    self.event_manager.control_point_captured(self._owner)
+                if remaining <= credited:
+                    self._value = capture_ms
+                    self._capturing = prev_capturing
+                    self._check_capture(start + remaining)
                 else:
                     self._dec_capture(dt)
             else:
                 self._dec_capture(dt)
 
-        self._check_capture()
-        self._last_update_time = self.clock.milliseconds()
+        self._check_capture(now)
+        self._last_update_time = now
+
+    def next_event_ms(self) -> Optional[int]:
+        """
+        Clock time at which this point changes state on its own if nobody
+        moves: a capture completing, or decaying progress reaching zero.
+        None when nothing is pending.
+        """
+        if self._contested or (self._value <= 0 and self._capturing == Team.NOBODY):
+            return None
+        capture_ms = self._seconds_to_capture * 1000
+        if self._capturing != Team.NOBODY and self._on == self._capturing:
+            return self._last_update_time + -(-(capture_ms - self._value) // self._rate)
+        if self._value > 0:
+            return self._last_update_time + self._value
+        return None
+
+    def get_last_capture(self) -> tuple[Optional[int], Team]:
+        """(exact time of the last ownership change, owner before it)."""
+        return self._captured_at_ms, self._previous_owner
 
     def _inc_capture(self, millis: int):
         self._value += millis
@@ -607,9 +746,11 @@ class ControlPoint:
 
     # _check_capture, get_* remain the same
 
-    def _check_capture(self):
+    def _check_capture(self, at_ms: Optional[int] = None):
         #print(f"Check Capture: Needed {self._value}/{self._seconds_to_capture*1000}")
         if self._value >= self._seconds_to_capture * 1000:
+            self._previous_owner = self._owner
+            self._captured_at_ms = self.clock.milliseconds() if at_ms is None else at_ms
             self._owner = self._capturing
             self._capturing = Team.NOBODY
             self._value = 0
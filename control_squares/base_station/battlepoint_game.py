@@ -1,17 +1,18 @@
 from battlepoint_core import GameOptions, EventManager, Clock, LedMeter, Proximity,Team, ControlPoint,TeamColor, GameMode,get_team_color
 # battlepoint_game.py
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 import asyncio
 import os
-import json
 import re
 import random
 import pygame
 import aiohttp
 import sys
 import threading
+import time
 import traceback
+from collections import OrderedDict, deque
 from nicegui import ui, app
 from battlepoint_core import (
     Team,
@@ -27,6 +28,9 @@ from battlepoint_core import (
     team_text
 )
 from ble_scanner import EnhancedBLEScanner
+from state_bus import VersionedState
+from metrics import REGISTRY
+from settings import UnifiedSettingsManager
 
 class BaseGame:
     NOT_STARTED = -100
@@ -168,18 +172,39 @@ class BaseGame:
     # ------------------------------------------------------------------
     def _update_accumulated_time(self):
         now = self.clock.milliseconds()
-        delta = now - self._last_update_ms
+        last = self._last_update_ms
+        delta = now - last
         if delta < 0:
             delta = 0
 
         owner = self.control_point.get_owner()
-        if owner == Team.RED:
-            self._red_accum_ms += delta
-        elif owner == Team.BLU:
-            self._blu_accum_ms += delta
+        # a capture part way through the interval splits it at the exact capture time
+        get_last_capture = getattr(self.control_point, "get_last_capture", None)
+        captured_at, before = get_last_capture() if get_last_capture else (None, Team.NOBODY)
+        if captured_at is not None and last < captured_at <= now:
+            self._credit(before, captured_at - last)
+            self._credit(owner, now - captured_at)
+        else:
+            self._credit(owner, delta)
 
         self._last_update_ms = now
 
+    def _credit(self, team: Team, millis: int):
+        if team == Team.RED:
+            self._red_accum_ms += millis
+        elif team == Team.BLU:
+            self._blu_accum_ms += millis
+
+    def next_event_ms(self) -> Optional[int]:
+        """
+        Clock time at which a timer runs out (and victory/overtime may
+        trigger) if ownership doesn't change, so the loop can wake exactly
+        then instead of finding out on a later tick. None if no timer runs.
+        """
+        if not self.is_running() or self._winner != Team.NOBODY:
+            return None
+        return self._start_time_ms + self.options.time_limit_seconds * 1000
+
     def _end_game_with_winner(self, team: Team):
         self._winner = team
         self._start_time_ms = self.NOT_STARTED
@@ -278,6 +303,20 @@ class KothGame(BaseGame):
 
         return Team.NOBODY
 
+    def next_event_ms(self) -> Optional[int]:
+        # the owner's clock running out
+        if not self.is_running() or self._winner != Team.NOBODY:
+            return None
+        owner = self.control_point.get_owner()
+        if owner == Team.RED:
+            accum = self._red_accum_ms
+        elif owner == Team.BLU:
+            accum = self._blu_accum_ms
+        else:
+            return None
+        left = self.options.time_limit_seconds * 1000 - accum
+        return self._last_update_ms + left if left > 0 else None
+
     def check_overtime(self) -> bool:
         """
         Overtime when:
@@ -327,47 +366,17 @@ def create_game(mode: GameMode) -> BaseGame:
 # ========================================================================
 
 class SettingsManager:
+    """KOTH settings file, backed by the shared cached SettingsStore."""
+
     def __init__(self, filename: str = "battlepoint_settings.json"):
         self.filename = filename
+        self._settings = UnifiedSettingsManager(koth_file=filename)
 
     def save_settings(self, options: GameOptions, volume: int = 10, brightness: int = 50) -> bool:
-        try:
-            data = {
-                'mode': options.mode.value,
-                'capture_seconds': options.capture_seconds,
-                'capture_button_threshold_seconds': options.capture_button_threshold_seconds,
-                'time_limit_seconds': options.time_limit_seconds,
-                'start_delay_seconds': options.start_delay_seconds,
-                'volume': volume,
-                'brightness': brightness,
-            }
-            with open(self.filename, 'w') as f:
-                json.dump(data, f, indent=2)
-            return True
-        except Exception as e:
-            print(f"Error saving settings: {e}")
-            return False
+        return self._settings.save_koth_settings(options, volume, brightness)
 
     def load_settings(self) -> Optional[tuple[GameOptions, int, int]]:
-        if not os.path.exists(self.filename):
-            return None
-        try:
-            with open(self.filename, 'r') as f:
-                data = json.load(f)
-
-            options = GameOptions(
-                mode=GameMode(data.get('mode', 0)),
-                capture_seconds=data.get('capture_seconds', 20),
-                capture_button_threshold_seconds=data.get('capture_button_threshold_seconds', 5),
-                time_limit_seconds=data.get('time_limit_seconds', 60),
-                start_delay_seconds=data.get('start_delay_seconds', 5),
-            )
-            volume = data.get('volume', 10)
-            brightness = data.get('brightness', 50)
-            return options, volume, brightness
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-            return None
+        return self._settings.load_koth_settings()
 
 
 # ========================================================================
@@ -427,6 +436,337 @@ SOUND_MAP = {
     49: "announcer_time_added.mp3",
 }
 
+# upper bound on decoded PCM kept in SoundCache (the whole announcer set
+# is roughly 20 MB decoded at 44.1 kHz stereo)
+SOUND_CACHE_MAX_BYTES = 48 * 1024 * 1024
+
+
+class SoundCache:
+    """
+    LRU of decoded sounds keyed by sound id, capped by decoded size.
+
+    `loader(sound_id)` returns (sound, nbytes) or None; a failed load is
+    not cached so a file that shows up later still gets picked up.
+    """
+
+    def __init__(self, loader, max_bytes: int = SOUND_CACHE_MAX_BYTES):
+        self._loader = loader
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sound_id: int):
+        item = self._items.get(sound_id)
+        if item is not None:
+            self._items.move_to_end(sound_id)
+            self.hits += 1
+            return item[0]
+
+        self.misses += 1
+        loaded = self._loader(sound_id)
+        if loaded is None:
+            return None
+        sound, nbytes = loaded
+        self._items[sound_id] = (sound, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, old_bytes) = self._items.popitem(last=False)
+            self.bytes -= old_bytes
+        return sound
+
+    def warm(self, sound_ids) -> int:
+        """Load `sound_ids` in order until the cache is full; returns how many are cached."""
+        for sound_id in sound_ids:
+            if self.get(sound_id) is None:
+                continue
+            if self.bytes >= self.max_bytes:
+                break
+        return len(self._items)
+
+    def __contains__(self, sound_id: int) -> bool:
+        return sound_id in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# ---- mixer routing --------------------------------------------------------
+# menu tracks stream on mixer.music; everything else is a cached Sound on
+# either the VO channel (announcer) or the SFX channel (capture/contested cues)
+MENU_TRACKS = list(range(18, 26))
+SFX_SOUNDS = {1, 2, 3, 7, 14, 17}
+COUNTDOWN_SOUNDS = set(range(26, 49))
+
+# VO priority: higher preempts lower; equal or lower waits in the queue.
+# Countdown calls are lowest and a newer one always replaces an older one.
+VO_PRIORITY_COUNTDOWN = 1
+VO_PRIORITY_NORMAL = 2
+VO_PRIORITY_HIGH = 3
+VO_HIGH_PRIORITY_SOUNDS = {5, 6, 10, 11, 12}
+
+VO_QUEUE_SIZE = 4
+# a queued countdown call older than this is no longer true, drop it
+VO_STALE_S = 1.5
+# music volume factor while the announcer is talking
+MUSIC_DUCK = 0.3
+
+# trigger (play() on the game loop) to hand-off: the pygame channel for
+# "local", run_javascript for "browser" (sound_bus); "vo_queue" is the
+# extra wait of an announcement queued behind another one
+SOUND_LATENCY = REGISTRY.histogram(
+    "bp_sound_latency_seconds", "Sound trigger to play hand-off", ("output",)
+)
+_LOCAL_LATENCY = SOUND_LATENCY.labels("local")
+_VO_QUEUE_LATENCY = SOUND_LATENCY.labels("vo_queue")
+
+
+def sound_category(sound_id: int) -> str:
+    if sound_id in MENU_TRACKS:
+        return "music"
+    if sound_id in SFX_SOUNDS:
+        return "sfx"
+    return "vo"
+
+
+def vo_priority(sound_id: int) -> int:
+    if sound_id in COUNTDOWN_SOUNDS:
+        return VO_PRIORITY_COUNTDOWN
+    if sound_id in VO_HIGH_PRIORITY_SOUNDS:
+        return VO_PRIORITY_HIGH
+    return VO_PRIORITY_NORMAL
+
+
+def build_sound_manifest(base_dir: str = "sounds", base_url: str = "/sounds") -> dict:
+    """
+    Browser-side sound table built from SOUND_MAP at startup.
+
+    Each url carries a size/mtime token so it can be cached forever by the
+    browser and still change when the file does. Non-music sounds are
+    marked for preloading into Web Audio buffers; menu tracks stream.
+    """
+    sounds = {}
+    for sound_id, filename in SOUND_MAP.items():
+        path = os.path.join(base_dir, filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        token = f"{st.st_size:x}{int(st.st_mtime):x}"
+        sounds[str(sound_id)] = {
+            "url": f"{base_url}/{filename}?v={token}",
+            "preload": sound_id not in MENU_TRACKS,
+            "bytes": st.st_size,
+        }
+    return {"base": base_url, "sounds": sounds}
+
+
+class AudioMixer:
+    """
+    Routing, priority and ducking for cached sounds over pygame channels.
+
+    `vo` and `sfx` are mixer Channels, `music` is pygame.mixer.music (only
+    get_busy/set_volume are used), `load(sound_id)` returns a Sound or None.
+    Nothing here waits on audio: busy VO is queued and started by pump().
+    """
+
+    def __init__(self, vo, sfx, music, load, time_fn=time.monotonic):
+        self.vo = vo
+        self.sfx = sfx
+        self.music = music
+        self._load = load
+        self._time = time_fn
+        self.volume = 1.0
+        # (priority, sound_id, queued_at)
+        self.vo_queue: list = []
+        self._vo_priority = 0
+        self._music_volume: Optional[float] = None
+        self.dropped = 0
+
+    def set_volume(self, volume: float):
+        self.volume = volume
+        self.vo.set_volume(volume)
+        self.sfx.set_volume(volume)
+        self._music_volume = None
+        self._duck()
+
+    def play(self, sound_id: int) -> bool:
+        """Route a non-music sound; False if it could not be loaded."""
+        sound = self._load(sound_id)
+        if sound is None:
+            return False
+
+        if sound_category(sound_id) == "sfx":
+            self.sfx.play(sound)
+            return True
+
+        prio = vo_priority(sound_id)
+        if not self.vo.get_busy():
+            self._start_vo(sound, prio)
+        elif prio > self._vo_priority or (
+            prio == VO_PRIORITY_COUNTDOWN and self._vo_priority == VO_PRIORITY_COUNTDOWN
+        ):
+            self._start_vo(sound, prio)
+        else:
+            self._enqueue(sound_id, prio)
+        return True
+
+    def _start_vo(self, sound, prio: int):
+        self.vo.play(sound)
+        self._vo_priority = prio
+        self._duck()
+
+    def _enqueue(self, sound_id: int, prio: int):
+        q = self.vo_queue
+        if prio == VO_PRIORITY_COUNTDOWN:
+            # only the latest countdown call is worth saying
+            kept = [e for e in q if e[0] != VO_PRIORITY_COUNTDOWN]
+            self.dropped += len(q) - len(kept)
+            q[:] = kept
+        if len(q) >= VO_QUEUE_SIZE:
+            # drop the oldest of the least important
+            victim = min(range(len(q)), key=lambda i: (q[i][0], q[i][2]))
+            if q[victim][0] > prio:
+                self.dropped += 1
+                return
+            del q[victim]
+            self.dropped += 1
+        q.append((prio, sound_id, self._time()))
+
+    def pump(self):
+        """Start the next queued VO once the channel is free; keep music ducked while VO plays."""
+        if not self.vo.get_busy():
+            self._vo_priority = 0
+            now = self._time()
+            while self.vo_queue:
+                # highest priority first, FIFO within a priority
+                i = max(range(len(self.vo_queue)), key=lambda j: (self.vo_queue[j][0], -self.vo_queue[j][2]))
+                prio, sound_id, queued_at = self.vo_queue.pop(i)
+                if prio == VO_PRIORITY_COUNTDOWN and now - queued_at > VO_STALE_S:
+                    self.dropped += 1
+                    continue
+                sound = self._load(sound_id)
+                if sound is not None:
+                    self._start_vo(sound, prio)
+                    _VO_QUEUE_LATENCY.observe(max(0.0, now - queued_at))
+                    break
+        self._duck()
+
+    def _duck(self):
+        target = self.volume * (MUSIC_DUCK if self.vo.get_busy() else 1.0)
+        if target != self._music_volume:
+            self.music.set_volume(target)
+            self._music_volume = target
+
+    def stop(self):
+        self.vo_queue.clear()
+        self.vo.stop()
+        self.sfx.stop()
+        self._vo_priority = 0
+
+
+# pending audio commands before the oldest is dropped
+AUDIO_QUEUE_SIZE = 32
+# how often the audio worker pumps the mixer when no command arrives
+AUDIO_PUMP_S = 0.05
+# commands whose queue-to-run time is reported as local sound latency
+_PLAY_COMMANDS = ("play", "queue", "loop")
+
+
+class AudioWorker:
+    """
+    Runs sound commands on a dedicated thread so callers (the game tick on
+    the asyncio loop) only append to a queue and never touch pygame or disk.
+
+    submit() never blocks: when AUDIO_QUEUE_SIZE commands are pending the
+    oldest one is dropped, preferring coalescible ones (countdown VO), and a
+    new coalescible command replaces any that are still pending.
+    """
+
+    def __init__(self, handle, pump=None, maxsize: int = AUDIO_QUEUE_SIZE):
+        self._handle = handle
+        self._pump = pump
+        self.maxsize = maxsize
+        # (command, arg, coalesce, submitted at)
+        self._cmds: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="audio-worker", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 1.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, command: str, arg=None, coalesce: bool = False):
+        with self._cond:
+            cmds = self._cmds
+            if coalesce and cmds:
+                kept = [c for c in cmds if not c[2]]
+                self.dropped += len(cmds) - len(kept)
+                cmds.clear()
+                cmds.extend(kept)
+            if len(cmds) >= self.maxsize:
+                for i, c in enumerate(cmds):
+                    if c[2]:
+                        del cmds[i]
+                        break
+                else:
+                    cmds.popleft()
+                self.dropped += 1
+            cmds.append((command, arg, coalesce, time.monotonic()))
+            self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            self._cmds.clear()
+
+    def pending(self) -> int:
+        return len(self._cmds)
+
+    def run_pending(self) -> int:
+        """Run everything queued so far on the calling thread; returns the count."""
+        done = 0
+        while True:
+            with self._cond:
+                if not self._cmds:
+                    return done
+                command, arg, _, submitted = self._cmds.popleft()
+            try:
+                self._handle(command, arg)
+                if command in _PLAY_COMMANDS:
+                    _LOCAL_LATENCY.observe(time.monotonic() - submitted)
+            except Exception as e:
+                print(f"[SOUND] ERROR in audio worker ({command} {arg}): {e}")
+            done += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._running and not self._cmds:
+                    self._cond.wait(AUDIO_PUMP_S)
+                if not self._running:
+                    return
+            self.run_pending()
+            if self._pump is not None:
+                try:
+                    self._pump()
+                except Exception as e:
+                    print(f"[SOUND] ERROR pumping mixer: {e}")
+
+
 class SoundSystem:
     def __init__(self, base_dir: str = "sounds"):
         self.enabled = True
@@ -444,7 +784,72 @@ class SoundSystem:
 
         self.sound_map = SOUND_MAP
 
-        self._menu_tracks = list(range(18, 26))
+        self._menu_tracks = MENU_TRACKS
+
+        # VO/SFX are pre-decoded Sounds on reserved channels (see AudioMixer);
+        # menu music streams through mixer.music
+        self.cache = SoundCache(self._decode)
+        self.mixer: Optional[AudioMixer] = None
+        if self.ok:
+            pygame.mixer.set_reserved(2)
+            self.mixer = AudioMixer(
+                pygame.mixer.Channel(0),
+                pygame.mixer.Channel(1),
+                pygame.mixer.music,
+                self.cache.get,
+            )
+            self.mixer.set_volume(self.volume / 30.0)
+
+        # public calls below only enqueue; pygame runs on the worker thread
+        self.worker = AudioWorker(self._handle, self.update)
+        if self.ok:
+            self.worker.start()
+
+    def _handle(self, command: str, arg):
+        if command == "play":
+            self._play_now(arg)
+        elif command == "queue":
+            self._queue_now(arg)
+        elif command == "loop":
+            self._loop_now(arg)
+        elif command == "volume":
+            if self.mixer is not None:
+                self.mixer.set_volume(arg / 30.0)
+        elif command == "stop":
+            self._stop_now()
+        elif command == "warm_up":
+            self._warm_up_now()
+
+    def _decode(self, sound_id: int) -> Optional[tuple]:
+        path = self._load_path(sound_id)
+        if not path:
+            return None
+        try:
+            sound = pygame.mixer.Sound(path)
+        except Exception as e:
+            print(f"[SOUND] ERROR decoding {path}: {e}")
+            return None
+        freq, fmt, channels = pygame.mixer.get_init()
+        nbytes = int(sound.get_length() * freq * channels * (abs(fmt) // 8))
+        return sound, nbytes
+
+    def warm_up(self):
+        """Decode every non-music SOUND_MAP entry (until the cache cap) on the audio worker."""
+        if self.ok:
+            self.worker.submit("warm_up")
+
+    def _warm_up_now(self) -> int:
+        if not self.ok:
+            return 0
+        ids = [i for i in self.sound_map if i not in self._menu_tracks]
+        count = self.cache.warm(ids)
+        print(f"[SOUND] warm-up: {count} sounds cached ({self.cache.bytes // 1024} KiB)")
+        return count
+
+    def update(self):
+        """Start queued announcements and adjust ducking; the audio worker calls this."""
+        if self.mixer is not None:
+            self.mixer.pump()
 
     def _load_path(self, sound_id: int) -> Optional[str]:
         filename = self.sound_map.get(sound_id)
@@ -458,17 +863,41 @@ class SoundSystem:
         return path
 
     def play(self, sound_id: int):
+        if not self.enabled or not self.ok:
+            return
+        # countdown calls go stale fast: keep only the newest pending one
+        self.worker.submit("play", sound_id, coalesce=sound_id in COUNTDOWN_SOUNDS)
+
+    def queue(self, sound_id: int):
+        if not self.enabled or not self.ok:
+            return
+        self.worker.submit("queue", sound_id)
+
+    def loop(self, sound_id: int):
+        if not self.enabled or not self.ok:
+            return
+        self.worker.submit("loop", sound_id)
+
+    def _play_now(self, sound_id: int):
         """
         Play a sound.
 
-        - Normal sounds: play immediately (interrupt current music).
+        - VO / SFX: routed by AudioMixer (priority, queueing, ducking).
         - Menu tracks (self._menu_tracks): lowest priority
-          - If something is playing, queue them.
-          - If nothing is playing, start them in a loop.
+          - If a track is already playing, queue them.
+          - If nothing is playing, start them in a loop (ducked under VO).
         """
         if not self.enabled or not self.ok:
             return
 
+        if sound_id not in self._menu_tracks:
+            try:
+                if self.mixer.play(sound_id):
+                    print(f"[SOUND] Playing {sound_id}")
+                    return
+            except Exception as e:
+                print(f"[SOUND] ERROR playing {sound_id}: {e}")
+
         path = self._load_path(sound_id)
         if not path:
             return
@@ -484,7 +913,7 @@ class SoundSystem:
                     pygame.mixer.music.play(loops=-1)
                     print(f"[SOUND] Looping menu track {sound_id}: {path}")
             else:
-                # High-priority / normal SFX or VO: play immediately.
+                # Could not decode as a Sound: stream it like before.
                 pygame.mixer.music.load(path)
                 pygame.mixer.music.play()
                 print(f"[SOUND] Playing {sound_id}: {path}")
@@ -493,7 +922,7 @@ class SoundSystem:
 
 
 
-    def queue(self, sound_id: int):
+    def _queue_now(self, sound_id: int):
         """Queue a track to play after the current one finishes.
 
         - If something is already playing via mixer.music, we queue.
@@ -502,6 +931,15 @@ class SoundSystem:
         if not self.enabled or not self.ok:
             return
 
+        if sound_id not in self._menu_tracks:
+            # the mixer already queues VO behind whatever is talking
+            try:
+                if self.mixer.play(sound_id):
+                    print(f"[SOUND] Queued {sound_id}")
+                    return
+            except Exception as e:
+                print(f"[SOUND] ERROR queueing {sound_id}: {e}")
+
         path = self._load_path(sound_id)
         if not path:
             return
@@ -519,7 +957,7 @@ class SoundSystem:
             print(f"[SOUND] ERROR queueing {sound_id} ({path}): {e}")
 
 
-    def loop(self, sound_id: int):
+    def _loop_now(self, sound_id: int):
         if not self.enabled or not self.ok:
             return
         path = self._load_path(sound_id)
@@ -547,12 +985,19 @@ class SoundSystem:
 
     def set_volume(self, volume: int):
         self.volume = max(0, min(30, volume))
-        if getattr(self, "ok", False):
-            pygame.mixer.music.set_volume(self.volume / 30.0)
+        if self.ok:
+            self.worker.submit("volume", self.volume)
 
     def stop(self):
         if getattr(self, "ok", False):
-            pygame.mixer.music.stop()
+            # anything still pending would play after the stop
+            self.worker.clear()
+            self.worker.submit("stop")
+
+    def _stop_now(self):
+        pygame.mixer.music.stop()
+        if self.mixer is not None:
+            self.mixer.stop()
 
 # ========================================================================
 # GAME BACKEND
@@ -566,13 +1011,13 @@ class GamePhase(Enum):
 
 
 class GameBackend:
-    def __init__(self):
+    def __init__(self, scanner: Optional[EnhancedBLEScanner] = None):
         self.clock = RealClock()
         self.game_options = GameOptions()
         self.event_manager = EventManager(self.clock)
         self.proximity = Proximity(self.game_options, self.clock)
         self.control_point = ControlPoint(self.event_manager, self.clock)
-        self.scanner = EnhancedBLEScanner(self.clock)
+        self.scanner = scanner if scanner is not None else EnhancedBLEScanner(self.clock)
 
         self.owner_meter = LedMeter('owner', 20)
         self.capture_meter = LedMeter('capture', 20)
@@ -592,6 +1037,7 @@ class GameBackend:
         self._running = False
         self._countdown_total = 0
         self._countdown_started_ms = 0
+        self.state_versions = VersionedState()
         self._last_announced_second = None
 
         self.game_id = 0
@@ -599,6 +1045,14 @@ class GameBackend:
     def configure(self, options: GameOptions):
         options.validate()
         self.game_options = options
+        self.scanner.configure_presence(
+            confirm_adverts=options.presence_confirm_adverts,
+            min_timeout_ms=options.presence_min_timeout_ms,
+            max_timeout_ms=options.presence_max_timeout_ms,
+            rssi_alpha=options.presence_rssi_alpha,
+            interval_alpha=options.presence_interval_alpha,
+            min_rssi=options.presence_min_rssi,
+        )
 
     def start_game(self):
         self.game_id  += 1
@@ -764,6 +1218,52 @@ class GameBackend:
             self._ensure_ble(False)
             self.on_game_ended()
 
+    def get_state_since(self, version: int) -> dict:
+        """get_state() as a delta against `version`, see VersionedState.since."""
+        return self.state_versions.since(
+            version, self.get_state, self.clock.milliseconds(), self.state_key()
+        )
+
+    def next_wakeup_ms(self) -> Optional[int]:
+        """Earliest clock time update() has something to do; see TickScheduler."""
+        if self._phase == GamePhase.COUNTDOWN:
+            elapsed = self.clock.milliseconds() - self._countdown_started_ms
+            return self._countdown_started_ms + (max(0, elapsed) // 1000 + 1) * 1000
+        if self._phase != GamePhase.RUNNING or not self.game:
+            return None
+        times = [t for t in (self.game.next_event_ms(), self.control_point.next_event_ms()) if t is not None]
+        return min(times, default=None)
+
+    def state_key(self) -> tuple:
+        """
+        Cheap fingerprint of what get_state() shows: an equal key means an
+        equal state. A field added to get_state() needs its input here too;
+        test_state_key_moves_whenever_get_state_does plays a match to check.
+        """
+        key = (
+            self._phase,
+            self._running,
+            self.game_id,
+            self.event_manager.last_seq(),
+            self.game_options.time_limit_seconds,
+            tuple(m.state_key() for m in (self.timer1, self.timer2, self.owner_meter, self.capture_meter)),
+            self.control_point.state_key(),
+            self.proximity.get_red_count(),
+            self.proximity.get_blu_count(),
+        )
+        if self._phase == GamePhase.COUNTDOWN:
+            return key + ((self.clock.milliseconds() - self._countdown_started_ms) // 1000,)
+        if self.game and self._phase in (GamePhase.RUNNING, GamePhase.ENDED):
+            return key + (
+                self.game.get_remaining_seconds_for_team(Team.RED),
+                self.game.get_remaining_seconds_for_team(Team.BLU),
+                self.game.get_accumulated_seconds(Team.RED),
+                self.game.get_accumulated_seconds(Team.BLU),
+                self.game.is_over(),
+                self.game.get_winner(),
+            )
+        return key
+
     def get_state(self) -> dict:
         meters = {
             'timer1': self.timer1.to_dict(),
@@ -858,8 +1358,8 @@ class GameBackend:
 class EnhancedGameBackend(GameBackend):
     """GameBackend + sound + settings + BLE + manual/ble proximity switch"""
 
-    def __init__(self,sound_system=None):
-        super().__init__()
+    def __init__(self, sound_system=None, scanner: Optional[EnhancedBLEScanner] = None):
+        super().__init__(scanner)
 
         # sound
         self.sound_system = None
@@ -890,8 +1390,8 @@ class EnhancedGameBackend(GameBackend):
         self.manual_red_on: bool = False
         self.manual_blu_on: bool = False
 
-
-
+        # tiles that make up the hill; None counts every tile the scanner sees
+        self.square_ids: Optional[List[int]] = None
 
     # ----- manual control API -----
 
@@ -921,7 +1421,10 @@ class EnhancedGameBackend(GameBackend):
 
     def _update_proximity(self):
 
-        counts = self.scanner.get_player_counts()
+        if self.square_ids is None:
+            counts = self.scanner.get_player_counts()
+        else:
+            counts = self.scanner.get_player_counts_for_squares(self.square_ids)
 
         red_on = counts.get('red', 0)
         blue_on = counts.get('blu', 0)
@@ -0,0 +1,337 @@
+"""
+Micro-benchmarks for the base station hot paths.
+
+    python bench_battlepoint.py                 # run, compare to bench_baseline.json
+    python bench_battlepoint.py --save          # run and (re)write the baseline
+    python bench_battlepoint.py -k scanner      # only benchmarks whose name contains "scanner"
+
+Each benchmark reports the best-of-N time per operation. When a baseline
+exists, anything slower than baseline * (1 + --tolerance) is flagged and the
+script exits 1, so it can gate a change the same way the tests do. Baselines
+are machine specific: save one on the Pi (or your dev box) before a change,
+then compare after it.
+
+stdout is swallowed while timing, so the [EVENT]/[BROWSER_SOUND] prints are
+still executed but don't flood the terminal.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from battlepoint_core import ControlPoint, EventManager, GameOptions, Proximity
+from ble_scanner import EnhancedBLEScanner, decode_tile_advert
+from simulator import SimClock
+
+BASELINE_FILE = "bench_baseline.json"
+DEFAULT_TOLERANCE = 0.25
+
+# name -> (factory(size) -> (fn, ops per fn call), sizes)
+BENCHMARKS: Dict[str, Tuple[Callable, Tuple[int, ...]]] = {}
+
+
+def bench(name: str, sizes: Tuple[int, ...] = (1,)):
+    def register(factory):
+        BENCHMARKS[name] = (factory, sizes)
+        return factory
+    return register
+
+
+def _adverts(tiles: int):
+    teams = "RBM"
+    return [
+        decode_tile_advert(f"CS-{i:02d},{teams[i % 3]},PT-{i:03d},0")
+        for i in range(tiles)
+    ]
+
+
+# ----------------------------------------------------------------------
+# scanner
+# ----------------------------------------------------------------------
+
+@bench("scanner.record_observation", sizes=(10, 50))
+def _bench_record_observation(tiles: int):
+    """One second of adverts from `tiles` tiles at 50ms, queued then drained."""
+    clock = SimClock()
+    scanner = EnhancedBLEScanner(clock)
+    adverts = _adverts(tiles)
+    addresses = [f"AA:BB:CC:00:00:{i:02X}" for i in range(tiles)]
+    batch = [(a, ad) for _ in range(20) for a, ad in zip(addresses, adverts)]
+
+    def run():
+        now = clock.milliseconds()
+        for n, (address, advert) in enumerate(batch):
+            scanner._record_observation(address, -60, advert, now + (n // tiles) * 50)
+        scanner.process_pending()
+        clock.advance(1000)
+
+    return run, len(batch)
+
+
+@bench("scanner.get_player_counts_for_squares", sizes=(10, 50, 100))
+def _bench_player_counts(tiles: int):
+    clock = SimClock(10_000)
+    scanner = EnhancedBLEScanner(clock)
+    for i, advert in enumerate(_adverts(tiles)):
+        for k in range(3):
+            scanner._record_observation(f"AA:BB:CC:00:00:{i:02X}", -60, advert, 10_000 - 100 * k)
+    scanner.process_pending()
+    squares = [1, 2, 3]
+
+    def run():
+        scanner.get_player_counts_for_squares(squares)
+
+    return run, 1
+
+
+@bench("scanner.shared_table_counts", sizes=(10, 50))
+def _bench_shared_table_counts(tiles: int):
+    """Counts for 3 squares read from the BP_BLE_PROCESS tile table (reader side only)."""
+    from ble_process import TABLE_SIZE, TablePublisher, TileTable
+    clock = SimClock(10_000)
+    scanner = EnhancedBLEScanner(clock)
+    for i, advert in enumerate(_adverts(tiles)):
+        scanner._record_observation(f"AA:BB:CC:00:00:{i:02X}", -60, advert, 10_000)
+    table = TileTable(bytearray(TABLE_SIZE))
+    TablePublisher(scanner, table).publish()
+    squares = [1, 2, 3]
+
+    def run():
+        table.counts(squares, 10_001)
+
+    return run, 1
+
+
+# ----------------------------------------------------------------------
+# core
+# ----------------------------------------------------------------------
+
+@bench("core.control_point_update")
+def _bench_control_point(_):
+    clock = SimClock()
+    events = EventManager(clock)
+    prox = Proximity(GameOptions(), clock)
+    cp = ControlPoint(events, clock)
+    cp.init(20)
+
+    def run():
+        clock.advance(100)
+        prox.update_counts(1, 0)
+        cp.update(prox)
+
+    return run, 1
+
+
+@bench("core.event_insert")
+def _bench_event_insert(_):
+    clock = SimClock()
+    events = EventManager(clock)
+
+    def run():
+        clock.advance(1)
+        events._add_event("Control Point Being Captured by RED")
+
+    return run, 1
+
+
+# ----------------------------------------------------------------------
+# backends
+# ----------------------------------------------------------------------
+
+def _running(backend):
+    # no radio here: the benchmark only wants the game state
+    backend._ensure_ble = lambda scanning: None
+    backend.start_game()
+    if backend.game and not backend._running:
+        backend._do_start_game_now()
+    backend.update()
+    return backend
+
+
+@bench("backend.koth.get_state")
+def _bench_koth_state(_):
+    from battlepoint_game import GameBackend
+    backend = GameBackend()
+    backend.configure(GameOptions(start_delay_seconds=0))
+    backend = _running(backend)
+    return backend.get_state, 1
+
+
+@bench("backend.3cp.get_state")
+def _bench_3cp_state(_):
+    from threecp_game import ThreeCPBackend
+    from settings import ThreeCPOptions
+    backend = ThreeCPBackend()
+    backend.configure(ThreeCPOptions(start_delay_seconds=0))
+    backend = _running(backend)
+    return backend.get_state, 1
+
+
+@bench("backend.ad.get_state")
+def _bench_ad_state(_):
+    from ad_game import ADBackend
+    from settings import ThreeCPOptions
+    backend = ADBackend()
+    backend.configure(ThreeCPOptions(start_delay_seconds=0))
+    backend = _running(backend)
+    return backend.get_state, 1
+
+
+@bench("arenas.tick_round", sizes=(1, 6))
+def _bench_arenas(count: int):
+    """One scheduler pass over `count` running arenas sharing a scanner (per arena)."""
+    from arenas import ArenaConfig, ArenaRegistry
+    from settings import ControlSquareMapping, SettingsStore
+    from tick_scheduler import TickScheduler
+
+    scanner = EnhancedBLEScanner(SimClock())
+    registry = ArenaRegistry(scanner, store=SettingsStore(write_delay_s=3600), path=os.devnull)
+    sched = TickScheduler()
+    registry.attach(sched)
+    modes = ("koth", "3cp", "ad")
+    for i in range(count):
+        base = 10 * i + 1
+        mapping = ControlSquareMapping([base], [base + 1], [base + 2])
+        arena = registry.add(
+            ArenaConfig(f"a{i}", mode=modes[i % 3], mapping=mapping, options={"start_delay_seconds": 0}),
+            save=False,
+        )
+        _running(arena.backend)
+
+    def run():
+        sched.wake()
+        sched.run_due()
+
+    return run, count
+
+
+# ----------------------------------------------------------------------
+# browser sound
+# ----------------------------------------------------------------------
+
+class _BenchClient:
+    """Stands in for a nicegui Client: accepts run_javascript and drops it."""
+
+    def __init__(self, cid: str):
+        self.id = cid
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run_javascript(self, js: str):
+        pass
+
+
+@bench("sound.browser_play_fanout", sizes=(1, 10, 50))
+def _bench_browser_play(clients: int):
+    from sound_bus import BrowserSoundBus
+    bus = BrowserSoundBus()
+    for i in range(clients):
+        client = _BenchClient(f"c{i}")
+        bus.clients[client.id] = client
+        bus.enabled.add(client.id)
+
+    def run():
+        bus.play(12)
+
+    return run, 1
+
+
+# ----------------------------------------------------------------------
+# runner
+# ----------------------------------------------------------------------
+
+def measure(fn: Callable[[], None], ops: int, repeat: int = 5, min_time_s: float = 0.05) -> float:
+    """Best-of-`repeat` nanoseconds per operation."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time_s:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_time_s / elapsed) + 1)
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1e9 / (loops * ops)
+
+
+def run_benchmarks(pattern: str = "", repeat: int = 5) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    devnull = open(os.devnull, "w")
+    for name, (factory, sizes) in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        for size in sizes:
+            key = name if sizes == (1,) else f"{name}[{size}]"
+            with contextlib.redirect_stdout(devnull):
+                fn, ops = factory(size)
+                results[key] = measure(fn, ops, repeat)
+    devnull.close()
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Names of benchmarks slower than their baseline by more than `tolerance`."""
+    return [
+        key for key, ns in results.items()
+        if key in baseline and ns > baseline[key] * (1.0 + tolerance)
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="BattlePoint base station benchmarks")
+    parser.add_argument("-k", dest="pattern", default="", help="only run benchmarks containing this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.pattern, args.repeat)
+
+    baseline: Dict[str, float] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    elif not args.save:
+        print(f"[BENCH] no baseline at {args.baseline}; run with --save on the reference machine to record one")
+
+    slow = set(compare(results, baseline, args.tolerance))
+    for key, ns in results.items():
+        line = f"{key:48s} {ns:12.1f} ns/op {1e9 / ns:14.0f} ops/s"
+        if key in baseline:
+            delta = (ns / baseline[key] - 1.0) * 100.0
+            line += f"   {delta:+6.1f}% vs baseline"
+            if key in slow:
+                line += "  SLOWER"
+        print(line)
+
+    if args.save:
+        merged = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": merged}, f, indent=2, sort_keys=True)
+        print(f"[BENCH] baseline saved to {args.baseline}")
+        return 0
+
+    if slow:
+        print(f"[BENCH] {len(slow)} benchmark(s) slower than baseline by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
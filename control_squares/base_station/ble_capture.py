@@ -0,0 +1,346 @@
+"""
+Compact binary capture of every tile observation, for post-game analysis
+and replay (ReplayAdvertSource reads these files too).
+
+Opt in with BP_BLE_CAPTURE=<directory> (or EnhancedBLEScanner.set_recorder).
+The radio callback only appends a tuple to a bounded deque; a writer thread
+packs and writes them, so recording never slows ingest. Files rotate by
+size and the oldest are deleted past max_files.
+
+File layout (little endian):
+
+  header   MAGIC, then <qq  wall clock us and monotonic us at open
+  frames   <BBH  sync 0xB5, type, body length; then the body
+    OBS    <qb   monotonic us, rssi; address; payload (ascii, rest of body)
+           address is one length byte then bytes: len 6 = raw MAC,
+           len | 0x80 = text (e.g. a macOS UUID)
+    OBS_ADAPTER  <qbB  as OBS plus the HCI adapter index, for adverts
+           heard on any adapter but 0 (multi-dongle captures keep every
+           adapter's copy, so replay de-duplicates them as live did)
+    INDEX  <qqqI block start offset, first us, last us, record count
+           written after every INDEX_EVERY observations and on close, so
+           iter_capture(start_ms=...) can seek without decoding everything
+
+A torn last frame (power cut mid-write) ends iteration cleanly.
+"""
+
+import atexit
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+MAGIC = b"BPCAP1\n\x00"
+_HEADER = struct.Struct("<qq")
+_FRAME = struct.Struct("<BBH")
+_OBS = struct.Struct("<qb")
+_OBS_ADAPTER = struct.Struct("<qbB")
+_INDEX = struct.Struct("<qqqI")
+SYNC = 0xB5
+FRAME_OBS = 1
+FRAME_INDEX = 2
+FRAME_OBS_ADAPTER = 3
+
+CAPTURE_ENV = "BP_BLE_CAPTURE"
+CAPTURE_SUFFIX = ".bpcap"
+INDEX_EVERY = 1024
+CAPTURE_QUEUE_SIZE = 65536
+CAPTURE_FLUSH_S = 0.25
+CAPTURE_MAX_BYTES = 32 * 1024 * 1024
+CAPTURE_MAX_FILES = 20
+
+# (t_us monotonic, address, rssi, payload, adapter)
+Observation = Tuple[int, str, int, str, int]
+
+
+def _pack_address(address: str) -> bytes:
+    parts = address.split(":")
+    if len(parts) == 6:
+        try:
+            raw = bytes(int(p, 16) for p in parts)
+            return bytes([6]) + raw
+        except ValueError:
+            pass
+    text = address.encode("ascii", errors="replace")[:127]
+    return bytes([len(text) | 0x80]) + text
+
+
+def _unpack_address(body: bytes, pos: int) -> Tuple[str, int]:
+    n = body[pos]
+    pos += 1
+    if n & 0x80:
+        n &= 0x7F
+        return body[pos:pos + n].decode("ascii", errors="replace"), pos + n
+    return ":".join(f"{b:02x}" for b in body[pos:pos + n]), pos + n
+
+
+def pack_observation(t_us: int, address: str, rssi: int, payload: str, adapter: int = 0) -> bytes:
+    rssi = max(-128, min(127, int(rssi)))
+    if adapter:
+        kind, head = FRAME_OBS_ADAPTER, _OBS_ADAPTER.pack(t_us, rssi, adapter & 0xFF)
+    else:
+        kind, head = FRAME_OBS, _OBS.pack(t_us, rssi)
+    body = head + _pack_address(address) + payload.encode("ascii", errors="replace")
+    return _FRAME.pack(SYNC, kind, len(body)) + body
+
+
+class CaptureWriter:
+    """Synchronous framing into one file; used by CaptureRecorder's thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f: BinaryIO = open(path, "ab")
+        if self._f.tell() == 0:
+            self._f.write(MAGIC + _HEADER.pack(time.time_ns() // 1000, time.monotonic_ns() // 1000))
+        self._block_start = self._f.tell()
+        self._block_first = 0
+        self._block_last = 0
+        self._block_count = 0
+
+    @property
+    def size(self) -> int:
+        return self._f.tell()
+
+    def write(self, obs: Observation):
+        t_us, address, rssi, payload, adapter = obs
+        if self._block_count == 0:
+            self._block_start = self._f.tell()
+            self._block_first = t_us
+        self._f.write(pack_observation(t_us, address, rssi, payload, adapter))
+        self._block_last = t_us
+        self._block_count += 1
+        if self._block_count >= INDEX_EVERY:
+            self._write_index()
+
+    def _write_index(self):
+        if self._block_count == 0:
+            return
+        body = _INDEX.pack(self._block_start, self._block_first, self._block_last, self._block_count)
+        self._f.write(_FRAME.pack(SYNC, FRAME_INDEX, len(body)) + body)
+        self._block_count = 0
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._write_index()
+        self._f.close()
+
+
+class CaptureRecorder:
+    """
+    Background, rotating capture. record() is safe to call from the radio
+    thread and never blocks; when the queue is full observations are
+    counted in `dropped` instead.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "capture",
+        max_bytes: int = CAPTURE_MAX_BYTES,
+        max_files: int = CAPTURE_MAX_FILES,
+        queue_size: int = CAPTURE_QUEUE_SIZE,
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._queue: deque = deque(maxlen=queue_size)
+        self.recorded = 0
+        self.dropped = 0
+        self.files: List[str] = []
+        self._file_seq = 0
+        self._writer: Optional[CaptureWriter] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ble-capture", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, address: str, rssi: int, payload: str, t_us: Optional[int] = None, adapter: int = 0):
+        q = self._queue
+        if len(q) == q.maxlen:
+            self.dropped += 1
+        q.append((time.monotonic_ns() // 1000 if t_us is None else t_us, address, rssi, payload, adapter))
+
+    def close(self):
+        """Stop the writer thread after it writes everything queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    def _run(self):
+        try:
+            while not self._stop.wait(CAPTURE_FLUSH_S):
+                self._drain()
+            self._drain()
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _drain(self):
+        q = self._queue
+        if not q:
+            return
+        while True:
+            try:
+                obs = q.popleft()
+            except IndexError:
+                break
+            writer = self._current_writer()
+            try:
+                writer.write(obs)
+                self.recorded += 1
+            except Exception as e:
+                print(f"[CAPTURE] write error: {e}")
+                return
+        self._writer.flush()
+
+    def _current_writer(self) -> CaptureWriter:
+        w = self._writer
+        if w is not None and w.size < self.max_bytes:
+            return w
+        if w is not None:
+            w.close()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{self._file_seq:04d}{CAPTURE_SUFFIX}")
+        self._file_seq += 1
+        self._writer = CaptureWriter(path)
+        self.files.append(path)
+        self._prune()
+        print(f"[CAPTURE] writing {path}")
+        return self._writer
+
+    def _prune(self):
+        while len(self.files) > self.max_files:
+            old = self.files.pop(0)
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def get_stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": len(self._queue),
+            "file": self._writer.path if self._writer is not None else None,
+        }
+
+
+# ----------------------------------------------------------------------
+# reading
+# ----------------------------------------------------------------------
+
+def is_capture_file(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _frames(f: BinaryIO, skip_obs_bodies: bool = False) -> Iterator[Tuple[int, int, Optional[bytes]]]:
+    """(offset, type, body) per frame; body is None for skipped OBS frames."""
+    while True:
+        offset = f.tell()
+        head = f.read(_FRAME.size)
+        if len(head) < _FRAME.size:
+            return
+        sync, kind, length = _FRAME.unpack(head)
+        if sync != SYNC:
+            return
+        if skip_obs_bodies and kind in (FRAME_OBS, FRAME_OBS_ADAPTER):
+            f.seek(length, os.SEEK_CUR)
+            yield offset, kind, None
+            continue
+        body = f.read(length)
+        if len(body) < length:
+            return
+        yield offset, kind, body
+
+
+def _open_capture(path: str) -> Tuple[BinaryIO, int, int]:
+    f = open(path, "rb")
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a BattlePoint capture")
+    wall_us, mono_us = _HEADER.unpack(f.read(_HEADER.size))
+    return f, wall_us, mono_us
+
+
+def read_index(path: str) -> List[Tuple[int, int, int, int]]:
+    """(block offset, first us, last us, count) for every indexed block."""
+    f, _, _ = _open_capture(path)
+    with f:
+        return [
+            _INDEX.unpack(body)
+            for _, kind, body in _frames(f, skip_obs_bodies=True)
+            if kind == FRAME_INDEX
+        ]
+
+
+def iter_capture(path: str, start_ms: Optional[int] = None) -> Iterator[Observation]:
+    """
+    Stream observations (t_us, address, rssi, payload, adapter). With start_ms
+    (monotonic ms, as recorded), whole blocks that end earlier are skipped
+    via the index.
+    """
+    seek_to = None
+    if start_ms is not None:
+        start_us = start_ms * 1000
+        for offset, _, last_us, _ in read_index(path):
+            if last_us >= start_us:
+                seek_to = offset
+                break
+
+    f, _, _ = _open_capture(path)
+    with f:
+        if seek_to is not None:
+            f.seek(seek_to)
+        for _, kind, body in _frames(f):
+            if kind == FRAME_OBS:
+                t_us, rssi = _OBS.unpack_from(body)
+                adapter, pos = 0, _OBS.size
+            elif kind == FRAME_OBS_ADAPTER:
+                t_us, rssi, adapter = _OBS_ADAPTER.unpack_from(body)
+                pos = _OBS_ADAPTER.size
+            else:
+                continue
+            address, pos = _unpack_address(body, pos)
+            if start_ms is not None and t_us < start_ms * 1000:
+                continue
+            yield t_us, address, rssi, body[pos:].decode("ascii", errors="replace"), adapter
+
+
+def capture_wall_clock(path: str) -> Tuple[int, int]:
+    """(wall us, monotonic us) at file open, to turn record times into wall time."""
+    f, wall_us, mono_us = _open_capture(path)
+    f.close()
+    return wall_us, mono_us
+
+
+_env_recorder: Optional[CaptureRecorder] = None
+
+
+def capture_recorder_from_env() -> Optional[CaptureRecorder]:
+    """The recorder BP_BLE_CAPTURE asks for, shared by every scanner in the process."""
+    global _env_recorder
+    directory = os.environ.get(CAPTURE_ENV, "")
+    if not directory:
+        return None
+    if _env_recorder is None:
+        _env_recorder = CaptureRecorder(directory)
+        _env_recorder.start()
+    return _env_recorder
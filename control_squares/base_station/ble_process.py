@@ -0,0 +1,675 @@
+"""
+BLE scanning in its own process.
+
+In-process, the bleson observer threads share the GIL with NiceGUI, FastAPI
+and pygame, and advert gaps spike whenever a page renders. With
+BP_BLE_PROCESS=1 (see scanner_from_env) the EnhancedBLEScanner runs in a
+child process instead. The child drains, filters and expires adverts as
+usual and publishes every tile into a fixed-layout table in
+multiprocessing.shared_memory; ProcessBLEScanner, in the game process,
+reads counts straight out of that table with struct.unpack_from, so a
+game tick never waits on the radio or on a round trip to the child.
+
+Table layout (little endian, records padded to 8 bytes):
+
+  header  seq; <iqqBB100s  child pid, heartbeat ms, ingest_dropped,
+          scanning, active count, active tile indices (first-seen order)
+  slots   one per CS-NN index: seq; <cqBcBbfqIif24s40s4B4b4q
+          counted team (NUL = absent), presence expires ms, in_use,
+          team char, adapter, rssi, rssi_avg, last_seen ms, cb_count,
+          last_gap_ms (-1 = none), interval_ms (-1 = none), address,
+          payload, then up to 4 (adapter, rssi, seen ms) per adapter
+
+Every record is seqlock protected: the child (the only writer) makes seq
+odd, writes the body, then makes seq even again. A reader copies the
+body and retries if seq was odd or changed while it copied.
+
+Rare calls (start/stop scanning, presence settings, the log, adapter and
+capture stats) go to the child over a pipe. Stats are fetched on a
+background thread and read from the last reply, so a route handler never
+waits on the child. Times in the table come from the child's RealClock, so
+readers must use a RealClock too.
+
+The child is started with subprocess rather than multiprocessing.Process:
+spawn would re-import the app's __main__ (and with it ui.run), and fork
+is unsafe once NiceGUI and the audio worker have threads running. The
+pipe end is passed by fd, so this mode is Linux/macOS only.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import Pipe, resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Tuple
+
+from battlepoint_core import Clock, RealClock
+from ble_scanner import (
+    GAP_BUCKETS,
+    MAX_PLAYERS_PER_TEAM,
+    MAX_TILE_INDEX,
+    BleLogLevel,
+    EnhancedBLEScanner,
+    PresenceScopes,
+    TileSlot,
+    _TEAM_DELTAS,
+    scanner_metrics,
+)
+from ble_sources import advert_source_from_spec
+from metrics import Counter, Histogram, Metric
+
+BLE_PROCESS_ENV = "BP_BLE_PROCESS"
+
+TABLE_SLOTS = MAX_TILE_INDEX + 1
+TABLE_ADAPTERS = 4  # per-adapter RSSI kept for this many adapters per tile
+PUBLISH_INTERVAL_S = 0.01  # child publishes (and answers the pipe) this often
+RPC_TIMEOUT_S = 3.0
+STATS_REFRESH_S = 1.0  # a stats read older than this starts a background refresh
+SEQLOCK_RETRIES = 1000
+
+_SEQ = struct.Struct("<I")
+_HEADER = struct.Struct(f"<iqqBB{TABLE_SLOTS}s")
+_SLOT = struct.Struct(
+    f"<cqBcBbfqIif24s40s{TABLE_ADAPTERS}B{TABLE_ADAPTERS}b{TABLE_ADAPTERS}q"
+)
+# leading (counted, expires) of a slot: all a count needs
+_PRESENCE = struct.Struct("<cq")
+_NO_ADAPTER = 255
+_ABSENT = b"\x00"
+
+
+def _stride(body: struct.Struct) -> int:
+    return (_SEQ.size + body.size + 7) & ~7
+
+
+_HEADER_STRIDE = _stride(_HEADER)
+_SLOT_STRIDE = _stride(_SLOT)
+TABLE_SIZE = _HEADER_STRIDE + TABLE_SLOTS * _SLOT_STRIDE
+
+_DELTAS_BY_BYTE = {team.encode("ascii"): delta for team, delta in _TEAM_DELTAS.items()}
+
+
+def _text(raw: bytes) -> str:
+    return raw.rstrip(b"\x00").decode("ascii", errors="replace")
+
+
+class TileTable:
+    """
+    Seqlock-protected tile records over a shared buffer (a SharedMemory's
+    buf, or any writable buffer of TABLE_SIZE bytes for tests).
+    """
+
+    def __init__(self, buf):
+        if len(buf) < TABLE_SIZE:
+            raise ValueError(f"tile table needs {TABLE_SIZE} bytes, got {len(buf)}")
+        self._buf = buf
+        # reads that gave up because a record stayed mid-write
+        self.torn_reads = 0
+
+    @staticmethod
+    def _slot_offset(index: int) -> int:
+        return _HEADER_STRIDE + index * _SLOT_STRIDE
+
+    # ---------- writer (child process only) ----------
+
+    def _write(self, offset: int, body: struct.Struct, values: tuple):
+        buf = self._buf
+        seq = _SEQ.unpack_from(buf, offset)[0]
+        _SEQ.pack_into(buf, offset, (seq + 1) & 0xFFFFFFFF)
+        body.pack_into(buf, offset + _SEQ.size, *values)
+        _SEQ.pack_into(buf, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def write_header(self, pid: int, heartbeat_ms: int, ingest_dropped: int, scanning: bool, active: List[int]):
+        self._write(0, _HEADER, (pid, heartbeat_ms, ingest_dropped, int(scanning), len(active), bytes(active)))
+
+    def write_slot(self, slot: TileSlot, expires_ms: int):
+        seen = list(slot.rssi_by_adapter.items())[:TABLE_ADAPTERS]
+        pad = TABLE_ADAPTERS - len(seen)
+        self._write(
+            self._slot_offset(slot.index),
+            _SLOT,
+            (
+                slot.counted.encode("ascii") if slot.counted else _ABSENT,
+                expires_ms,
+                int(slot.in_use),
+                slot.team_char.encode("ascii")[:1] or b"N",
+                min(slot.adapter, _NO_ADAPTER - 1),
+                max(-128, min(127, slot.rssi)),
+                slot.rssi_avg,
+                slot.last_seen,
+                slot.cb_count,
+                -1 if slot.last_gap_ms is None else slot.last_gap_ms,
+                -1.0 if slot.interval_ms is None else slot.interval_ms,
+                slot.address.encode("ascii", errors="replace"),
+                slot.manufacturer_data.encode("ascii", errors="replace"),
+                *[min(a, _NO_ADAPTER - 1) for a, _ in seen], *[_NO_ADAPTER] * pad,
+                *[max(-128, min(127, r)) for _, (r, _) in seen], *[0] * pad,
+                *[t for _, (_, t) in seen], *[0] * pad,
+            ),
+        )
+
+    def clear_slot(self, index: int):
+        self._write(self._slot_offset(index), _SLOT, (_ABSENT, 0, 0, b"N", 0, 0, 0.0, 0, 0, -1, -1.0, b"", b"",
+                                                      *[_NO_ADAPTER] * TABLE_ADAPTERS,
+                                                      *[0] * TABLE_ADAPTERS, *[0] * TABLE_ADAPTERS))
+
+    # ---------- readers ----------
+
+    def _read(self, offset: int, body: struct.Struct) -> Optional[tuple]:
+        buf = self._buf
+        at = offset + _SEQ.size
+        for _ in range(SEQLOCK_RETRIES):
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            if seq & 1:
+                continue
+            values = body.unpack_from(buf, at)
+            if _SEQ.unpack_from(buf, offset)[0] == seq:
+                return values
+        self.torn_reads += 1
+        return None
+
+    def read_header(self) -> Optional[tuple]:
+        """(pid, heartbeat ms, ingest_dropped, scanning, active indices) or None."""
+        values = self._read(0, _HEADER)
+        if values is None:
+            return None
+        pid, heartbeat, dropped, scanning, count, active = values
+        return pid, heartbeat, dropped, bool(scanning), active[:count]
+
+    def read_slot(self, index: int) -> Optional[tuple]:
+        return self._read(self._slot_offset(index), _SLOT)
+
+    def active_indices(self) -> bytes:
+        header = self.read_header()
+        return header[4] if header is not None else b""
+
+    def counts(self, indices, now_ms: int) -> List[int]:
+        """[red, blu, mag] over the tiles at `indices` still present at now_ms (unclamped)."""
+        red = blu = mag = 0
+        for index in indices:
+            if not 0 <= index < TABLE_SLOTS:
+                continue
+            values = self._read(self._slot_offset(index), _PRESENCE)
+            if values is None:
+                continue
+            counted, expires = values
+            if counted == _ABSENT or now_ms >= expires:
+                continue
+            delta = _DELTAS_BY_BYTE.get(counted)
+            if delta is not None:
+                red += delta[0]
+                blu += delta[1]
+                mag += delta[2]
+        return [red, blu, mag]
+
+
+# ----------------------------------------------------------------------
+# child process
+# ----------------------------------------------------------------------
+
+class TablePublisher:
+    """Child side: applies pending adverts and mirrors changed tiles into the table."""
+
+    def __init__(self, scanner: EnhancedBLEScanner, table: TileTable):
+        self.scanner = scanner
+        self.table = table
+        self.pid = os.getpid()
+        # index -> what was last written, so unchanged tiles are skipped
+        self._published: Dict[int, tuple] = {}
+
+    def invalidate(self):
+        """Rewrite every tile on the next publish (presence timeouts changed)."""
+        self._published.clear()
+
+    def publish(self):
+        scanner = self.scanner
+        tiles = scanner.tiles
+        presence = scanner.presence_scopes.by_tile
+        table = self.table
+        published = self._published
+        now = scanner.clock.milliseconds()
+
+        with scanner._lock:
+            scanner._drain_pending()
+            tiles.expire(now, presence)
+            for index in tiles.active:
+                slot = tiles.slots[index]
+                key = (slot.cb_count, slot.counted, slot.rssi, len(slot.rssi_by_adapter))
+                if published.get(index) == key:
+                    continue
+                published[index] = key
+                table.write_slot(slot, slot.last_seen + presence[index].timeout_ms(slot.interval_ms) + 1)
+            if len(published) > len(tiles.active):
+                # the registry was cleared: blank what it forgot
+                for index in set(published) - set(tiles.active):
+                    del published[index]
+                    table.clear_slot(index)
+            active = list(tiles.active)
+
+        table.write_header(self.pid, now, scanner.ingest_dropped, scanner._scanning_flag(), active)
+
+    def handle(self, command: str, args: dict, loop: asyncio.AbstractEventLoop):
+        scanner = self.scanner
+        if command == "start":
+            loop.run_until_complete(scanner.start_scanning())
+            return scanner._scanning_flag()
+        if command == "stop":
+            loop.run_until_complete(scanner.stop_scanning())
+            return scanner._scanning_flag()
+        if command == "presence":
+            with scanner._lock:
+                scanner.presence_scopes.load(args)
+            self.invalidate()
+            return None
+        if command == "log_state":
+            return scanner.log.get_state(**args)
+        if command == "log_level":
+            scanner.log.set_level(BleLogLevel(args["level"]))
+            return scanner.log.get_state(0)
+        if command == "stats":
+            return {
+                "adapters": scanner.get_adapter_stats(),
+                "capture": scanner.recorder.get_stats() if scanner.recorder is not None else None,
+                "gaps": scanner.gap_histogram.snapshot(),
+            }
+        raise ValueError(f"unknown scanner command {command!r}")
+
+
+def run_child(shm_name: str, fd: int, options: dict) -> int:
+    """Entry point of the scanner process; returns when the parent says exit or goes away."""
+    conn = Connection(fd)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # the parent owns the segment: don't let this process's tracker unlink it
+    resource_tracker.unregister(getattr(shm, "_name", shm.name), "shared_memory")
+
+    spec = options.get("source")
+    scanner = EnhancedBLEScanner(
+        RealClock(),
+        adapters=options.get("adapters"),
+        source=advert_source_from_spec(spec) if spec else None,
+    )
+    publisher = TablePublisher(scanner, TileTable(shm.buf))
+    loop = asyncio.new_event_loop()
+    print(f"[BLE_PROC] scanner process {os.getpid()} up")
+
+    try:
+        while True:
+            if conn.poll(PUBLISH_INTERVAL_S):
+                try:
+                    rid, command, args = conn.recv()
+                except EOFError:
+                    break
+                if command == "exit":
+                    conn.send((rid, True, None))
+                    break
+                try:
+                    conn.send((rid, True, publisher.handle(command, args, loop)))
+                except Exception as e:
+                    conn.send((rid, False, f"{type(e).__name__}: {e}"))
+            publisher.publish()
+    finally:
+        if scanner._scanning_flag():
+            loop.run_until_complete(scanner.stop_scanning())
+        loop.close()
+        publisher.table = None
+        shm.close()
+        print(f"[BLE_PROC] scanner process {os.getpid()} exiting")
+    return 0
+
+
+# ----------------------------------------------------------------------
+# game process
+# ----------------------------------------------------------------------
+
+class RemoteBleLog:
+    """
+    The child scanner's BleLog, as far as the debug routes use it. Every
+    call is a pipe round trip, so async callers run it in an executor.
+    """
+
+    def __init__(self, owner: "ProcessBLEScanner"):
+        self._owner = owner
+
+    def get_state(self, limit: int = 100) -> dict:
+        return self._owner._call("log_state", limit=limit)
+
+    def set_level(self, level: BleLogLevel):
+        self._owner._call("log_level", level=int(level))
+
+    def lines(self, limit: int = 100) -> List[str]:
+        return self.get_state(limit)["lines"]
+
+
+def _no_stats() -> dict:
+    return {"adapters": [], "capture": None, "gaps": None}
+
+
+class ProcessBLEScanner:
+    """
+    EnhancedBLEScanner's API with the scanner itself in a child process.
+
+    Counts and device lists are read from the shared TileTable; control
+    calls go over the pipe. If the child dies, start_scanning() starts a
+    new one.
+    """
+
+    def __init__(
+        self,
+        clock: Clock,
+        adapters: Optional[List[int]] = None,
+        source_spec: Optional[str] = None,
+    ):
+        """
+        clock: must agree with the child's RealClock (table times are its ms).
+        adapters: HCI indices for the child; default BP_BLE_ADAPTERS.
+        source_spec: BP_BLE_SOURCE-style stand-in for the radio (see ble_sources).
+        """
+        if sys.platform == "win32":
+            raise RuntimeError("ProcessBLEScanner needs fd passing; not available on Windows")
+        self.clock = clock
+        # kept here too, so a restarted child gets them; see configure_presence()
+        self.presence_scopes = PresenceScopes()
+        self.presence = self.presence_scopes.default
+        self.log = RemoteBleLog(self)
+        self._options = {"adapters": adapters, "source": source_spec}
+        # the child's advert gap histogram, refreshed from its snapshot on each scrape
+        self.gap_histogram = Histogram(
+            "bp_ble_advert_gap_seconds", "Time between accepted adverts of one tile", ("tile",), GAP_BUCKETS
+        )
+
+        self._shm = shared_memory.SharedMemory(create=True, size=TABLE_SIZE)
+        self._shm.buf[:TABLE_SIZE] = bytes(TABLE_SIZE)
+        self.table = TileTable(self._shm.buf)
+
+        self._rpc_lock = threading.Lock()
+        self._rid = 0
+        self._stats_reply = _no_stats()
+        self._stats_at = 0.0
+        self._stats_refreshing = False
+        self._presence_lock = threading.Lock()
+        self._presence_dirty = False
+        self._presence_sending = False
+        self._conn: Optional[Connection] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self._closed = False
+        self._spawn()
+        atexit.register(self.close)
+
+    # ---------- child lifecycle ----------
+
+    def _spawn(self):
+        parent_conn, child_conn = Pipe()
+        fd = child_conn.fileno()
+        self._proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self._shm.name, str(fd), json.dumps(self._options)],
+            pass_fds=(fd,),
+        )
+        child_conn.close()
+        self._conn = parent_conn
+        print(f"[BLE_PROC] started scanner process {self._proc.pid} (table {self._shm.name})")
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _ensure_child(self):
+        if self.alive or self._closed:
+            return
+        print(f"[BLE_PROC] scanner process exited ({self._proc.returncode}), restarting")
+        self.restarts += 1
+        self._conn.close()
+        self._spawn()
+        self._call("presence", **self.presence_scopes.to_dict())
+
+    def _call(self, command: str, **args):
+        """One request/reply with the child; replies to timed-out requests are discarded."""
+        with self._rpc_lock:
+            self._rid += 1
+            rid = self._rid
+            try:
+                self._conn.send((rid, command, args))
+                deadline = time.monotonic() + RPC_TIMEOUT_S
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._conn.poll(remaining):
+                        raise TimeoutError(f"scanner process did not answer {command!r}")
+                    got, ok, result = self._conn.recv()
+                    if got == rid:
+                        break
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"scanner process unavailable: {e}") from e
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def close(self):
+        """Stop the child and free the table. Safe to call twice."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.alive:
+            try:
+                self._call("exit")
+            except Exception:
+                pass
+            try:
+                self._proc.wait(2.0)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+        self._conn.close()
+        self.table = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    # ---------- control ----------
+
+    async def start_scanning(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._start)
+
+    def _start(self):
+        self._ensure_child()
+        self._call("start")
+
+    async def stop_scanning(self):
+        if self.alive:
+            await asyncio.get_running_loop().run_in_executor(None, self._call, "stop")
+
+    @property
+    def fresh_window_ms(self) -> int:
+        return self.presence.max_timeout_ms
+
+    @fresh_window_ms.setter
+    def fresh_window_ms(self, value: int):
+        self.configure_presence(max_timeout_ms=value)
+
+    def configure_presence(self, scope: Optional[str] = None, squares=None, **changes):
+        """
+        As EnhancedBLEScanner.configure_presence(). The child is sent the
+        whole PresenceScopes on a background thread, since the configure
+        routes that call this run on the event loop.
+        """
+        self.presence_scopes.configure(scope, squares, **changes)
+        self._push_presence()
+
+    def clear_presence(self, scope: str):
+        self.presence_scopes.clear(scope)
+        self._push_presence()
+
+    def _push_presence(self):
+        if not self.alive:
+            return
+        with self._presence_lock:
+            self._presence_dirty = True
+            if self._presence_sending:
+                return
+            self._presence_sending = True
+        threading.Thread(target=self._send_presence, name="ble-proc-presence", daemon=True).start()
+
+    def _send_presence(self):
+        """Send the latest presence settings until no newer ones are waiting."""
+        while True:
+            with self._presence_lock:
+                if not self._presence_dirty:
+                    self._presence_sending = False
+                    return
+                self._presence_dirty = False
+            try:
+                self._call("presence", **self.presence_scopes.to_dict())
+            except Exception as e:
+                print(f"[BLE_PROC] presence settings not sent: {e}")
+
+    def process_pending(self) -> int:
+        # the child applies adverts itself
+        return 0
+
+    # ---------- reads (shared table only) ----------
+
+    def _clamped(self, counts: List[int]) -> Dict[str, int]:
+        red, blu, mag = counts
+        return {"red": min(red, MAX_PLAYERS_PER_TEAM), "blu": min(blu, MAX_PLAYERS_PER_TEAM), "mag": mag}
+
+    def get_player_counts(self) -> Dict[str, int]:
+        table = self.table
+        return self._clamped(table.counts(table.active_indices(), self.clock.milliseconds()))
+
+    def get_player_counts_for_squares(self, square_ids: List[int]) -> Dict[str, int]:
+        if not square_ids:
+            return {"red": 0, "blu": 0, "mag": 0}
+        wanted = {int(s) for s in square_ids}
+        return self._clamped(self.table.counts(wanted, self.clock.milliseconds()))
+
+    def _scanning_flag(self) -> bool:
+        header = self.table.read_header()
+        return self.alive and header is not None and header[3]
+
+    def _snapshot_devices(self) -> List[dict]:
+        table = self.table
+        now = self.clock.milliseconds()
+        presence_by_tile = self.presence_scopes.by_tile
+        device_list = []
+        for index in table.active_indices():
+            values = table.read_slot(index)
+            if values is None or not values[2]:
+                continue
+            (counted, _expires, _in_use, _team, _adapter, rssi, rssi_avg, last_seen,
+             cb_count, last_gap, interval, address, payload) = values[:13]
+            presence = presence_by_tile[index]
+            n = TABLE_ADAPTERS
+            by_adapter = zip(values[13:13 + n], values[13 + n:13 + 2 * n], values[13 + 2 * n:13 + 3 * n])
+            device_list.append(
+                {
+                    "name": f"CS-{index:02d}",
+                    "rssi": rssi,
+                    "rssi_avg": round(rssi_avg, 1),
+                    "address": _text(address),
+                    "last_seen_ms": int(now - last_seen),
+                    "manufacturer_data": _text(payload),
+                    "cb_count": cb_count,
+                    "last_gap_ms": None if last_gap < 0 else last_gap,
+                    "interval_ms": None if interval < 0 else int(interval),
+                    "timeout_ms": presence.timeout_ms(None if interval < 0 else interval),
+                    "present_team": None if counted == _ABSENT else counted.decode("ascii"),
+                    "rssi_by_adapter": {
+                        f"hci{a}": r
+                        for a, r, seen in sorted(by_adapter)
+                        if a != _NO_ADAPTER and now - seen <= presence.max_timeout_ms
+                    },
+                }
+            )
+        device_list.sort(key=lambda d: d["rssi"], reverse=True)
+        return device_list
+
+    def _stats(self) -> dict:
+        """
+        The child's last stats reply. Never waits on the pipe: these are read
+        from async route handlers, so a stale reply starts a refresh on a
+        background thread and the caller gets the previous one.
+        """
+        if not self.alive:
+            return _no_stats()
+        if not self._stats_refreshing and time.monotonic() - self._stats_at >= STATS_REFRESH_S:
+            self._stats_refreshing = True
+            threading.Thread(target=self._refresh_stats, name="ble-proc-stats", daemon=True).start()
+        return self._stats_reply
+
+    def _refresh_stats(self):
+        try:
+            self._stats_reply = self._call("stats")
+        except Exception as e:
+            print(f"[BLE_PROC] stats unavailable: {e}")
+        finally:
+            self._stats_at = time.monotonic()
+            self._stats_refreshing = False
+
+    def get_adapter_stats(self) -> List[dict]:
+        return self._stats()["adapters"]
+
+    def get_devices_summary(self) -> dict:
+        device_list = self._snapshot_devices()
+        header = self.table.read_header()
+        stats = self._stats()
+        return {
+            "scanning": self._scanning_flag(),
+            "device_count": len(device_list),
+            "devices": device_list,
+            "ingest_dropped": header[2] if header is not None else 0,
+            "capture": stats["capture"],
+            "adapters": stats["adapters"],
+            "process": {
+                "pid": self._proc.pid if self._proc is not None else None,
+                "alive": self.alive,
+                "restarts": self.restarts,
+                "heartbeat_age_ms": (self.clock.milliseconds() - header[1]) if header is not None else None,
+                "torn_reads": self.table.torn_reads,
+            },
+        }
+
+    def collect_metrics(self) -> List[Metric]:
+        """Same families as EnhancedBLEScanner.collect_metrics(), plus the child's health."""
+        stats = self._stats()
+        if stats["gaps"] is not None:
+            self.gap_histogram.load(stats["gaps"])
+        header = self.table.read_header()
+        restarts = Counter("bp_ble_process_restarts_total", "Times the scanner process was restarted")
+        restarts.inc(self.restarts)
+        torn = Counter("bp_ble_table_torn_reads_total", "Tile table reads abandoned mid-write")
+        torn.inc(self.table.torn_reads)
+        return scanner_metrics(self._snapshot_devices(), stats["adapters"], header[2] if header else 0) + [
+            self.gap_histogram,
+            restarts,
+            torn,
+        ]
+
+    def get_devices_snapshot(self) -> Tuple[List[dict], bool]:
+        """(devices, scanning) pair used by the 3CP/AD debug summaries."""
+        return self._snapshot_devices(), self._scanning_flag()
+
+
+def scanner_from_env(clock: Clock):
+    """
+    The scanner the app should share: a ProcessBLEScanner when
+    BP_BLE_PROCESS is set to 1/true/yes, else an in-process EnhancedBLEScanner.
+    """
+    wanted = os.environ.get(BLE_PROCESS_ENV, "").strip().lower() in ("1", "true", "yes")
+    if wanted:
+        try:
+            return ProcessBLEScanner(clock)
+        except Exception as e:
+            print(f"[BLE_PROC] falling back to in-process scanning: {e}")
+    return EnhancedBLEScanner(clock)
+
+
+if __name__ == "__main__":
+    # started by ProcessBLEScanner: ble_process.py <shm name> <pipe fd> <options json>
+    sys.exit(run_child(sys.argv[1], int(sys.argv[2]), json.loads(sys.argv[3])))
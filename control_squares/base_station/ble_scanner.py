@@ -1,6 +1,12 @@
 import traceback
-from typing import Optional, List, Dict
+import heapq
+from collections import deque
+from dataclasses import asdict, dataclass, replace
+from enum import IntEnum
+from typing import Optional, List, Dict, Tuple
 import asyncio
+import functools
+import os
 import sys
 import threading
 import time
@@ -12,6 +18,9 @@ from battlepoint_core import (
     Team,
     TagType,
 )
+from ble_sources import AdvertSource, advert_source_from_env
+from ble_capture import CaptureRecorder, capture_recorder_from_env
+from metrics import Counter, Gauge, Histogram, Metric
 
 MAX_PLAYERS_PER_TEAM = 3
 
@@ -29,56 +38,60 @@ except ImportError:
     BleakScanner = None
 
 
-def pick_usb_hci_index():
+def parse_hciconfig(out: str) -> List[Tuple[int, Optional[str]]]:
     """
-    Parse `hciconfig -a` output and return the index of the adapter
-    whose Bus is USB. Handles 'Bus: USB' on the same line as hciX:,
-    or on the following line. Falls back to 0 if none found.
+    (index, bus) for every adapter in `hciconfig -a` output. Handles
+    'Bus: USB' on the same line as hciX:, or on a following line.
     """
-    try:
-        out = subprocess.check_output(
-            ["hciconfig", "-a"], text=True, stderr=subprocess.STDOUT
-        )
-    except Exception as e:
-        print(f"[ERROR] Failed to run hciconfig: {e}")
-        print("[INFO] Falling back to hci0")
-        return 0
-
-    lines = out.splitlines()
+    adapters: List[Tuple[int, Optional[str]]] = []
     current_idx = None
     current_bus = None
-    usb_indices = []
 
-    for i, line in enumerate(lines):
+    for line in out.splitlines():
         line = line.rstrip()
 
         # Match hci header line: "hci0:   Type: Primary  Bus: USB"
         m = re.match(r"^hci(\d+):", line)
         if m:
             # flush previous adapter
-            if current_idx is not None and current_bus == "USB":
-                usb_indices.append(current_idx)
+            if current_idx is not None:
+                adapters.append((current_idx, current_bus))
 
             current_idx = int(m.group(1))
             current_bus = None
 
             # Check for Bus: on the same line
             if "Bus:" in line:
-                parts = line.split("Bus:", 1)
-                bus = parts[1].strip().split()[0]
-                current_bus = bus
+                current_bus = line.split("Bus:", 1)[1].strip().split()[0]
             continue
 
         # If Bus: is on a following line, catch it here
         if "Bus:" in line and current_idx is not None and current_bus is None:
-            parts = line.split("Bus:", 1)
-            bus = parts[1].strip().split()[0]
-            current_bus = bus
+            current_bus = line.split("Bus:", 1)[1].strip().split()[0]
 
     # Flush last adapter block
-    if current_idx is not None and current_bus == "USB":
-        usb_indices.append(current_idx)
+    if current_idx is not None:
+        adapters.append((current_idx, current_bus))
+    return adapters
 
+
+def list_hci_adapters() -> List[Tuple[int, Optional[str]]]:
+    """(index, bus) for every local HCI adapter, [] if hciconfig can't be run."""
+    try:
+        out = subprocess.check_output(
+            ["hciconfig", "-a"], text=True, stderr=subprocess.STDOUT
+        )
+    except Exception as e:
+        print(f"[ERROR] Failed to run hciconfig: {e}")
+        return []
+    return parse_hciconfig(out)
+
+
+def pick_usb_hci_index():
+    """
+    Index of the first adapter whose Bus is USB. Falls back to 0 if none found.
+    """
+    usb_indices = [idx for idx, bus in list_hci_adapters() if bus == "USB"]
     if usb_indices:
         chosen = usb_indices[0]
         print(f"[INFO] Detected USB Bluetooth adapter: hci{chosen}")
@@ -88,6 +101,34 @@ def pick_usb_hci_index():
     return 0
 
 
+BLE_ADAPTERS_ENV = "BP_BLE_ADAPTERS"
+
+
+def resolve_adapters(spec: str = "usb", adapters: Optional[List[Tuple[int, Optional[str]]]] = None) -> List[int]:
+    """
+    HCI indices to scan on, from a BP_BLE_ADAPTERS style spec:
+      usb (default)  every USB dongle (the onboard radio shares its antenna with WiFi)
+      all            every adapter hciconfig lists
+      0,2            exactly these
+    Falls back to [0] when nothing matches.
+    """
+    spec = (spec or "usb").strip().lower()
+    if spec not in ("usb", "all"):
+        try:
+            return sorted({int(p) for p in spec.replace("hci", "").split(",") if p.strip()}) or [0]
+        except ValueError:
+            print(f"[WARN] bad {BLE_ADAPTERS_ENV}={spec!r}, using USB adapters")
+            spec = "usb"
+
+    found = list_hci_adapters() if adapters is None else adapters
+    indices = [idx for idx, bus in found if spec == "all" or bus == "USB"]
+    if not indices:
+        print(f"[WARN] No {'adapter' if spec == 'all' else 'USB adapter'} detected via hciconfig, falling back to hci0")
+        return [0]
+    print(f"[INFO] Scanning on {', '.join(f'hci{i}' for i in indices)}")
+    return sorted(indices)
+
+
 # ============================================================================
 # CONFIG / CONSTANTS
 # ============================================================================
@@ -103,24 +144,706 @@ static const char ADV_PRESENCE_VALUE_MAG   = 'M';
 _TILE_PREFIX = "CS-"
 _TEAM_CHARS = ("R", "B","T", "N", "M")
 FRESH_WINDOW_MS = 1000
+MAX_TILE_INDEX = 99  # CS-00 .. CS-99
+MAX_SQUARE_GROUPS = 32  # cached per-control-point aggregates
+INGEST_QUEUE_SIZE = 4096  # pending adverts kept if nobody reads for a while
+# the same advert heard by two adapters lands within this many ms of itself
+DEDUP_WINDOW_MS = 20
+RATE_WINDOW_MS = 1000  # per-adapter advert rate is measured over this window
+# seconds between one tile's adverts (tiles advertise every 50-100 ms)
+GAP_BUCKETS = (0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0)
+
+"""
+ Tile Firmware logic
+       if (bluePresent && redPresent) {
+         // both switches: keep previous behavior
+         teamCharAdv = ADV_PRESENCE_VALUE_BOTH;
+       } else if (bluePresent) {
+         teamCharAdv = ADV_PRESENCE_VALUE_BLU;
+       } else if (redPresent) {
+         teamCharAdv = ADV_PRESENCE_VALUE_RED;
+       } else if (magPresent) {
+         // magnet-only presence: team unknown
+         teamCharAdv = ADV_PRESENCE_VALUE_MAG;
+       } else {
+         teamCharAdv = ADV_PRESENCE_VALUE_NONE;
+       }
+"""
+# (red, blu, mag) contribution of one present tile, by team char
+_TEAM_DELTAS = {
+    "R": (1, 0, 0),
+    "B": (0, 1, 0),
+    "T": (1, 1, 0),
+    "M": (0, 0, 1),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class TileAdvert:
+    """
+    One decoded tile advertisement.
+
+    Tile firmware sends manufacturer data as ASCII "TILE,TEAM,PLAYER,STRENGTH",
+    e.g. "CS-04,R,PT-012,0". It is decoded once, in the radio callback, and
+    everything downstream reads these fields instead of re-splitting the string.
+    """
+    index: int              # 4 for CS-04
+    name: str               # "CS-04"
+    team_char: str          # R / B / T / N / M
+    player_id: str          # "PT-012", or "" if absent
+    strength: int           # 4th field, 0 if absent or not a number
+    raw: str                # original payload, for the debug page
+
+
+def decode_tile_advert(mfg_ascii: str) -> Optional[TileAdvert]:
+    """Decode a tile payload, or return None if it is not one of ours."""
+    if not mfg_ascii:
+        return None
+
+    s = mfg_ascii.strip()
+    parts = s.split(",")
+    if len(parts) < 2:
+        return None
+
+    name = parts[0].strip().upper()
+    if not name.startswith(_TILE_PREFIX):
+        return None
+
+    try:
+        index = int(name[len(_TILE_PREFIX):])
+    except ValueError:
+        return None
+
+    team_char = parts[1].strip().upper()[:1] or "N"
+    player_id = parts[2].strip() if len(parts) > 2 else ""
+
+    strength = 0
+    if len(parts) > 3:
+        try:
+            strength = int(parts[3])
+        except ValueError:
+            strength = 0
+
+    return TileAdvert(
+        index=index,
+        name=name,
+        team_char=team_char,
+        player_id=player_id,
+        strength=strength,
+        raw=s,
+    )
+
+
+# ============================================================================
+# LOGGING
+# ============================================================================
+
+class BleLogLevel(IntEnum):
+    OFF = 0
+    WARN = 1
+    INFO = 2    # scanner lifecycle + first advert from each tile
+    DEBUG = 3   # also per-advert lines, rate limited per address
+
+
+BLE_LOG_RING_SIZE = 500
+BLE_LOG_ADVERT_INTERVAL_MS = 5000
+
+
+class BleLog:
+    """
+    Scanner diagnostics without a print() per advertisement.
+
+    - Messages below `level` are dropped before any formatting.
+    - Per-advert lines (DEBUG) are printed at most once per
+      `advert_interval_ms` for each address; 0 prints every advert.
+    - With `ring_size` > 0, recent entries are kept in memory for the debug
+      page regardless of the print rate limit. Entries are stored as raw
+      tuples and only formatted when read.
+    """
+
+    def __init__(
+        self,
+        level: BleLogLevel = BleLogLevel.INFO,
+        advert_interval_ms: int = BLE_LOG_ADVERT_INTERVAL_MS,
+        ring_size: int = BLE_LOG_RING_SIZE,
+    ):
+        self.level = level
+        self.advert_interval_ms = advert_interval_ms
+        self._ring: Optional[deque] = deque(maxlen=ring_size) if ring_size > 0 else None
+        self._last_print_by_addr: Dict[str, int] = {}
+        self.suppressed = 0
+
+    def set_level(self, level: BleLogLevel):
+        self.level = BleLogLevel(level)
+
+    def warn(self, msg: str, now_ms: Optional[int] = None):
+        self._message(BleLogLevel.WARN, msg, now_ms)
+
+    def info(self, msg: str, now_ms: Optional[int] = None):
+        self._message(BleLogLevel.INFO, msg, now_ms)
+
+    def _message(self, level: BleLogLevel, msg: str, now_ms: Optional[int]):
+        if self.level < level:
+            return
+        if now_ms is None:
+            now_ms = int(time.monotonic() * 1000)
+        if self._ring is not None:
+            self._ring.append((now_ms, level, msg))
+        print(f"[BLE] {msg}")
+
+    def advert(self, now_ms: int, address: str, name: str, rssi: int,
+               gap_ms: Optional[int], raw: str):
+        """Hot path: called once per tile advertisement."""
+        if self.level < BleLogLevel.INFO:
+            return
+
+        if gap_ms is None:
+            # first advert from this tile
+            self.info(f"first cb addr={address} name={name} rssi={rssi:4d} mf='{raw}'", now_ms)
+            return
+
+        if self.level < BleLogLevel.DEBUG:
+            return
+
+        if self._ring is not None:
+            self._ring.append((now_ms, address, name, rssi, gap_ms, raw))
+
+        last = self._last_print_by_addr.get(address)
+        if last is not None and now_ms - last < self.advert_interval_ms:
+            self.suppressed += 1
+            return
+        self._last_print_by_addr[address] = now_ms
+        print(
+            f"[BLE] cb addr={address} name={name} "
+            f"gap={gap_ms:4d}ms rssi={rssi:4d} mf='{raw}'"
+        )
+
+    def lines(self, limit: int = 100) -> List[str]:
+        """Most recent ring entries, oldest first, formatted for display."""
+        if self._ring is None:
+            return []
+        entries = list(self._ring)
+        if limit > 0:
+            entries = entries[-limit:]
+
+        out = []
+        for entry in entries:
+            if len(entry) == 3:
+                now_ms, level, msg = entry
+                out.append(f"{now_ms:>12d} {level.name:<5s} {msg}")
+            else:
+                now_ms, address, name, rssi, gap_ms, raw = entry
+                out.append(
+                    f"{now_ms:>12d} ADV   {name} {address} "
+                    f"gap={gap_ms:4d}ms rssi={rssi:4d} mf='{raw}'"
+                )
+        return out
+
+    def get_state(self, limit: int = 100) -> dict:
+        return {
+            "level": self.level.name,
+            "advert_interval_ms": self.advert_interval_ms,
+            "suppressed": self.suppressed,
+            "lines": self.lines(limit),
+        }
+
+
+# ============================================================================
+# TILE REGISTRY
+# ============================================================================
+
+@dataclass
+class PresenceSettings:
+    """
+    Per-tile presence filter parameters.
+
+    A tile counts as present until it misses adverts for
+    miss_factor x its own estimated advert interval, clamped to
+    [min_timeout_ms, max_timeout_ms]; before an interval is known the
+    max applies. A change of team char only takes effect after
+    confirm_adverts consecutive adverts agree, except when the tile was
+    absent, where the first advert is taken as-is. A tile whose smoothed
+    RSSI (rssi_alpha EWMA) is below min_rssi is out of range and not
+    counted; the default -128 is below any real reading, so no floor.
+    """
+    confirm_adverts: int = 2
+    min_timeout_ms: int = 300
+    max_timeout_ms: int = FRESH_WINDOW_MS
+    miss_factor: float = 4.0
+    rssi_alpha: float = 0.3
+    interval_alpha: float = 0.2
+    min_rssi: int = -128
+
+    def timeout_ms(self, interval_ms: Optional[float]) -> int:
+        if interval_ms is None:
+            return self.max_timeout_ms
+        t = int(interval_ms * self.miss_factor)
+        return max(self.min_timeout_ms, min(self.max_timeout_ms, t))
+
+    def update(
+        self,
+        confirm_adverts: Optional[int] = None,
+        min_timeout_ms: Optional[int] = None,
+        max_timeout_ms: Optional[int] = None,
+        rssi_alpha: Optional[float] = None,
+        interval_alpha: Optional[float] = None,
+        min_rssi: Optional[int] = None,
+    ):
+        """Apply the given changes (None = keep), clamped to usable values."""
+        if confirm_adverts is not None:
+            self.confirm_adverts = max(1, int(confirm_adverts))
+        if max_timeout_ms is not None:
+            self.max_timeout_ms = max(1, int(max_timeout_ms))
+        if min_timeout_ms is not None:
+            self.min_timeout_ms = max(1, int(min_timeout_ms))
+        if self.min_timeout_ms > self.max_timeout_ms:
+            self.min_timeout_ms = self.max_timeout_ms
+        if rssi_alpha is not None:
+            self.rssi_alpha = min(1.0, max(0.01, float(rssi_alpha)))
+        if interval_alpha is not None:
+            self.interval_alpha = min(1.0, max(0.01, float(interval_alpha)))
+        if min_rssi is not None:
+            self.min_rssi = max(-128, min(0, int(min_rssi)))
+
+
+class PresenceScopes:
+    """
+    Which PresenceSettings each tile is filtered with.
+
+    The scanner is shared, so a backend that configured presence for every
+    tile would override every other field. The default settings cover the
+    tiles nobody claimed (the single-field app); a scope, one per arena
+    (see arenas.ScannerLease), owns the squares it maps with settings of
+    its own. by_tile is indexed by tile, like TileRegistry.slots.
+    """
+
+    def __init__(self, max_index: int = MAX_TILE_INDEX):
+        self.default = PresenceSettings()
+        self.by_tile: List[PresenceSettings] = [self.default] * (max_index + 1)
+        self._scopes: Dict[str, Tuple[List[int], PresenceSettings]] = {}
+
+    def configure(self, scope: Optional[str] = None, squares=None, **changes):
+        """
+        Update the default settings (scope None), or `scope`'s settings and,
+        if given, the squares it owns. A new scope starts from the default.
+        """
+        if scope is None:
+            self.default.update(**changes)
+            return
+        old_squares, settings = self._scopes.get(scope, ([], None))
+        if settings is None:
+            settings = replace(self.default)
+        settings.update(**changes)
+        owned = old_squares if squares is None else sorted({int(sq) for sq in squares})
+        self._scopes[scope] = (owned, settings)
+        self._rebuild()
+
+    def clear(self, scope: str):
+        """Hand `scope`'s squares back to the default settings."""
+        if self._scopes.pop(scope, None) is not None:
+            self._rebuild()
+
+    def _rebuild(self):
+        by_tile = [self.default] * len(self.by_tile)
+        for owned, settings in self._scopes.values():
+            for sq in owned:
+                if 0 <= sq < len(by_tile):
+                    by_tile[sq] = settings
+        self.by_tile = by_tile
+
+    def to_dict(self) -> dict:
+        return {
+            "default": asdict(self.default),
+            "scopes": {name: [owned, asdict(settings)] for name, (owned, settings) in self._scopes.items()},
+        }
+
+    def load(self, data: dict):
+        """Replace everything with a to_dict() taken elsewhere (e.g. the game process)."""
+        for name, value in data["default"].items():
+            setattr(self.default, name, value)
+        self._scopes = {
+            name: (list(owned), PresenceSettings(**settings)) for name, (owned, settings) in data["scopes"].items()
+        }
+        self._rebuild()
+
+
+class TileSlot:
+    """
+    Latest known state of one CS-NN tile.
+
+    Slots are preallocated by TileRegistry and updated in place for every
+    advertisement, so the radio callback path does not build new objects.
+    """
+    __slots__ = (
+        "index",
+        "name",
+        "address",
+        "rssi",
+        "last_seen",
+        "team_char",
+        "player_id",
+        "strength",
+        "manufacturer_data",
+        "cb_count",
+        "last_gap_ms",
+        "in_use",
+        "counted",
+        "rssi_avg",
+        "interval_ms",
+        "candidate_team",
+        "candidate_count",
+        "deadline",
+        "adapter",
+        "rssi_by_adapter",
+    )
+
+    def __init__(self, index: int):
+        self.index = index
+        self.name = f"{_TILE_PREFIX}{index:02d}"
+        self.reset()
+
+    def reset(self):
+        self.address = ""
+        self.rssi = 0
+        self.last_seen = 0
+        self.team_char = "N"
+        self.player_id = ""
+        self.strength = 0
+        self.manufacturer_data = ""
+        self.cb_count = 0
+        self.last_gap_ms: Optional[int] = None
+        self.in_use = False
+        # team char currently included in the registry counters,
+        # None once the tile has aged out
+        self.counted: Optional[str] = None
+        self.rssi_avg = 0.0
+        self.interval_ms: Optional[float] = None
+        # pending team change, see PresenceSettings.confirm_adverts
+        self.candidate_team: Optional[str] = None
+        self.candidate_count = 0
+        # expiry heap entry currently in force, 0 = none
+        self.deadline = 0
+        # HCI adapter of the last accepted advert; adapter -> (rssi, ms) heard
+        self.adapter = 0
+        self.rssi_by_adapter: Dict[int, Tuple[int, int]] = {}
+
+
+class TileRegistry:
+    """
+    Fixed table of TileSlot objects, one per CS-NN index.
+
+    `active` lists the indices seen at least once, in first-seen order, so
+    readers only walk tiles that actually exist on the field.
+
+    Each advert goes through the presence filter (see PresenceSettings):
+    smoothed RSSI, advert interval estimate, and debounced team changes.
+    update() and expire() take the per-tile settings (PresenceScopes.by_tile).
+
+    Red/blu/mag counters are kept up to date as adverts arrive and as tiles
+    age out, instead of being recounted on every query:
+      - `totals` covers every present tile
+      - square groups (one per control point, keyed by its square ids) are
+        created on first query and then maintained the same way
+      - ageing uses a min-heap of (deadline_ms, index); `slot.deadline` is
+        the live entry, anything else popped is stale and skipped. A popped
+        live entry whose tile was seen again is pushed back with its new
+        deadline; a new entry is only added early when the tile's timeout
+        shrinks (its advert interval got shorter)
+    """
+
+    def __init__(self, max_index: int = MAX_TILE_INDEX):
+        self.slots: List[TileSlot] = [TileSlot(i) for i in range(max_index + 1)]
+        self.active: List[int] = []
+        self.totals: List[int] = [0, 0, 0]
+        self._expiry: List[tuple] = []
+        self._groups: Dict[tuple, List[int]] = {}
+        self._groups_by_square: Dict[int, List[List[int]]] = {}
+
+    def get(self, index: int) -> Optional[TileSlot]:
+        if 0 <= index < len(self.slots):
+            return self.slots[index]
+        return None
+
+    def update(
+        self,
+        address: str,
+        rssi: int,
+        advert: TileAdvert,
+        now_ms: int,
+        presence_by_tile: List[PresenceSettings],
+        adapter: int = 0,
+    ) -> Optional[TileSlot]:
+        index = advert.index
+        slot = self.get(index)
+        if slot is None:
+            return None
+        presence = presence_by_tile[index]
+
+        if slot.in_use:
+            gap = now_ms - slot.last_seen
+            slot.last_gap_ms = gap
+            slot.rssi_avg += presence.rssi_alpha * (rssi - slot.rssi_avg)
+            if gap > 0:
+                # a long absence is not an advert interval
+                gap = min(gap, presence.max_timeout_ms)
+                if slot.interval_ms is None:
+                    slot.interval_ms = float(gap)
+                else:
+                    slot.interval_ms += presence.interval_alpha * (gap - slot.interval_ms)
+        else:
+            slot.in_use = True
+            slot.rssi_avg = float(rssi)
+            self.active.append(index)
+
+        slot.address = address
+        slot.rssi = rssi
+        slot.last_seen = now_ms
+        slot.team_char = advert.team_char
+        slot.player_id = advert.player_id
+        slot.strength = advert.strength
+        slot.manufacturer_data = advert.raw
+        slot.cb_count += 1
+        slot.adapter = adapter
+        slot.rssi_by_adapter[adapter] = (rssi, now_ms)
+
+        if slot.rssi_avg < presence.min_rssi:
+            # heard, but too far off to be on the square
+            if slot.counted is not None:
+                self._drop(slot)
+            return slot
+
+        self._filter_team(slot, advert.team_char, now_ms, presence)
+
+        if slot.counted is not None:
+            deadline = now_ms + presence.timeout_ms(slot.interval_ms) + 1
+            if deadline < slot.deadline:
+                self._push_deadline(slot, deadline)
+        return slot
+
+    def merge_duplicate(
+        self,
+        address: str,
+        rssi: int,
+        advert: TileAdvert,
+        now_ms: int,
+        adapter: int,
+        window_ms: int = DEDUP_WINDOW_MS,
+    ) -> bool:
+        """
+        If this is the advert just accepted from another adapter (same
+        address and payload, within window_ms), fold it into that one: keep
+        the best RSSI and note what this adapter heard. True if it was.
+        """
+        slot = self.get(advert.index)
+        if (
+            slot is None
+            or not slot.in_use
+            or slot.adapter == adapter
+            or slot.address != address
+            or slot.manufacturer_data != advert.raw
+            or abs(now_ms - slot.last_seen) > window_ms
+        ):
+            return False
+        slot.rssi_by_adapter[adapter] = (rssi, now_ms)
+        if rssi > slot.rssi:
+            slot.rssi = rssi
+        return True
+
+    def _push_deadline(self, slot: TileSlot, deadline: int):
+        slot.deadline = deadline
+        heapq.heappush(self._expiry, (deadline, slot.index))
+
+    def _filter_team(self, slot: TileSlot, team_char: str, now_ms: int, presence: PresenceSettings):
+        if slot.counted is None:
+            # arriving (or back after ageing out): no reason to wait
+            slot.candidate_team = None
+            slot.candidate_count = 0
+            self._push_deadline(slot, now_ms + presence.timeout_ms(slot.interval_ms) + 1)
+            self._apply(slot.index, team_char, 1)
+            slot.counted = team_char
+            return
+
+        if team_char == slot.counted:
+            slot.candidate_team = None
+            slot.candidate_count = 0
+            return
+
+        if team_char == slot.candidate_team:
+            slot.candidate_count += 1
+        else:
+            slot.candidate_team = team_char
+            slot.candidate_count = 1
+
+        if slot.candidate_count >= presence.confirm_adverts:
+            self._apply(slot.index, slot.counted, -1)
+            self._apply(slot.index, team_char, 1)
+            slot.counted = team_char
+            slot.candidate_team = None
+            slot.candidate_count = 0
+
+    def _apply(self, index: int, team_char: str, sign: int):
+        delta = _TEAM_DELTAS.get(team_char)
+        if delta is None:
+            return
+        dr, db, dm = delta
+        totals = self.totals
+        totals[0] += sign * dr
+        totals[1] += sign * db
+        totals[2] += sign * dm
+        for counts in self._groups_by_square.get(index, ()):
+            counts[0] += sign * dr
+            counts[1] += sign * db
+            counts[2] += sign * dm
+
+    def _drop(self, slot: TileSlot):
+        self._apply(slot.index, slot.counted, -1)
+        slot.counted = None
+        slot.candidate_team = None
+        slot.candidate_count = 0
+        slot.deadline = 0
+
+    def expire(self, now_ms: int, presence_by_tile: List[PresenceSettings]):
+        """Drop tiles that missed their presence timeout from the counters."""
+        heap = self._expiry
+        while heap and heap[0][0] <= now_ms:
+            deadline, index = heapq.heappop(heap)
+            slot = self.slots[index]
+            if slot.counted is None or deadline != slot.deadline:
+                continue
+            timeout = presence_by_tile[index].timeout_ms(slot.interval_ms)
+            if now_ms - slot.last_seen > timeout:
+                self._drop(slot)
+            else:
+                self._push_deadline(slot, slot.last_seen + timeout + 1)
+
+    def counts_for_squares(self, square_ids) -> List[int]:
+        """[red, blu, mag] over the given squares (unclamped)."""
+        key = tuple(sorted(square_ids))
+        counts = self._groups.get(key)
+        if counts is None:
+            counts = self._add_group(key)
+        return counts
+
+    def _add_group(self, key: tuple) -> List[int]:
+        if len(self._groups) >= MAX_SQUARE_GROUPS:
+            # mappings changed a lot; start over rather than grow forever
+            self._groups.clear()
+            self._groups_by_square.clear()
+
+        counts = [0, 0, 0]
+        for index in key:
+            slot = self.get(index)
+            if slot is None:
+                continue
+            delta = _TEAM_DELTAS.get(slot.counted)
+            if delta is not None:
+                counts[0] += delta[0]
+                counts[1] += delta[1]
+                counts[2] += delta[2]
+            self._groups_by_square.setdefault(index, []).append(counts)
+
+        self._groups[key] = counts
+        return counts
+
+    def clear(self):
+        for index in self.active:
+            self.slots[index].reset()
+        self.active.clear()
+        self.totals = [0, 0, 0]
+        self._expiry.clear()
+        self._groups.clear()
+        self._groups_by_square.clear()
+
+
+class AdapterStats:
+    """Adverts heard by one HCI adapter, for the debug page and coverage checks."""
+
+    __slots__ = ("index", "adverts", "duplicates", "tiles", "rate_per_s", "_window_start", "_window_count")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.adverts = 0
+        # adverts another adapter had already delivered
+        self.duplicates = 0
+        self.tiles: set = set()
+        self.rate_per_s = 0.0
+        self._window_start: Optional[int] = None
+        self._window_count = 0
+
+    def record(self, tile_index: int, now_ms: int, duplicate: bool):
+        self.adverts += 1
+        if duplicate:
+            self.duplicates += 1
+        self.tiles.add(tile_index)
+
+        if self._window_start is None:
+            self._window_start = now_ms
+        self._window_count += 1
+        elapsed = now_ms - self._window_start
+        if elapsed >= RATE_WINDOW_MS:
+            self.rate_per_s = self._window_count * 1000.0 / elapsed
+            self._window_start = now_ms
+            self._window_count = 0
+
+    def to_dict(self, now_ms: int) -> dict:
+        # an adapter that went quiet has no current rate
+        quiet = self._window_start is None or now_ms - self._window_start > 2 * RATE_WINDOW_MS
+        return {
+            "adapter": f"hci{self.index}",
+            "adverts": self.adverts,
+            "unique": self.adverts - self.duplicates,
+            "duplicates": self.duplicates,
+            "adverts_per_s": 0.0 if quiet else round(self.rate_per_s, 1),
+            "tiles_heard": len(self.tiles),
+        }
+
 
 class EnhancedBLEScanner:
     _CS_PREFIX = "CS-"
     _PLAYER_PREFIX = "PT-"
 
 
-    def __init__(self, clock: Clock, linux_adapter_index: int = 1):
+    def __init__(
+        self,
+        clock: Clock,
+        linux_adapter_index: int = 1,
+        log: Optional[BleLog] = None,
+        source: Optional[AdvertSource] = None,
+        adapters: Optional[List[int]] = None,
+    ):
         """
-        linux_adapter_index: HCI index for bleson (0 -> hci0, 1 -> hci1, etc.).
+        linux_adapter_index: HCI index for bleson (0 -> hci0, 1 -> hci1, etc.),
+                only used with a source; see `adapters` for the radio.
+        adapters: HCI indices to scan on at once; defaults to BP_BLE_ADAPTERS
+                (see resolve_adapters), i.e. every USB dongle plugged in.
+                Their streams are merged and de-duplicated.
+        log: diagnostics sink; defaults to BleLog() (INFO, no per-advert prints).
+        source: synthetic/replay stand-in for the radio (see ble_sources);
+                defaults to whatever BP_BLE_SOURCE names, else the real adapter.
         """
         self.clock = clock
-        self.devices: Dict[str, dict] = {}
-        self.fresh_window_ms = FRESH_WINDOW_MS
+        self.log = log if log is not None else BleLog()
+        self.tiles = TileRegistry()
+        self.presence_scopes = PresenceScopes()
+        # station default; arenas get their own, see configure_presence()
+        self.presence = self.presence_scopes.default
 
         # Common state
         self._lock = threading.Lock()
         self._scanning: bool = False
 
+        # Radio threads only append to this queue (deque append/popleft are
+        # thread-safe); readers drain it into the registry under self._lock,
+        # so the game loop never waits on a radio callback.
+        self._pending: deque = deque(maxlen=INGEST_QUEUE_SIZE)
+        self.ingest_dropped: int = 0
+
+        # Opt-in raw capture (BP_BLE_CAPTURE=<dir>), see ble_capture
+        self.recorder: Optional[CaptureRecorder] = capture_recorder_from_env()
+
+        # Radio stand-in; when set, the bleson/Bleak paths are never touched
+        self._source: Optional[AdvertSource] = source if source is not None else advert_source_from_env()
+
         # Platform split
         self._is_windows = (sys.platform == "win32")
 
@@ -131,17 +854,55 @@ class EnhancedBLEScanner:
         self._thread_loop: Optional[asyncio.AbstractEventLoop] = None
 
         # ---------------- Linux (Bleson) bits ----------------
-        self._linux_adapter_index = pick_usb_hci_index()
-        self._linux_adapter = None
-        self._linux_observer: Optional["Observer"] = None
-
-        # DEBUG: track last callback time per address for gap measurement
-        self._last_cb_time_by_addr: Dict[str, int] = {}
-        self._cb_count_by_addr: Dict[str, int] = {}
+        if self._source is not None:
+            self._linux_adapter_indices = [linux_adapter_index]
+        elif adapters is not None:
+            self._linux_adapter_indices = list(adapters) or [0]
+        else:
+            self._linux_adapter_indices = resolve_adapters(os.environ.get(BLE_ADAPTERS_ENV, "usb"))
+        self._linux_adapter_index = self._linux_adapter_indices[0]
+        # (hci index, adapter, observer) for every adapter currently open
+        self._linux_open: List[tuple] = []
+
+        # merged ingest: per-adapter counters, cross-adapter duplicates dropped
+        self.adapter_stats: Dict[int, AdapterStats] = {}
+        self.dedup_window_ms = DEDUP_WINDOW_MS
+
+        # for /metrics: every tile's advert gaps (children cached by tile index)
+        self.gap_histogram = Histogram(
+            "bp_ble_advert_gap_seconds", "Time between accepted adverts of one tile", ("tile",), GAP_BUCKETS
+        )
+        self._gap_by_tile: Dict[int, object] = {}
 
-        if self._is_windows:
+        if self._source is not None:
+            self.log.info(f"using {self._source.name} advert source instead of the radio")
+        elif self._is_windows:
             self._start_windows_thread()
 
+    @property
+    def fresh_window_ms(self) -> int:
+        """Longest a silent tile still counts as present."""
+        return self.presence.max_timeout_ms
+
+    @fresh_window_ms.setter
+    def fresh_window_ms(self, value: int):
+        self.presence.max_timeout_ms = int(value)
+
+    def configure_presence(self, scope: Optional[str] = None, squares=None, **changes):
+        """
+        Update presence filter parameters (from GameOptions/ThreeCPOptions),
+        see PresenceSettings.update() for the names. With a scope (an arena's
+        ScannerLease passes its own) only the squares that scope owns are
+        affected; without one, the station default for unclaimed tiles.
+        """
+        with self._lock:
+            self.presence_scopes.configure(scope, squares, **changes)
+
+    def clear_presence(self, scope: str):
+        """Forget a scope's presence settings (its arena was removed)."""
+        with self._lock:
+            self.presence_scopes.clear(scope)
+
     # ======================================================================
     # WINDOWS PATH (Bleak)
     # ======================================================================
@@ -151,7 +912,7 @@ class EnhancedBLEScanner:
             return
 
         if BleakScanner is None:
-            print("[BLE] Bleak not available on Windows; scanner disabled.")
+            self.log.warn("Bleak not available on Windows; scanner disabled.")
             return
 
         def _runner():
@@ -163,7 +924,7 @@ class EnhancedBLEScanner:
 
         self._thread = threading.Thread(target=_runner, daemon=True)
         self._thread.start()
-        print("[BLE] Windows scanner thread started")
+        self.log.info("Windows scanner thread started")
 
     async def _windows_scanner_main(self):
         self._scanner = BleakScanner(detection_callback=self._bleak_callback)
@@ -174,9 +935,9 @@ class EnhancedBLEScanner:
                     try:
                         await self._scanner.start()
                         self._scanning = True
-                        print("[BLE] (win) started scanning")
+                        self.log.info("(win) started scanning")
                     except Exception as e:
-                        print(f"[BLE] (win) error starting scan: {e!r}")
+                        self.log.warn(f"(win) error starting scan: {e!r}")
                         self._scanning = False
                         await asyncio.sleep(1.0)
 
@@ -184,12 +945,12 @@ class EnhancedBLEScanner:
                     try:
                         await self._scanner.stop()
                     except Exception as e:
-                        print(f"[BLE] (win) error stopping scan: {e!r}")
+                        self.log.warn(f"(win) error stopping scan: {e!r}")
                     self._scanning = False
-                    print("[BLE] (win) stopped scanning")
+                    self.log.info("(win) stopped scanning")
 
             except Exception as e:
-                print(f"[BLE] (win) main loop error: {e!r}")
+                self.log.warn(f"(win) main loop error: {e!r}")
 
             await asyncio.sleep(0.2)
 
@@ -212,16 +973,15 @@ class EnhancedBLEScanner:
                     mfg_ascii = data_bytes.hex()
                 break
 
-        tile_id, logical_name = self._extract_tile_from_mfg(mfg_ascii)
-        if tile_id is None:
+        advert = decode_tile_advert(mfg_ascii)
+        if advert is None:
             # Not one of ours
             return
 
         self._record_observation(
             address=address,
-            logical_name=logical_name,
             rssi=rssi,
-            mfg_ascii=mfg_ascii,
+            advert=advert,
             now_ms=current_time,
         )
 
@@ -248,14 +1008,15 @@ class EnhancedBLEScanner:
         except Exception:
             return ""
 
-    def _bleson_callback(self, advertisement):
+    def _bleson_callback(self, advertisement, adapter: int = 0):
         """
-        Linux path: this is called by bleson for each advertisement.
+        Linux path: this is called by bleson for each advertisement, on the
+        observer thread of HCI `adapter`.
 
         We:
           - normalize MAC
           - decode manufacturer data to ASCII
-          - use manufacturer data only to decide if it's ours
+          - decode the tile payload once (also decides if it's ours)
           - record observation
         """
         now_ms = self.clock.milliseconds()
@@ -264,81 +1025,113 @@ class EnhancedBLEScanner:
         rssi = advertisement.rssi
         mfg_ascii = self._decode_mfg_from_bleson(getattr(advertisement, "mfg_data", None))
 
-        tile_id, logical_name = self._extract_tile_from_mfg(mfg_ascii)
-        if tile_id is None:
+        advert = decode_tile_advert(mfg_ascii)
+        if advert is None:
             return  # not our tile
 
         self._record_observation(
             address=address,
-            logical_name=logical_name,
             rssi=rssi,
-            mfg_ascii=mfg_ascii,
+            advert=advert,
             now_ms=now_ms,
+            adapter=adapter,
         )
 
     # ======================================================================
-    # SHARED RECORD / SUMMARY
+    # SOURCE PATH (synthetic / replay)
     # ======================================================================
 
-    def _extract_tile_from_mfg(self, mfg_ascii: str) -> (Optional[str], Optional[str]):
-        if not mfg_ascii:
-            return None, None
-
-        s = mfg_ascii.strip()
-        tile_id = None
-
-        if tile_id is None:
-            parts = s.split(",")
-            if len(parts) >= 2:
-                maybe_tile = parts[0].strip().upper()
-                if maybe_tile.startswith(_TILE_PREFIX):
-                    tile_id = maybe_tile
-
-        if tile_id is None:
-            return None, None
+    def _source_callback(self, address: str, rssi: int, mfg_ascii: str, adapter: int = 0):
+        """AdvertSource sink: same decode + record as the radio callbacks."""
+        advert = decode_tile_advert(mfg_ascii)
+        if advert is None:
+            return
+        self._record_observation(
+            address=address.lower(),
+            rssi=rssi,
+            advert=advert,
+            now_ms=self.clock.milliseconds(),
+            adapter=adapter,
+        )
 
-        logical_name = tile_id  # what we show as "name"
-        return tile_id, logical_name
+    # ======================================================================
+    # SHARED RECORD / SUMMARY
+    # ======================================================================
 
     def _record_observation(
         self,
         address: str,
-        logical_name: str,
         rssi: int,
-        mfg_ascii: str,
+        advert: TileAdvert,
         now_ms: int,
+        adapter: int = 0,
     ):
         """
-        Update self.devices for a single adv from a specific MAC.
-        Also logs gaps and cb_count for debugging.
+        Queue a single decoded adv from a specific MAC, heard on HCI `adapter`.
+
+        Runs on the radio thread: no lock, no registry work. The observation
+        is applied by the next process_pending() (every read calls it).
         """
-        prev = self._last_cb_time_by_addr.get(address)
-        cb_count = self._cb_count_by_addr.get(address, 0) + 1
-        self._cb_count_by_addr[address] = cb_count
-
-        if prev is not None:
-            gap = now_ms - prev
-            print(
-                f"[BLE] cb addr={address} name={logical_name} "
-                f"gap={gap:4d}ms rssi={rssi:4d} mf='{mfg_ascii}'"
-            )
-        else:
-            print(
-                f"[BLE] first cb addr={address} name={logical_name} "
-                f"rssi={rssi:4d} mf='{mfg_ascii}'"
-            )
+        pending = self._pending
+        if len(pending) == INGEST_QUEUE_SIZE:
+            self.ingest_dropped += 1
+        pending.append((address, rssi, advert, now_ms, adapter))
+
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record(address, rssi, advert.raw, adapter=adapter)
+
+    def set_recorder(self, recorder: Optional[CaptureRecorder]):
+        """Start (or with None, stop) capturing every observation to disk."""
+        old, self.recorder = self.recorder, recorder
+        if recorder is not None:
+            recorder.start()
+        if old is not None and old is not recorder:
+            old.close()
+
+    def process_pending(self) -> int:
+        """Apply all queued observations in one batch; returns how many."""
+        with self._lock:
+            return self._drain_pending()
 
-        self._last_cb_time_by_addr[address] = now_ms
+    def _drain_pending(self) -> int:
+        """Caller holds self._lock."""
+        pending = self._pending
+        tiles = self.tiles
+        log = self.log
+        presence_by_tile = self.presence_scopes.by_tile
+        applied = 0
 
-        with self._lock:
-            self.devices[address] = {
-                "name": logical_name,
-                "rssi": rssi,
-                "address": address,
-                "manufacturer_data": mfg_ascii,
-                "last_seen": now_ms,
-                "cb_count": cb_count,
-            }
+        stats = self.adapter_stats
+        window = self.dedup_window_ms
+        gap_by_tile = self._gap_by_tile
+
+        while True:
+            try:
+                address, rssi, advert, now_ms, adapter = pending.popleft()
+            except IndexError:
+                break
+
+            duplicate = tiles.merge_duplicate(address, rssi, advert, now_ms, adapter, window)
+            adapter_stats = stats.get(adapter)
+            if adapter_stats is None:
+                adapter_stats = stats[adapter] = AdapterStats(adapter)
+            adapter_stats.record(advert.index, now_ms, duplicate)
+            applied += 1
+            if duplicate:
+                continue
+
+            slot = tiles.update(address, rssi, advert, now_ms, presence_by_tile, adapter)
+            if slot is not None:
+                if slot.cb_count > 1:
+                    gaps = gap_by_tile.get(slot.index)
+                    if gaps is None:
+                        gaps = gap_by_tile[slot.index] = self.gap_histogram.labels(slot.name)
+                    gaps.observe(slot.last_gap_ms / 1000.0)
+                # gaps and cb_count are kept on the slot; see BleLog for output
+                log.advert(now_ms, address, advert.name, rssi, slot.last_gap_ms, advert.raw)
+
+        return applied
 
     # ======================================================================
     # PUBLIC API: start/stop
@@ -348,33 +1141,56 @@ class EnhancedBLEScanner:
         """
         On Windows: tell the Bleak thread to start.
         On Linux:   open adapter and start a bleson.Observer.
+        With an AdvertSource: start it instead.
         """
+        if self._source is not None:
+            if not self._scanning:
+                self._source.start(self._source_callback)
+                self._scanning = True
+                self.log.info(f"({self._source.name}) scanning started")
+            return
+
         if self._is_windows:
             self._want_scan = True
             return
 
-        # Linux / bleson
+        # Linux / bleson: one Observer per adapter, all feeding the same queue
         if self._scanning:
             return
 
         if get_provider is None or Observer is None:
-            print("[BLE] bleson not available; Linux scanning disabled.")
+            self.log.warn("bleson not available; Linux scanning disabled.")
             return
 
         provider = get_provider()
-        adapter = provider.get_adapter(self._linux_adapter_index)
-        adapter.open()
+        for index in self._linux_adapter_indices:
+            try:
+                adapter = provider.get_adapter(index)
+                adapter.open()
+                observer = Observer(adapter)
+                observer.on_advertising_data = functools.partial(self._bleson_callback, adapter=index)
+                observer.start()
+            except Exception as e:
+                self.log.warn(f"(linux/bleson) could not scan on hci{index}: {e!r}")
+                continue
+            self._linux_open.append((index, adapter, observer))
 
-        observer = Observer(adapter)
-        observer.on_advertising_data = self._bleson_callback
-        observer.start()
+        if not self._linux_open:
+            self.log.warn("(linux/bleson) no adapter could be opened")
+            return
 
-        self._linux_adapter = adapter
-        self._linux_observer = observer
         self._scanning = True
-        print(f"[BLE] (linux/bleson) scanning started on hci{self._linux_adapter_index}")
+        opened = ", ".join(f"hci{index}" for index, _, _ in self._linux_open)
+        self.log.info(f"(linux/bleson) scanning started on {opened}")
 
     async def stop_scanning(self):
+        if self._source is not None:
+            if self._scanning:
+                self._source.stop()
+                self._scanning = False
+                self.log.info(f"({self._source.name}) scanning stopped")
+            return
+
         if self._is_windows:
             self._want_scan = False
             return
@@ -383,189 +1199,123 @@ class EnhancedBLEScanner:
         if not self._scanning:
             return
 
-        try:
-            if self._linux_observer is not None:
-                self._linux_observer.stop()
-        except Exception as e:
-            print(f"[BLE] (linux/bleson) error stopping observer: {e!r}")
-
-        try:
-            if self._linux_adapter is not None:
-                self._linux_adapter.close()
-        except Exception as e:
-            print(f"[BLE] (linux/bleson) error closing adapter: {e!r}")
+        for index, adapter, observer in self._linux_open:
+            try:
+                observer.stop()
+            except Exception as e:
+                self.log.warn(f"(linux/bleson) error stopping observer on hci{index}: {e!r}")
+            try:
+                adapter.close()
+            except Exception as e:
+                self.log.warn(f"(linux/bleson) error closing hci{index}: {e!r}")
 
-        self._linux_observer = None
-        self._linux_adapter = None
+        closed = ", ".join(f"hci{index}" for index, _, _ in self._linux_open)
+        self._linux_open = []
         self._scanning = False
-        print(f"[BLE] (linux/bleson) scanning stopped on hci{self._linux_adapter_index}")
+        self.log.info(f"(linux/bleson) scanning stopped on {closed}")
 
     # ======================================================================
     # READ METHODS / GAME INTEGRATION
     # ======================================================================
 
     def get_devices_summary(self) -> dict:
+        device_list = self._snapshot_devices()
+        return {
+            "scanning": self._scanning_flag(),
+            "device_count": len(device_list),
+            "devices": device_list,
+            "ingest_dropped": self.ingest_dropped,
+            "capture": self.recorder.get_stats() if self.recorder is not None else None,
+            "adapters": self.get_adapter_stats(),
+        }
+
+    def get_adapter_stats(self) -> List[dict]:
+        """Per-adapter advert counts and rates, one entry per HCI adapter heard from."""
+        now = self.clock.milliseconds()
         with self._lock:
+            self._drain_pending()
+            return [self.adapter_stats[i].to_dict(now) for i in sorted(self.adapter_stats)]
+
+    def collect_metrics(self) -> List[Metric]:
+        """Scrape-time /metrics families for this scanner, see scanner_metrics()."""
+        return scanner_metrics(self._snapshot_devices(), self.get_adapter_stats(), self.ingest_dropped) + [
+            self.gap_histogram
+        ]
+
+    def get_devices_snapshot(self) -> (List[dict], bool):
+        """(devices, scanning) pair used by the 3CP/AD debug summaries."""
+        return self._snapshot_devices(), self._scanning_flag()
+
+    def _scanning_flag(self) -> bool:
+        if self._is_windows and self._source is None:
+            return self._want_scan
+        return self._scanning
+
+    def _snapshot_devices(self) -> List[dict]:
+        with self._lock:
+            self._drain_pending()
             current_time = self.clock.milliseconds()
+            presence_by_tile = self.presence_scopes.by_tile
             device_list = []
-            for address, info in self.devices.items():
-                age = int(current_time - info["last_seen"])
+            for index in self.tiles.active:
+                slot = self.tiles.slots[index]
+                presence = presence_by_tile[index]
                 device_list.append(
                     {
-                        "name": info["name"],
-                        "rssi": info["rssi"],
-                        "address": address,
-                        "last_seen_ms": age,
-                        "manufacturer_data": info["manufacturer_data"],
-                        "cb_count": info.get("cb_count", 0),
-                        "last_gap_ms": (
-                            (current_time - self._last_cb_time_by_addr[address])
-                            if address in self._last_cb_time_by_addr
-                            else None
+                        "name": slot.name,
+                        "rssi": slot.rssi,
+                        "rssi_avg": round(slot.rssi_avg, 1),
+                        "address": slot.address,
+                        "last_seen_ms": int(current_time - slot.last_seen),
+                        "manufacturer_data": slot.manufacturer_data,
+                        "cb_count": slot.cb_count,
+                        "last_gap_ms": slot.last_gap_ms,
+                        "interval_ms": (
+                            int(slot.interval_ms) if slot.interval_ms is not None else None
                         ),
+                        "timeout_ms": presence.timeout_ms(slot.interval_ms),
+                        "present_team": slot.counted,
+                        "rssi_by_adapter": {
+                            f"hci{adapter}": rssi
+                            for adapter, (rssi, seen) in sorted(slot.rssi_by_adapter.items())
+                            if current_time - seen <= presence.max_timeout_ms
+                        },
                     }
                 )
 
         device_list.sort(key=lambda d: d["rssi"], reverse=True)
-
-        scanning_flag = self._scanning if not self._is_windows else self._want_scan
-
-        return {
-            "scanning": scanning_flag,
-            "device_count": len(device_list),
-            "devices": device_list,
-        }
+        return device_list
 
     def get_active_tags(self, tag_type=None) -> List[BluetoothTag]:
         # Kept for compatibility; currently unused.
         return []
 
-    # ---------- Helper parsing for team ----------
-
     def get_player_color(self, manufacturer_data: str) -> Optional[str]:
         """
-        Parse manufacturer data from a CS-0X device.
-
-        Expected format:
-            (B|R),CS-NN,PT-XXX,1234
-
-        Returns:
-            'B' or 'R' if valid, otherwise None.
-        """
-        if not manufacturer_data:
-            return None
-
-        parts = manufacturer_data.split(",")
-        if not parts:
-            return None
+        Team char ('R', 'B', 'T', 'N', 'M') from a raw CS-NN payload, or None.
 
-        return  parts[1].strip().upper()
-
-    def _is_control_square(self, info: dict) -> bool:
-        """
-        Decide if this device should count as a tile.
+        Kept for callers holding a raw string; the scanner itself uses the
+        TileAdvert decoded at ingest.
         """
-        name = (info.get("name") or "").strip()
-        if name.startswith(self._CS_PREFIX):
-            return True
-
-        mf = info.get("manufacturer_data") or ""
-        if not mf:
-            return False
-
-        parts = mf.split(",")
-        if len(parts) >= 2:
-            tile_id = parts[0].strip().upper()
-            if tile_id.startswith(self._CS_PREFIX):
-                info["name"] = tile_id
-                return True
-
-        return False
+        advert = decode_tile_advert(manufacturer_data)
+        return advert.team_char if advert is not None else None
 
     # ---------- Player count logic ----------
 
-    def _extract_square_index(self, info: dict) -> Optional[int]:
-        """Try to get CS index (e.g. 'CS-02' -> 2) from name or manufacturer data."""
-        square_idx = None
-
-        # First try the device name
-        name = (info.get("name") or "").strip().upper()
-        if name.startswith(self._CS_PREFIX):
-            try:
-                square_idx = int(name.split("-")[1])
-            except Exception:
-                square_idx = None
-
-        # If that failed, try the manufacturer data
-        if square_idx is None:
-            mf = info.get("manufacturer_data") or ""
-            parts = mf.split(",")
-            if len(parts) >= 2:
-                tile = parts[1].strip().upper()
-                if tile.startswith(self._CS_PREFIX):
-                    try:
-                        square_idx = int(tile.split("-")[1])
-                    except Exception:
-                        square_idx = None
-
-        return square_idx
-
     def _compute_player_counts(self, wanted_squares: Optional[set[int]] = None) -> Dict[str, int]:
-        red = 0
-        blu = 0
-        mag = 0
+        """
+        Read the registry's running counters. Cost is O(squares requested)
+        plus whatever tiles aged out since the last call.
+        """
         now = self.clock.milliseconds()
-        fresh_ms = self.fresh_window_ms
 
         with self._lock:
-            for _, info in self.devices.items():
-                if not self._is_control_square(info):
-                    # Preserve the warning behavior only for the "all squares" case
-                    if wanted_squares is None:
-                        print(f"Warning: skipping {info.get('name')} ", file=sys.stderr)
-                    continue
-
-                last_seen = info.get("last_seen", 0.0) or 0.0
-                age = now - last_seen
-                if age > fresh_ms:
-                    continue
-
-                # If we're filtering by specific squares, enforce that here
-                if wanted_squares is not None:
-                    square_idx = self._extract_square_index(info)
-                    if square_idx is None or square_idx not in wanted_squares:
-                        continue
-
-                mf = info.get("manufacturer_data") or ""
-                team_letter = self.get_player_color(mf)
-
-                """
-                 Tile Firmware logic
-                       if (bluePresent && redPresent) {
-                         // both switches: keep previous behavior
-                         teamCharAdv = ADV_PRESENCE_VALUE_BOTH;
-                       } else if (bluePresent) {
-                         teamCharAdv = ADV_PRESENCE_VALUE_BLU;
-                       } else if (redPresent) {
-                         teamCharAdv = ADV_PRESENCE_VALUE_RED;
-                       } else if (magPresent) {
-                         // magnet-only presence: team unknown
-                         teamCharAdv = ADV_PRESENCE_VALUE_MAG;
-                       } else {
-                         teamCharAdv = ADV_PRESENCE_VALUE_NONE;
-                       }
-
-                 :return:
-                 """
-                if team_letter == "B":
-                    blu += 1
-                elif team_letter == "R":
-                    red += 1
-                elif team_letter == "M":
-                    mag += 1
-                elif team_letter == "T":
-                    blu += 1
-                    red += 1
+            self._drain_pending()
+            self.tiles.expire(now, self.presence_scopes.by_tile)
+            if wanted_squares is None:
+                red, blu, mag = self.tiles.totals
+            else:
+                red, blu, mag = self.tiles.counts_for_squares(wanted_squares)
 
         red = min(red, MAX_PLAYERS_PER_TEAM)
         blu = min(blu, MAX_PLAYERS_PER_TEAM)
@@ -582,6 +1332,35 @@ class EnhancedBLEScanner:
         return self._compute_player_counts(wanted_squares=wanted)
 
 
+def scanner_metrics(devices: List[dict], adapters: List[dict], ingest_dropped: int) -> List[Metric]:
+    """
+    Per tile and per adapter advert counts and rates, built from a devices
+    summary so EnhancedBLEScanner and ProcessBLEScanner report the same way.
+    A tile's rate is 1000 / its advert interval while it is fresh, else 0.
+    """
+    tile_total = Counter("bp_ble_tile_adverts_total", "Adverts accepted from a tile", ("tile",))
+    tile_rate = Gauge("bp_ble_tile_adverts_per_second", "Current advert rate of a tile", ("tile",))
+    for dev in devices:
+        tile_total.labels(dev["name"]).inc(dev["cb_count"])
+        interval = dev["interval_ms"]
+        fresh = dev["last_seen_ms"] <= dev["timeout_ms"]
+        tile_rate.labels(dev["name"]).set(1000.0 / interval if fresh and interval else 0.0)
+
+    adapter_total = Counter("bp_ble_adapter_adverts_total", "Tile adverts heard by an HCI adapter", ("adapter",))
+    adapter_dups = Counter(
+        "bp_ble_adapter_duplicates_total", "Adverts another adapter had already delivered", ("adapter",)
+    )
+    adapter_rate = Gauge("bp_ble_adapter_adverts_per_second", "Advert rate of an HCI adapter", ("adapter",))
+    for a in adapters:
+        adapter_total.labels(a["adapter"]).inc(a["adverts"])
+        adapter_dups.labels(a["adapter"]).inc(a["duplicates"])
+        adapter_rate.labels(a["adapter"]).set(a["adverts_per_s"])
+
+    dropped = Counter("bp_ble_ingest_dropped_total", "Adverts dropped because the ingest queue was full")
+    dropped.inc(ingest_dropped)
+    return [tile_total, tile_rate, adapter_total, adapter_dups, adapter_rate, dropped]
+
+
 # ======================================================================
 # Stand-alone CLI test harness
 # ======================================================================
@@ -592,14 +1371,18 @@ class _MonotonicClock(Clock):
         return int(time.monotonic() * 1000)
 
 
-async def _cli_main(adapter_index: int = 1):
+async def _cli_main(adapters: Optional[List[int]] = None):
     """
     Runs a simple loop printing scanner status every second.
     On Windows: uses Bleak.
-    On Linux:   uses bleson on hci<adapter_index>.
+    On Linux:   uses bleson on the given hci indices (default: BP_BLE_ADAPTERS).
     """
     clock = _MonotonicClock()
-    scanner = EnhancedBLEScanner(clock, linux_adapter_index=adapter_index)
+    scanner = EnhancedBLEScanner(
+        clock,
+        log=BleLog(level=BleLogLevel.DEBUG, advert_interval_ms=0),
+        adapters=adapters,
+    )
 
     print("[BLE TEST] Starting scanner… (Ctrl+C to stop)")
     await scanner.start_scanning()
@@ -615,6 +1398,9 @@ async def _cli_main(adapter_index: int = 1):
             print(f"[BLE TEST] scanning={summary['scanning']}  "
                   f"device_count={summary['device_count']}")
             print(f"[BLE TEST] players: RED={counts['red']}  BLU={counts['blu']}")
+            for a in summary["adapters"]:
+                print(f"[BLE TEST] {a['adapter']}: {a['adverts_per_s']:6.1f}/s  "
+                      f"unique={a['unique']}  dup={a['duplicates']}  tiles={a['tiles_heard']}")
 
             for dev in summary["devices"]:
                 name = dev["name"]
@@ -635,15 +1421,16 @@ async def _cli_main(adapter_index: int = 1):
 
 
 if __name__ == "__main__":
-    idx = 1
+    # python ble_scanner.py [hci index ...]
+    indices = None
     if len(sys.argv) >= 2:
         try:
-            idx = int(sys.argv[1])
+            indices = [int(a.replace("hci", "")) for a in sys.argv[1:]]
         except ValueError:
             pass
 
     try:
-        asyncio.run(_cli_main(adapter_index=idx))
+        asyncio.run(_cli_main(adapters=indices))
     except RuntimeError:
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(_cli_main(adapter_index=idx))
+        loop.run_until_complete(_cli_main(adapters=indices))
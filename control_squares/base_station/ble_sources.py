@@ -0,0 +1,318 @@
+"""
+Advertisement sources that stand in for the radio.
+
+EnhancedBLEScanner normally listens with bleson (Linux) or Bleak (Windows).
+Given an AdvertSource instead, it starts/stops that source and ingests
+whatever it emits through the same decode + _record_observation path, so
+the whole stack (presence filter, backends, pages) can be load-tested on a
+laptop with no HCI adapter:
+
+  SyntheticAdvertSource  generated CS-NN tiles at a set rate, loss and RSSI noise
+  ReplayAdvertSource     a recorded capture played back at 1x or faster
+
+Pick one without touching code via the BP_BLE_SOURCE environment variable,
+see advert_source_from_spec():
+
+  BP_BLE_SOURCE=synthetic:tiles=40,interval_ms=50,loss=0.1
+  BP_BLE_SOURCE=replay:field_capture.txt,speed=10,loop=1
+
+Captures keep the adapter each advert was heard on, and replay hands it to
+the sink, so a multi-dongle capture is de-duplicated the way it was live.
+"""
+
+import heapq
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ble_capture import is_capture_file, iter_capture
+
+# sink(address, rssi, manufacturer_ascii[, adapter]); adapter (an HCI
+# index) is only passed by sources that emulate or replay several dongles
+AdvertSink = Callable[..., None]
+
+# longest a source thread sleeps, so stop() is noticed promptly
+_MAX_SLEEP_S = 0.05
+
+
+class AdvertSource:
+    """Base class: emits adverts to a sink from its own thread between start() and stop()."""
+
+    name = "source"
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.emitted = 0
+
+    def start(self, sink: AdvertSink) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(sink,), name=f"ble-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, sink: AdvertSink) -> None:
+        raise NotImplementedError
+
+
+class SyntheticAdvertSource(AdvertSource):
+    """
+    Virtual tiles advertising "CS-NN,<team>,<player>,0" every interval_ms
+    (+/- jitter), each advert lost with probability `loss`, RSSI drawn from
+    N(rssi_mean, rssi_sd). Team chars cycle through `teams` by tile and can
+    be changed while running with set_team(). `noise_ratio` adds that many
+    foreign (non-tile) adverts per tile advert, like phones near the field.
+    With adapters > 1 every advert is offered to that many virtual dongles,
+    each losing it independently, as the scanner's multi-adapter fan-in sees.
+    """
+
+    name = "synthetic"
+
+    def __init__(
+        self,
+        tiles: Union[int, Iterable[int]] = 10,
+        interval_ms: float = 100.0,
+        jitter: float = 0.1,
+        loss: float = 0.0,
+        rssi_mean: float = -65.0,
+        rssi_sd: float = 4.0,
+        teams: str = "RB",
+        noise_ratio: float = 0.0,
+        seed: Optional[int] = None,
+        adapters: int = 1,
+    ):
+        super().__init__()
+        self.adapters = max(1, int(adapters))
+        indices = list(range(tiles)) if isinstance(tiles, int) else list(tiles)
+        self.interval_s = max(0.001, interval_ms / 1000.0)
+        self.jitter = max(0.0, min(0.9, jitter))
+        self.loss = max(0.0, min(1.0, loss))
+        self.rssi_mean = rssi_mean
+        self.rssi_sd = rssi_sd
+        self.noise_ratio = max(0.0, noise_ratio)
+        self._rng = random.Random(seed)
+        self.teams: Dict[int, str] = {
+            idx: (teams[n % len(teams)] if teams else "N") for n, idx in enumerate(indices)
+        }
+        self._addresses = {idx: f"5a:00:00:00:{(idx >> 8) & 0xFF:02x}:{idx & 0xFF:02x}" for idx in indices}
+        self._heap: List[Tuple[float, int]] = []
+        self.lost = 0
+
+    def set_team(self, index: int, team_char: str) -> None:
+        """Change what tile `index` reports from its next advert on."""
+        if index in self.teams:
+            self.teams[index] = team_char
+
+    def schedule(self, now_s: float) -> None:
+        """Stagger every tile's first advert over one interval from now_s."""
+        self._heap = [(now_s + self._rng.random() * self.interval_s, idx) for idx in self.teams]
+        heapq.heapify(self._heap)
+
+    def emit_due(self, now_s: float, sink: AdvertSink) -> float:
+        """Emit every advert due by now_s; return when the next one is due."""
+        heap = self._heap
+        rng = self._rng
+        while heap and heap[0][0] <= now_s:
+            due, idx = heap[0]
+            step = self.interval_s * (1.0 + rng.uniform(-self.jitter, self.jitter))
+            heapq.heapreplace(heap, (due + step, idx))
+
+            payload = f"CS-{idx:02d},{self.teams[idx]},PT-{idx:03d},0"
+            heard = False
+            for adapter in range(self.adapters):
+                if rng.random() < self.loss:
+                    self.lost += 1
+                    continue
+                rssi = int(round(rng.gauss(self.rssi_mean, self.rssi_sd)))
+                if self.adapters > 1:
+                    sink(self._addresses[idx], rssi, payload, adapter)
+                else:
+                    sink(self._addresses[idx], rssi, payload)
+                self.emitted += 1
+                heard = True
+            if not heard:
+                continue
+
+            noise = self.noise_ratio
+            while noise > 0 and rng.random() < noise:
+                sink(f"7e:00:00:00:00:{rng.randrange(256):02x}", rssi - 20, "PHONE")
+                noise -= 1.0
+        return heap[0][0] if heap else now_s + self.interval_s
+
+    def _run(self, sink: AdvertSink) -> None:
+        self.schedule(time.monotonic())
+        while not self._stop.is_set():
+            next_due = self.emit_due(time.monotonic(), sink)
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                self._stop.wait(min(delay, _MAX_SLEEP_S))
+
+
+# ----------------------------------------------------------------------
+# capture files
+# ----------------------------------------------------------------------
+
+# (t_ms, address, rssi, manufacturer_ascii, adapter)
+CaptureRecord = Tuple[int, str, int, str, int]
+
+
+def write_capture_text(path: str, records: Iterable[tuple]) -> int:
+    """
+    Write records as 't_ms,address,rssi,payload' lines (payload may contain
+    commas). A record's optional 5th field, the adapter, is written as an
+    'address%N' suffix when it isn't 0.
+    """
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for t_ms, address, rssi, payload, *rest in records:
+            adapter = int(rest[0]) if rest else 0
+            where = f"{address}%{adapter}" if adapter else address
+            f.write(f"{int(t_ms)},{where},{int(rssi)},{payload}\n")
+            n += 1
+    return n
+
+
+def read_capture_text(path: str) -> Iterator[CaptureRecord]:
+    """Stream records back from write_capture_text(); malformed lines are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(",", 3)
+            if len(parts) < 4:
+                continue
+            address, _, adapter = parts[1].partition("%")
+            try:
+                yield int(parts[0]), address, int(parts[2]), parts[3], int(adapter or 0)
+            except ValueError:
+                continue
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Records from a binary (ble_capture) or text capture file."""
+    if is_capture_file(path):
+        return (
+            (t_us // 1000, address, rssi, payload, adapter)
+            for t_us, address, rssi, payload, adapter in iter_capture(path)
+        )
+    return read_capture_text(path)
+
+
+class ReplayAdvertSource(AdvertSource):
+    """
+    Plays a capture back with its original spacing divided by `speed`
+    (speed <= 0 means as fast as possible). With loop=True it starts over
+    at the end.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.passes = 0
+
+    def _run(self, sink: AdvertSink) -> None:
+        while not self._stop.is_set():
+            self._play_once(sink)
+            self.passes += 1
+            if not self.loop:
+                break
+
+    def _play_once(self, sink: AdvertSink) -> None:
+        started = time.monotonic()
+        first_ms = None
+        for t_ms, address, rssi, payload, adapter in read_capture(self.path):
+            if self._stop.is_set():
+                return
+            if first_ms is None:
+                first_ms = t_ms
+            if self.speed > 0:
+                due = started + (t_ms - first_ms) / 1000.0 / self.speed
+                while True:
+                    delay = due - time.monotonic()
+                    if delay <= 0 or self._stop.wait(min(delay, _MAX_SLEEP_S)):
+                        break
+                if self._stop.is_set():
+                    return
+            if adapter:
+                sink(address, rssi, payload, adapter)
+            else:
+                sink(address, rssi, payload)
+            self.emitted += 1
+
+
+# ----------------------------------------------------------------------
+# configuration
+# ----------------------------------------------------------------------
+
+BLE_SOURCE_ENV = "BP_BLE_SOURCE"
+
+_SYNTHETIC_ARGS = {
+    "tiles": int,
+    "interval_ms": float,
+    "jitter": float,
+    "loss": float,
+    "rssi_mean": float,
+    "rssi_sd": float,
+    "teams": str,
+    "noise_ratio": float,
+    "seed": int,
+    "adapters": int,
+}
+_REPLAY_ARGS = {"speed": float, "loop": lambda v: v.lower() in ("1", "true", "yes")}
+
+
+def _parse_args(items: List[str], allowed: dict) -> dict:
+    kwargs = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in allowed:
+            raise ValueError(f"unknown option {key!r}, expected one of {sorted(allowed)}")
+        kwargs[key] = allowed[key](value.strip())
+    return kwargs
+
+
+def advert_source_from_spec(spec: str) -> Optional[AdvertSource]:
+    """
+    Build a source from 'synthetic[:k=v,...]' or 'replay:<path>[,k=v,...]'.
+    An empty spec (or 'radio') means no source: use the real adapter.
+    """
+    spec = (spec or "").strip()
+    if not spec or spec == "radio":
+        return None
+    kind, _, rest = spec.partition(":")
+    items = [s for s in rest.split(",") if s] if rest else []
+    if kind == "synthetic":
+        return SyntheticAdvertSource(**_parse_args(items, _SYNTHETIC_ARGS))
+    if kind == "replay":
+        if not items:
+            raise ValueError("replay needs a capture path: replay:<path>[,speed=..]")
+        return ReplayAdvertSource(items[0], **_parse_args(items[1:], _REPLAY_ARGS))
+    raise ValueError(f"unknown BLE source {kind!r}, expected synthetic or replay")
+
+
+def advert_source_from_env() -> Optional[AdvertSource]:
+    spec = os.environ.get(BLE_SOURCE_ENV, "")
+    if not spec:
+        return None
+    try:
+        return advert_source_from_spec(spec)
+    except Exception as e:
+        print(f"[BLE] ignoring {BLE_SOURCE_ENV}={spec!r}: {e}")
+        return None
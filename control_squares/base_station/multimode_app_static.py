@@ -40,6 +40,85 @@ AUDIO_JS = """
         }
       };
 
+      // compact API used by BrowserSoundBus: sounds are referred to by
+      // SOUND_MAP id. The manifest (build_sound_manifest) arrives once via
+      // bp.loadManifest; sounds marked preload are fetched and decoded into
+      // Web Audio buffers up front so bp.play starts without a fetch.
+      window.bp = window.bp || {};
+      bp.sounds = bp.sounds || {};
+      bp.buffers = bp.buffers || {};
+      bp.ctx = bp.ctx || null;
+
+      bp.audioContext = function() {
+        if (!bp.ctx) {
+          const Ctx = window.AudioContext || window.webkitAudioContext;
+          if (!Ctx) return null;
+          bp.ctx = new Ctx();
+        }
+        return bp.ctx;
+      };
+
+      bp.loadManifest = function(manifest) {
+        bp.sounds = manifest.sounds || {};
+        const ctx = bp.audioContext();
+        if (!ctx) return;
+        // decoding works while the context is still suspended (no gesture yet)
+        Object.keys(bp.sounds).forEach(function(id) {
+          const s = bp.sounds[id];
+          if (!s.preload || bp.buffers[id]) return;
+          fetch(s.url, {cache: 'force-cache'})
+            .then(r => r.arrayBuffer())
+            .then(data => new Promise((ok, fail) => ctx.decodeAudioData(data, ok, fail)))
+            .then(buf => { bp.buffers[id] = buf; })
+            .catch(e => console.warn('bp preload failed', id, e));
+        });
+      };
+
+      // call from a user gesture: lets the Web Audio context actually play
+      bp.unlock = function() {
+        const ctx = bp.audioContext();
+        if (ctx && ctx.state === 'suspended') {
+          ctx.resume().catch(e => console.warn('bp unlock failed', e));
+        }
+      };
+
+      bp.src = function(id) {
+        const s = bp.sounds[id];
+        return s ? s.url : null;
+      };
+
+      bp.play = function(id, vol) {
+        const buf = bp.buffers[id];
+        const ctx = bp.ctx;
+        if (buf && ctx && ctx.state === 'running') {
+          try {
+            const src = ctx.createBufferSource();
+            const gain = ctx.createGain();
+            gain.gain.value = vol;
+            src.buffer = buf;
+            src.connect(gain).connect(ctx.destination);
+            src.start();
+            return;
+          } catch (e) {
+            console.warn('bp.play buffer failed', id, e);
+          }
+        }
+        // not preloaded (yet): stream it, the url is browser-cached anyway
+        const url = bp.src(id);
+        if (!url) { console.warn('bp.play unknown id', id); return; }
+        window.bpPlaySound({src: url, volume: vol});
+      };
+
+      bp.music = function(id, vol) {
+        const src = bp.src(id);
+        if (!src) { console.warn('bp.music unknown id', id); return; }
+        window.bpPlayChannel('music', {src: src, volume: vol, loop: true});
+      };
+
+      bp.stopMusic = function() {
+        window.bpStopChannel('music');
+      };
+
       window.bpStopChannel = function(name) {
         try {
           if (!window.bpChannels) return;
@@ -63,6 +142,7 @@ AUDIO_JS = """
           await p;
         }
         try { a.pause(); } catch (e) {}
+        if (window.bp && bp.unlock) bp.unlock();
       }
 
       window.bpInitSound = function(cid) {
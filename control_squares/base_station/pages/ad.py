@@ -1,6 +1,6 @@
 import asyncio
 import sys
-from typing import Any
+from typing import Any, Optional
 
 from nicegui import ui, app, Client
 from sound_bus import browser_sound_bus,attach_sound_opt_in,BrowserSoundBus,CompositeSoundSystem
@@ -8,19 +8,31 @@ from multimode_app_static import *
 
 import aiohttp
 from http_client import get_session, close_session
+from state_bus import state_bus
 from pages.overlays import install_winner_overlay
 
 
 @ui.page('/ad')
 async def ad_game_ui():
     """AD game interface (1–3 control points, BLUE attacks, RED defends)."""
+    await ad_page()
+
+
+async def ad_page(
+    api: str = 'http://localhost:8080/api/ad',
+    topic: str = 'ad',
+    title: str = 'AD MODE',
+    settings_url: Optional[str] = '/settings?mode=ad',
+    sound_bus=None,
+):
+    """AD screen for one backend: its API base url and state_bus topic (see pages.arena)."""
     ui.colors(primary='#1976D2')
 
     # Reuse the same CSS as 3CP for layout
     ui.add_head_html(THREECP_HEAD_HTML)
 
     # Winner overlay for this client/page
-    overlay = install_winner_overlay('ad')
+    overlay = install_winner_overlay(topic)
     open_winner = overlay['open_winner']
 
     # Will hold which CP indices are actually used (0,1,2 for CP1,2,3)
@@ -29,11 +41,11 @@ async def ad_game_ui():
 
     with ui.element('div').classes('bp-root'):
         with ui.element('div').classes('bp-topbar flex justify-between items-center px-4'):
-            attach_sound_opt_in()
+            attach_sound_opt_in(bus=sound_bus)
             # LEFT SIDE
             with ui.row().classes('gap-2 items-center'):
                 ui.button('← HOME', on_click=lambda: ui.navigate.to('/')).props('flat color=white')
-                ui.label('AD MODE').classes('text-white text-lg font-bold')
+                ui.label(title).classes('text-white text-lg font-bold')
 
             # RIGHT SIDE
             with ui.row().classes('gap-3 items-center'):
@@ -41,10 +53,11 @@ async def ad_game_ui():
                 stop_btn = ui.button('STOP').props('color=orange')
                 stop_btn.set_visibility(False)
 
-                ui.button(
-                    'Settings',
-                    on_click=lambda: ui.navigate.to('/settings?mode=ad'),
-                ).props('flat color=white')
+                if settings_url:
+                    ui.button(
+                        'Settings',
+                        on_click=lambda: ui.navigate.to(settings_url),
+                    ).props('flat color=white')
 
                 ui.button(
                     'Debug',
@@ -91,7 +104,7 @@ async def ad_game_ui():
     async def load_ad_config():
         try:
             s = await get_session()
-            async with s.get('http://localhost:8080/api/ad/settings/load') as resp:
+            async with s.get(f'{api}/settings/load') as resp:
                 data = await resp.json()
             mapping = data.get('control_square_mapping', {}) if isinstance(data, dict) else {}
 
@@ -128,11 +141,11 @@ async def ad_game_ui():
     # Event handlers
     async def start_game():
         s = await get_session()
-        await s.post('http://localhost:8080/api/ad/start')
+        await s.post(f'{api}/start')
 
     async def stop_game():
         s = await get_session()
-        await s.post('http://localhost:8080/api/ad/stop')
+        await s.post(f'{api}/stop')
 
     start_btn.on('click', start_game)
     stop_btn.on('click', stop_game)
@@ -153,7 +166,7 @@ async def ad_game_ui():
 
             # enable manual mode
             try:
-                resp_mode = await s.post('http://localhost:8080/api/ad/manual/mode/true')
+                resp_mode = await s.post(f'{api}/manual/mode/true')
                 print(f"[DEBUG] AD UI toggle: manual mode ON -> {resp_mode.status}")
             except Exception as ex:
                 print(f"[DEBUG] AD UI toggle: error enabling manual mode: {ex}")
@@ -161,7 +174,7 @@ async def ad_game_ui():
             # SET this CP/team state explicitly
             try:
                 resp = await s.post(
-                    f'http://localhost:8080/api/ad/manual/{cp_idx}/{team}/{str(on).lower()}'
+                    f'{api}/manual/{cp_idx}/{team}/{str(on).lower()}'
                 )
                 txt = await resp.text()
                 print(
@@ -181,14 +194,7 @@ async def ad_game_ui():
     # UI update loop
     async def update_ui():
         try:
-            while True:
-                try:
-                    s = await get_session()
-                    async with s.get('http://localhost:8080/api/ad/state') as resp:
-                        state = await resp.json()
-                except Exception:
-                    await asyncio.sleep(0.3)
-                    continue
+            async for state in state_bus.subscribe(topic):
 
                 phase = state.get('phase', 'idle')
                 running = state.get('running', False)
@@ -280,7 +286,6 @@ async def ad_game_ui():
                         f'width: {progress}%; background: {bar_color};'
                     )
 
-                await asyncio.sleep(0.1)
         finally:
             await close_session()
 
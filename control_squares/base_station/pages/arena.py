@@ -0,0 +1,67 @@
+import html
+
+from nicegui import ui
+
+from multimode_app_static import ROOT_HEAD_HTML
+from pages.koth import koth_page
+from pages.threecp import threecp_page
+from pages.ad import ad_page
+
+_MODE_PAGES = {
+    'koth': koth_page,
+    '3cp': threecp_page,
+    'ad': ad_page,
+}
+
+
+def _navigate(url: str):
+    return lambda: ui.navigate.to(url)
+
+
+def install_arena_pages(registry):
+    """Register /arenas (list) and /arena/<id> (that arena's game screen) for `registry`."""
+
+    @ui.page('/arenas')
+    def arenas_index():
+        ui.colors(primary='#1976D2')
+        ui.add_head_html(ROOT_HEAD_HTML)
+
+        with ui.element('div').classes('bp-landing'):
+            with ui.element('div').classes('bp-card'):
+                with ui.row().classes('w-full justify-between items-center mb-2'):
+                    ui.html('<div class="bp-title">🏟️ Arenas</div>', sanitize=False)
+                    ui.button('← HOME', on_click=lambda: ui.navigate.to('/')).props('flat color=white')
+
+                summaries = registry.get_summary()
+                if not summaries:
+                    ui.label('No arenas yet: POST /api/arenas to add one.').classes('text-white')
+
+                with ui.element('div').classes('bp-mode-grid'):
+                    for info in summaries:
+                        url = f"/arena/{info['arena_id']}"
+                        squares = ', '.join(f'CS-{sq:02d}' for sq in info['squares']) or 'no squares'
+                        with ui.element('div').classes('bp-mode-card').on('click', _navigate(url)):
+                            ui.html(
+                                f'<div class="bp-mode-title">{html.escape(info["name"])}</div>',
+                                sanitize=False,
+                            )
+                            ui.label(f"{info['mode'].upper()} · {info['phase']} · {squares}").classes(
+                                'bp-mode-desc'
+                            )
+
+    @ui.page('/arena/{arena_id}')
+    async def arena_ui(arena_id: str):
+        arena = registry.get(arena_id)
+        if arena is None:
+            ui.label(f'No arena named {arena_id!r}')
+            ui.button('Arenas', on_click=lambda: ui.navigate.to('/arenas'))
+            return
+
+        name = arena.config.name or arena.arena_id
+        await _MODE_PAGES[arena.mode](
+            api=f'http://localhost:8080/api/arena/{arena.arena_id}',
+            topic=arena.topic,
+            title=f'{name.upper()} · {arena.mode.upper()}',
+            settings_url=None,
+            sound_bus=arena.browser_bus,
+        )
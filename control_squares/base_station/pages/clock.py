@@ -12,6 +12,7 @@ from ad_game import ADBackend
 from settings import UnifiedSettingsManager, ThreeCPOptions
 import aiohttp
 from http_client import get_session, close_session
+from state_bus import state_bus
 from pages.overlays import install_winner_overlay
 
 
@@ -97,14 +98,7 @@ async def clock_game_ui():
 
     async def update_ui():
         try:
-            while True:
-                try:
-                    s = await get_session()
-                    async with s.get('http://localhost:8080/api/clock/state') as resp:
-                        state = await resp.json()
-                except Exception:
-                    await asyncio.sleep(0.3)
-                    continue
+            async for state in state_bus.subscribe('clock'):
 
                 running = bool(state.get('running', False))
                 phase = state.get('phase', 'idle')
@@ -144,7 +138,6 @@ async def clock_game_ui():
                 else:
                     status_label.set_text(phase)
 
-                await asyncio.sleep(0.1)
         finally:
             await close_session()
 
@@ -12,6 +12,7 @@ from ad_game import ADBackend
 
 import aiohttp
 from http_client import get_session, close_session
+from state_bus import state_bus
 from pages.overlays import install_winner_overlay
 
 
@@ -102,6 +103,23 @@ def debug_ui(from_page: str = '', admin: str = ''):
             """,
             )
 
+        # BLE LOG CARD
+        with ui.card().classes('w-full p-4'):
+            with ui.row().classes('w-full items-center justify-between mb-2'):
+                ui.label('📡 BLE Log').classes('text-xl font-bold')
+                with ui.row().classes('items-center gap-2'):
+                    ble_log_info = ui.label('').classes('text-sm text-gray-400')
+                    ble_log_level = ui.select(
+                        ['OFF', 'WARN', 'INFO', 'DEBUG'], value='INFO'
+                    ).props('dense outlined').classes('w-32')
+
+            ble_log_box = ui.label('').classes(
+                'w-full bg-gray-50 rounded p-2 text-xs dark:bg-gray-900'
+            ).style(
+                'white-space: pre; font-family: monospace; '
+                'max-height: 240px; overflow: auto;'
+            )
+
         # EVENT LOG CARD
         with ui.card().classes('w-full p-4'):
             with ui.row().classes('w-full items-center justify-between mb-2'):
@@ -134,6 +152,7 @@ def debug_ui(from_page: str = '', admin: str = ''):
 
     session_holder: dict[str, aiohttp.ClientSession | None] = {'session': None}
     last_events: list[str] = []
+    last_ble_log: list[str] = []
 
 
     async def _cleanup(_msg):
@@ -195,6 +214,17 @@ def debug_ui(from_page: str = '', admin: str = ''):
         ble_status.classes('text-gray-400', remove='text-green-400')
         ui.notify('BLE scanning stopped', type='info')
 
+    async def on_ble_log_level(_e):
+        try:
+            s = await get_session()
+            await s.post(
+                f'http://localhost:8080/api/bluetooth/log/level/{ble_log_level.value}'
+            )
+        except Exception as ex:
+            print(f"[debug] ble log level change failed: {ex}")
+
+    ble_log_level.on('update:model-value', on_ble_log_level)
+
     start_scan_btn.on('click', start_ble_scan)
     stop_scan_btn.on('click', stop_ble_scan)
 
@@ -213,8 +243,10 @@ def debug_ui(from_page: str = '', admin: str = ''):
         s = await get_session()
 
         try:
-            async with s.get('http://localhost:8080/api/koth/state') as resp:
-                state = await resp.json()
+            state = koth_state['state']
+            # the bus only publishes changed snapshots, so identity is enough
+            if state is not None and state is not koth_state['rendered']:
+                koth_state['rendered'] = state
                 state_display.value = state
                 state_display.update()
 
@@ -268,8 +300,30 @@ def debug_ui(from_page: str = '', admin: str = ''):
                 ble_table.rows = devices
                 ble_table.update()
 
+            async with s.get('http://localhost:8080/api/bluetooth/log') as resp:
+                log_data = await resp.json()
+
+                ble_log_info.set_text(
+                    f"{log_data.get('suppressed', 0)} advert line(s) rate limited"
+                )
+                lines = log_data.get('lines', [])
+                if lines != last_ble_log:
+                    ble_log_box.set_text('\n'.join(reversed(lines)))
+                    last_ble_log[:] = lines
+
         except Exception as e:
             print(f"Debug update error: {e}")
 
+    # KOTH state arrives over the in-process state bus; the 0.25s timer
+    # below renders whatever was published last.
+    koth_state: dict[str, Any] = {'state': None, 'rendered': None}
+
+    async def follow_koth_state():
+        async for state in state_bus.subscribe('koth'):
+            koth_state['state'] = state
+
+    koth_task = asyncio.create_task(follow_koth_state())
+    state_display.on('disconnect', lambda _: koth_task.cancel())
+
     ui.timer(0.25, update_debug_once, once=False)
 
@@ -1,19 +1,32 @@
 import asyncio
+from typing import Optional
 from nicegui import ui, app
 from sound_bus import attach_sound_opt_in
 from multimode_app_static import *
 from pages.overlays import install_winner_overlay
 from http_client import get_session, close_session
+from state_bus import state_bus
 
 @ui.page('/koth')
 async def koth_game_ui():
     """KOTH game interface"""
+    await koth_page()
+
+
+async def koth_page(
+    api: str = 'http://localhost:8080/api/koth',
+    topic: str = 'koth',
+    title: str = 'KOTH MODE',
+    settings_url: Optional[str] = '/settings?mode=koth',
+    sound_bus=None,
+):
+    """KOTH screen for one backend: its API base url and state_bus topic (see pages.arena)."""
     ui.colors(primary='#1976D2')
 
     ui.add_head_html(KOTH_HEAD_HTML)
 
     # Winner overlay for this client/page
-    overlay = install_winner_overlay('koth')
+    overlay = install_winner_overlay(topic)
     open_winner = overlay['open_winner']
 
     with ui.element('div').classes('bp-root'):
@@ -21,7 +34,7 @@ async def koth_game_ui():
         with ui.element('div').classes('bp-topbar'):
             with ui.element('div').classes('bp-topbar-left'):
                 ui.button('← HOME', on_click=lambda: ui.navigate.to('/')).props('flat color=white')
-                ui.label('KOTH MODE').classes('text-white text-lg font-bold')
+                ui.label(title).classes('text-white text-lg font-bold')
 
             with ui.element('div').classes('bp-topbar-center'):
                 blue_toggle = ui.toggle(['B OFF', 'B ON'], value='B OFF').props(
@@ -35,10 +48,11 @@ async def koth_game_ui():
                 stop_btn.set_visibility(False)
 
             with ui.element('div').classes('bp-topbar-right'):
-                attach_sound_opt_in()
-                ui.button(
-                    'Settings', on_click=lambda: ui.navigate.to('/settings?mode=koth')
-                ).props('flat color=white')
+                attach_sound_opt_in(bus=sound_bus)
+                if settings_url:
+                    ui.button(
+                        'Settings', on_click=lambda: ui.navigate.to(settings_url)
+                    ).props('flat color=white')
                 ui.button(
                     'Debug', on_click=lambda: ui.navigate.to('/debug')
                 ).props('flat color=white')
@@ -76,11 +90,11 @@ async def koth_game_ui():
     # Event handlers
     async def start_game():
         s = await get_session()
-        await s.post('http://localhost:8080/api/koth/start')
+        await s.post(f'{api}/start')
 
     async def stop_game():
         s = await get_session()
-        await s.post('http://localhost:8080/api/koth/stop')
+        await s.post(f'{api}/stop')
 
     start_btn.on('click', start_game)
     stop_btn.on('click', stop_game)
@@ -93,14 +107,14 @@ async def koth_game_ui():
             return
         s = await get_session()
         new_val = (red_toggle.value == 'R ON')
-        await s.post(f'http://localhost:8080/api/koth/manual/red/{str(new_val).lower()}')
+        await s.post(f'{api}/manual/red/{str(new_val).lower()}')
 
     async def on_blue_toggle(_e):
         if syncing['flag']:
             return
         s = await get_session()
         new_val = (blue_toggle.value == 'B ON')
-        await s.post(f'http://localhost:8080/api/koth/manual/blu/{str(new_val).lower()}')
+        await s.post(f'{api}/manual/blu/{str(new_val).lower()}')
 
     red_toggle.on('update:model-value', on_red_toggle)
     blue_toggle.on('update:model-value', on_blue_toggle)
@@ -108,14 +122,7 @@ async def koth_game_ui():
     # UI update loop
     async def update_ui():
         try:
-            while True:
-                try:
-                    s = await get_session()
-                    async with s.get('http://localhost:8080/api/koth/state') as resp:
-                        state = await resp.json()
-                except Exception:
-                    await asyncio.sleep(0.3)
-                    continue
+            async for state in state_bus.subscribe(topic):
 
                 phase = state.get('phase', 'idle')
                 running = state.get('running', False)
@@ -123,7 +130,7 @@ async def koth_game_ui():
                 winner = state.get('winner')
 
                 storage = app.storage.user
-                LAST_HANDLED_KEY = 'bp_last_ended_game_koth'
+                LAST_HANDLED_KEY = f'bp_last_ended_game_{topic}'
 
                 # Winner overlay
                 # Track last phase + last game id on this page instance
@@ -212,7 +219,6 @@ async def koth_game_ui():
                 mult = int(cp.get('capture_multiplier', 0) or 0)
                 capture_mult_label.set_text(f"x{mult}" if mult > 0 else '')
 
-                await asyncio.sleep(0.1)
         finally:
             await close_session()
 
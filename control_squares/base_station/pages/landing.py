@@ -132,6 +132,7 @@ def landing_page(kiosk: str = ''):
                     <li><strong>Clock:</strong> Simple round timer with audio cues; no control points.</li>
                     <li><strong>Setup:</strong> Use Bluetooth devices or manual controls (Debug page) to simulate players for KOTH/3CP.</li>
                     <li><strong>Settings:</strong> Configure capture times, game duration, and control square mappings.</li>
+                    <li><strong>Arenas:</strong> Run several fields at once from this base station, each with its own squares and game.</li>
                 </ul>
                 ''',
                     sanitize=False,
@@ -139,4 +140,5 @@ def landing_page(kiosk: str = ''):
 
             with ui.row().classes('w-full justify-center gap-4 mt-4'):
                 ui.button('⚙️ Settings', on_click=lambda: ui.navigate.to('/settings')).props('outline color=white')
+                ui.button('🏟️ Arenas', on_click=lambda: ui.navigate.to('/arenas')).props('outline color=white')
                 ui.button('🔧 Debug', on_click=lambda: ui.navigate.to('/debug')).props('outline color=white')
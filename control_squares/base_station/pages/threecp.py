@@ -1,6 +1,6 @@
 import asyncio
 import sys
-from typing import Any
+from typing import Any, Optional
 
 from nicegui import ui, app, Client
 from sound_bus import browser_sound_bus,attach_sound_opt_in,BrowserSoundBus,CompositeSoundSystem
@@ -11,6 +11,7 @@ from clock_game import ClockBackend
 from ad_game import ADBackend
 import aiohttp
 from http_client import get_session, close_session
+from state_bus import state_bus
 from pages.overlays import install_winner_overlay
 
 # ========================================================================
@@ -20,21 +21,32 @@ from pages.overlays import install_winner_overlay
 @ui.page('/3cp')
 async def threecp_game_ui():
     """3CP game interface with 3 control points"""
+    await threecp_page()
+
+
+async def threecp_page(
+    api: str = 'http://localhost:8080/api/3cp',
+    topic: str = '3cp',
+    title: str = '3CP MODE',
+    settings_url: Optional[str] = '/settings?mode=3cp',
+    sound_bus=None,
+):
+    """3CP screen for one backend: its API base url and state_bus topic (see pages.arena)."""
     ui.colors(primary='#1976D2')
 
     ui.add_head_html(THREECP_HEAD_HTML)
 
     # Winner overlay for this client/page
-    overlay = install_winner_overlay('3cp')
+    overlay = install_winner_overlay(topic)
     open_winner = overlay['open_winner']
 
     with ui.element('div').classes('bp-root'):
         with ui.element('div').classes('bp-topbar flex justify-between items-center px-4'):
-            attach_sound_opt_in()
+            attach_sound_opt_in(bus=sound_bus)
             # LEFT SIDE
             with ui.row().classes('gap-2 items-center'):
                 ui.button('← HOME', on_click=lambda: ui.navigate.to('/')).props('flat color=white')
-                ui.label('3CP MODE').classes('text-white text-lg font-bold')
+                ui.label(title).classes('text-white text-lg font-bold')
 
             # RIGHT SIDE
             with ui.row().classes('gap-3 items-center'):
@@ -42,8 +54,9 @@ async def threecp_game_ui():
                 stop_btn = ui.button('STOP').props('color=orange')
                 stop_btn.set_visibility(False)
 
-                ui.button('Settings', on_click=lambda: ui.navigate.to('/settings?mode=3cp')
-                          ).props('flat color=white')
+                if settings_url:
+                    ui.button('Settings', on_click=lambda: ui.navigate.to(settings_url)
+                              ).props('flat color=white')
 
                 ui.button('Debug', on_click=lambda: ui.navigate.to('/debug')
                           ).props('flat color=white')
@@ -86,11 +99,11 @@ async def threecp_game_ui():
     # Event handlers
     async def start_game():
         s = await get_session()
-        await s.post('http://localhost:8080/api/3cp/start')
+        await s.post(f'{api}/start')
 
     async def stop_game():
         s = await get_session()
-        await s.post('http://localhost:8080/api/3cp/stop')
+        await s.post(f'{api}/stop')
 
     start_btn.on('click', start_game)
     stop_btn.on('click', stop_game)
@@ -112,7 +125,7 @@ async def threecp_game_ui():
 
             # enable manual mode
             try:
-                resp_mode = await s.post('http://localhost:8080/api/3cp/manual/mode/true')
+                resp_mode = await s.post(f'{api}/manual/mode/true')
                 print(f"[DEBUG] 3CP UI toggle: manual mode ON -> {resp_mode.status}")
             except Exception as ex:
                 print(f"[DEBUG] 3CP UI toggle: error enabling manual mode: {ex}")
@@ -120,7 +133,7 @@ async def threecp_game_ui():
             # SET this CP/team state explicitly
             try:
                 resp = await s.post(
-                    f'http://localhost:8080/api/3cp/manual/{cp_idx}/{team}/{str(on).lower()}'
+                    f'{api}/manual/{cp_idx}/{team}/{str(on).lower()}'
                 )
                 txt = await resp.text()
                 print(
@@ -139,14 +152,7 @@ async def threecp_game_ui():
     # UI update loop
     async def update_ui():
         try:
-            while True:
-                try:
-                    s = await get_session()
-                    async with s.get('http://localhost:8080/api/3cp/state') as resp:
-                        state = await resp.json()
-                except Exception:
-                    await asyncio.sleep(0.3)
-                    continue
+            async for state in state_bus.subscribe(topic):
 
                 phase = state.get('phase', 'idle')
                 running = state.get('running', False)
@@ -154,7 +160,7 @@ async def threecp_game_ui():
                 winner = state.get('winner')
 
                 storage = app.storage.user
-                LAST_HANDLED_KEY = 'bp_last_ended_game_3cp'
+                LAST_HANDLED_KEY = f'bp_last_ended_game_{topic}'
 
                 # Winner overlay
                 # - Show once per game for this browser tab.
@@ -237,7 +243,6 @@ async def threecp_game_ui():
 
                     cp_elements[i]['bar_fill'].style(f'width: {progress}%; background: {bar_color};')
 
-                await asyncio.sleep(0.1)
         finally:
             await close_session()
 
@@ -4,11 +4,21 @@ Handles both KOTH and 3CP game settings.
 """
 
 from dataclasses import dataclass, field, asdict
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Callable, Set
+import atexit
 import json
 import os
+import threading
+import time
 from battlepoint_core import GameMode, GameOptions
 
+# written into every settings file; bump and extend _migrate_* on format changes
+SETTINGS_SCHEMA_VERSION = 1
+# saves are coalesced and written this long after the last change
+SETTINGS_WRITE_DELAY_S = 0.5
+# the multimode KOTH file before it was merged into battlepoint_settings.json
+LEGACY_KOTH_FILE = "koth_settings.json"
+
 
 @dataclass
 class ControlSquareMapping:
@@ -62,6 +72,14 @@ class ThreeCPOptions:
     start_delay_seconds: int = 5
     add_time_per_first_capture_seconds: int = 120  # Add 2 minutes when a CP is captured for first time
 
+    # BLE presence filter, see ble_scanner.PresenceSettings
+    presence_confirm_adverts: int = 2
+    presence_min_timeout_ms: int = 300
+    presence_max_timeout_ms: int = 1000
+    presence_rssi_alpha: float = 0.3
+    presence_interval_alpha: float = 0.2
+    presence_min_rssi: int = -128  # RSSI floor; -128 = none
+
     # Control square mappings
     control_square_mapping: ControlSquareMapping = field(default_factory=ControlSquareMapping)
 
@@ -71,6 +89,12 @@ class ThreeCPOptions:
             self.capture_seconds = self.time_limit_seconds - 1
         if self.capture_button_threshold_seconds >= self.capture_seconds:
             self.capture_button_threshold_seconds = self.capture_seconds - 1
+        if self.presence_confirm_adverts < 1:
+            self.presence_confirm_adverts = 1
+        if self.presence_min_timeout_ms > self.presence_max_timeout_ms:
+            self.presence_min_timeout_ms = self.presence_max_timeout_ms
+        self.presence_rssi_alpha = min(1.0, max(0.01, self.presence_rssi_alpha))
+        self.presence_interval_alpha = min(1.0, max(0.01, self.presence_interval_alpha))
 
     def to_dict(self) -> dict:
         return {
@@ -79,6 +103,12 @@ class ThreeCPOptions:
             'time_limit_seconds': self.time_limit_seconds,
             'start_delay_seconds': self.start_delay_seconds,
             'add_time_per_first_capture_seconds': self.add_time_per_first_capture_seconds,
+            'presence_confirm_adverts': self.presence_confirm_adverts,
+            'presence_min_timeout_ms': self.presence_min_timeout_ms,
+            'presence_max_timeout_ms': self.presence_max_timeout_ms,
+            'presence_rssi_alpha': self.presence_rssi_alpha,
+            'presence_interval_alpha': self.presence_interval_alpha,
+            'presence_min_rssi': self.presence_min_rssi,
             'control_square_mapping': self.control_square_mapping.to_dict(),
         }
 
@@ -91,52 +121,215 @@ class ThreeCPOptions:
             time_limit_seconds=data.get('time_limit_seconds', 600),
             start_delay_seconds=data.get('start_delay_seconds', 5),
             add_time_per_first_capture_seconds=data.get('add_time_per_first_capture_seconds', 120),
+            presence_confirm_adverts=data.get('presence_confirm_adverts', 2),
+            presence_min_timeout_ms=data.get('presence_min_timeout_ms', 300),
+            presence_max_timeout_ms=data.get('presence_max_timeout_ms', 1000),
+            presence_rssi_alpha=data.get('presence_rssi_alpha', 0.3),
+            presence_interval_alpha=data.get('presence_interval_alpha', 0.2),
+            presence_min_rssi=data.get('presence_min_rssi', -128),
             control_square_mapping=ControlSquareMapping.from_dict(mapping_data),
         )
 
 
-class UnifiedSettingsManager:
-    """Manages settings for both KOTH and 3CP game modes."""
+class SettingsStore:
+    """
+    In-memory cache in front of the JSON settings files.
+
+    get() reads a file once and then serves the cached dict; put() updates
+    the cache and returns immediately. A writer thread persists dirty files
+    SETTINGS_WRITE_DELAY_S after the last put (so a burst of saves is one
+    write), via temp file + fsync + rename so a power cut leaves either the
+    old or the new file, never half of one. Writes of one path hold that
+    path's lock across temp file and rename, so flush() and the writer
+    thread never share a temp file. Files carry "schema_version"; get()
+    hands the raw dict and its version to `migrate`.
+    """
+
+    def __init__(self, write_delay_s: float = SETTINGS_WRITE_DELAY_S):
+        self.write_delay_s = write_delay_s
+        self._cache: Dict[str, Optional[dict]] = {}
+        # path -> monotonic time of the last put not yet written
+        self._dirty: Dict[str, float] = {}
+        # paths the writer thread has taken but not finished writing
+        self._writing: Set[str] = set()
+        self._path_locks: Dict[str, threading.Lock] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, path: str, migrate: Optional[Callable[[dict, int], dict]] = None) -> Optional[dict]:
+        with self._cond:
+            if path in self._cache:
+                data = self._cache[path]
+                return dict(data) if data is not None else None
+
+        data = self._read(path)
+        if data is not None:
+            version = data.pop('schema_version', 0)
+            if migrate is not None and version < SETTINGS_SCHEMA_VERSION:
+                data = migrate(data, version)
+
+        with self._cond:
+            # a put() that raced with the read wins
+            self._cache.setdefault(path, data)
+            data = self._cache[path]
+        return dict(data) if data is not None else None
+
+    def put(self, path: str, data: dict) -> None:
+        with self._cond:
+            self._cache[path] = dict(data)
+            self._dirty[path] = time.monotonic()
+            self._ensure_thread()
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """Write every pending change now, on the calling thread, including ones the writer has in flight."""
+        with self._cond:
+            pending = set(self._dirty) | self._writing
+            self._dirty.clear()
+        for path in pending:
+            self._write_cached(path)
+
+    def _read(self, path: str) -> Optional[dict]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[SETTINGS] error reading {path}: {e}")
+            return None
+
+    def _write_cached(self, path: str) -> bool:
+        with self._cond:
+            lock = self._path_locks.setdefault(path, threading.Lock())
+        with lock:
+            # read under the path lock, so whichever write runs last writes the newest data
+            with self._cond:
+                data = self._cache.get(path)
+            if data is None:
+                return False
+            out = {'schema_version': SETTINGS_SCHEMA_VERSION, **data}
+            tmp = f"{path}.tmp"
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(out, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+                return True
+            except Exception as e:
+                print(f"[SETTINGS] error writing {path}: {e}")
+                return False
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="settings-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [p for p, t in self._dirty.items() if now - t >= self.write_delay_s]
+                if not due:
+                    wait = min(self._dirty.values()) + self.write_delay_s - now
+                    self._cond.wait(max(0.0, wait))
+                    continue
+                for p in due:
+                    del self._dirty[p]
+                self._writing.update(due)
+            for p in due:
+                self._write_cached(p)
+            with self._cond:
+                self._writing.difference_update(due)
+
+
+settings_store = SettingsStore()
+# don't lose a save made just before shutdown
+atexit.register(settings_store.flush)
+
+
+def koth_options_to_dict(options: GameOptions, volume: int = 10, brightness: int = 50) -> dict:
+    return {
+        'mode': options.mode.value,
+        'capture_seconds': options.capture_seconds,
+        'capture_button_threshold_seconds': options.capture_button_threshold_seconds,
+        'time_limit_seconds': options.time_limit_seconds,
+        'start_delay_seconds': options.start_delay_seconds,
+        'presence_confirm_adverts': options.presence_confirm_adverts,
+        'presence_min_timeout_ms': options.presence_min_timeout_ms,
+        'presence_max_timeout_ms': options.presence_max_timeout_ms,
+        'presence_rssi_alpha': options.presence_rssi_alpha,
+        'presence_interval_alpha': options.presence_interval_alpha,
+        'presence_min_rssi': options.presence_min_rssi,
+        'volume': volume,
+        'brightness': brightness,
+    }
+
+
+def koth_options_from_dict(data: dict) -> GameOptions:
+    return GameOptions(
+        mode=GameMode(data.get('mode', 0)),
+        capture_seconds=data.get('capture_seconds', 20),
+        capture_button_threshold_seconds=data.get('capture_button_threshold_seconds', 5),
+        time_limit_seconds=data.get('time_limit_seconds', 60),
+        start_delay_seconds=data.get('start_delay_seconds', 5),
+        presence_confirm_adverts=data.get('presence_confirm_adverts', 2),
+        presence_min_timeout_ms=data.get('presence_min_timeout_ms', 300),
+        presence_max_timeout_ms=data.get('presence_max_timeout_ms', 1000),
+        presence_rssi_alpha=data.get('presence_rssi_alpha', 0.3),
+        presence_interval_alpha=data.get('presence_interval_alpha', 0.2),
+        presence_min_rssi=data.get('presence_min_rssi', -128),
+    )
+
+
+def _migrate_ad(data: dict, version: int) -> dict:
+    # v0 wrapped the options: {"options": {...}}
+    if version < 1 and 'options' in data:
+        return dict(data['options'])
+    return data
+
 
-    def __init__(self, koth_file: str = "koth_settings.json", threecp_file: str = "3cp_settings.json", ad_file: str = "ad_settings.json"):
+class UnifiedSettingsManager:
+    """Manages settings for KOTH, 3CP and AD game modes (through SettingsStore)."""
+
+    def __init__(
+        self,
+        koth_file: str = "battlepoint_settings.json",
+        threecp_file: str = "3cp_settings.json",
+        ad_file: str = "ad_settings.json",
+        store: Optional[SettingsStore] = None,
+    ):
         self.koth_file = koth_file
+        # read once if koth_file doesn't exist yet, so an upgrade keeps the old KOTH settings
+        self.legacy_koth_file = os.path.join(os.path.dirname(koth_file), LEGACY_KOTH_FILE)
         self.threecp_file = threecp_file
         self.ad_file = ad_file
+        self.store = store if store is not None else settings_store
 
     # ========== KOTH Settings ==========
 
     def save_koth_settings(self, options: GameOptions, volume: int = 10, brightness: int = 50) -> bool:
         try:
-            data = {
-                'mode': options.mode.value,
-                'capture_seconds': options.capture_seconds,
-                'capture_button_threshold_seconds': options.capture_button_threshold_seconds,
-                'time_limit_seconds': options.time_limit_seconds,
-                'start_delay_seconds': options.start_delay_seconds,
-                'volume': volume,
-                'brightness': brightness,
-            }
-            with open(self.koth_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            self.store.put(self.koth_file, koth_options_to_dict(options, volume, brightness))
             return True
         except Exception as e:
             print(f"Error saving KOTH settings: {e}")
             return False
 
     def load_koth_settings(self) -> Optional[tuple[GameOptions, int, int]]:
-        if not os.path.exists(self.koth_file):
+        data = self.store.get(self.koth_file)
+        if data is None and self.legacy_koth_file != self.koth_file:
+            data = self.store.get(self.legacy_koth_file)
+            if data is not None:
+                print(f"[SETTINGS] migrating {self.legacy_koth_file} -> {self.koth_file}")
+                self.store.put(self.koth_file, data)
+        if data is None:
             return None
         try:
-            with open(self.koth_file, 'r') as f:
-                data = json.load(f)
-
-            options = GameOptions(
-                mode=GameMode(data.get('mode', 0)),
-                capture_seconds=data.get('capture_seconds', 20),
-                capture_button_threshold_seconds=data.get('capture_button_threshold_seconds', 5),
-                time_limit_seconds=data.get('time_limit_seconds', 60),
-                start_delay_seconds=data.get('start_delay_seconds', 5),
-            )
+            options = koth_options_from_dict(data)
             volume = data.get('volume', 10)
             brightness = data.get('brightness', 50)
             return options, volume, brightness
@@ -148,60 +341,44 @@ class UnifiedSettingsManager:
 
     def save_ad_settings(self, options: ThreeCPOptions) -> bool:
         try:
-            data = {
-                "options": options.to_dict(),
-            }
-
-            with open(self.ad_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
+            self.store.put(self.ad_file, options.to_dict())
             return True
         except Exception as e:
             print(f"[DEBUG] save_ad_settings error: {e}")
             return False
 
     def load_ad_settings(self):
-        if not os.path.exists(self.ad_file):
+        data = self.store.get(self.ad_file, migrate=_migrate_ad)
+        if data is None:
             return None
-
         try:
-
-            with open(self.ad_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            opts = ThreeCPOptions.from_dict(data.get("options", {}))
-            print("[DEBUG] load_ad_settings loaded", opts)
-            return opts
+            return ThreeCPOptions.from_dict(data)
         except Exception as e:
             print(f"[DEBUG] load_ad_settings error: {e}")
             return None
 
+    # ========== 3CP Settings ==========
 
     def save_3cp_settings(self, options: ThreeCPOptions, volume: int = 10, brightness: int = 50) -> bool:
         try:
             data = options.to_dict()
             data['volume'] = volume
             data['brightness'] = brightness
-            print('Saving 3CP settings to', self.threecp_file, 'data=', data)  # optional debug
-
-            with open(self.threecp_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            self.store.put(self.threecp_file, data)
             return True
         except Exception as e:
             print(f"Error saving 3CP settings: {e}")
             return False
 
-
     def load_3cp_settings(self) -> Optional[tuple[ThreeCPOptions, int, int]]:
-        if not os.path.exists(self.threecp_file):
+        data = self.store.get(self.threecp_file)
+        if data is None:
             return None
         try:
-            with open(self.threecp_file, 'r') as f:
-                data = json.load(f)
-
             options = ThreeCPOptions.from_dict(data)
             volume = data.get('volume', 10)
             brightness = data.get('brightness', 50)
             return options, volume, brightness
         except Exception as e:
             print(f"Error loading 3CP settings: {e}")
-            return None
\ No newline at end of file
+            return None
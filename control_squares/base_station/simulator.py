@@ -0,0 +1,473 @@
+"""
+Headless match simulator on a virtual clock.
+
+Drives the real game engines (KothGame, ThreeCPGame, ADGame and their
+ControlPoints/Proximity) exactly the way the backends' update() does, but
+against a SimClock instead of wall time. No scanner, no sound, no UI:
+player presence comes from a script of PresenceSteps, either written by
+hand or drawn by RandomPresence.
+
+The clock jumps straight to the next thing that can happen: a script step,
+a capture completing or decaying, or a round timer running out (the same
+next_event_ms() the TickScheduler wakes backends for). While a team stands
+on a point it is re-sighted at least every button threshold, as the
+scanner would, so its visit stays one visit.
+
+    sim = MatchSimulator("3cp", ThreeCPOptions(capture_seconds=30))
+    stats = sim.run_many(1000, RandomPresence(cps=3, horizon_s=900))
+    print(stats.to_dict())
+
+or from the shell, to compare settings:
+
+    python simulator.py --mode 3cp --matches 2000 --set capture_seconds=20,30,40
+
+--tick-ms N steps a fixed N ms instead, like the live loop's cadence, to
+check what tick quantization does; --workers uses every core.
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from battlepoint_core import (
+    Clock,
+    ControlPoint,
+    EventManager,
+    GameMode,
+    GameOptions,
+    LedMeter,
+    PRESENCE_RUN_GAP_MS,
+    Proximity,
+    Team,
+    team_text,
+)
+from battlepoint_game import KothGame
+from threecp_game import ThreeCPGame
+from ad_game import ADGame
+from settings import ThreeCPOptions
+
+# cadence of the live backend loop (tick_scheduler "running"), for --tick-ms
+LIVE_TICK_MS = 100
+
+
+class SimClock(Clock):
+    """Virtual clock: only moves when advance() is called."""
+
+    def __init__(self, start_ms: int = 0):
+        self._now = start_ms
+
+    def milliseconds(self) -> int:
+        return self._now
+
+    def advance(self, millis: int):
+        self._now += millis
+
+
+class SimEventManager(EventManager):
+    """EventManager that counts instead of printing; cooldowns behave as live."""
+
+    def __init__(self, clock: Clock):
+        super().__init__(clock)
+        self.logged = 0
+        self.captures = 0
+        self.overtime_seen = False
+
+    def _add_event(self, event: str):
+        self.logged += 1
+
+    def control_point_captured(self, team: Team):
+        self.captures += 1
+        super().control_point_captured(team)
+
+    def overtime(self):
+        self.overtime_seen = True
+        super().overtime()
+
+
+@dataclass
+class PresenceStep:
+    """From `at_s` on, `red`/`blu` players stand on control point `cp` (0-based)."""
+    at_s: float
+    cp: int
+    red: int = 0
+    blu: int = 0
+
+
+@dataclass
+class RandomPresence:
+    """
+    Script factory for random presence: every ~mean_hold_s (exponential)
+    each point gets a new crowd, where each team is there with probability
+    presence_p, with 1..max_players players. A dataclass rather than a
+    closure so run_many() can ship it to worker processes.
+    """
+    cps: int = 1
+    horizon_s: float = 600
+    mean_hold_s: float = 10.0
+    presence_p: float = 0.5
+    max_players: int = 3
+
+    def __call__(self, rng: random.Random) -> List[PresenceStep]:
+        steps: List[PresenceStep] = []
+        for cp in range(self.cps):
+            t = 0.0
+            while t < self.horizon_s:
+                red = rng.randint(1, self.max_players) if rng.random() < self.presence_p else 0
+                blu = rng.randint(1, self.max_players) if rng.random() < self.presence_p else 0
+                steps.append(PresenceStep(t, cp, red, blu))
+                t += rng.expovariate(1.0 / self.mean_hold_s)
+        return steps
+
+
+@dataclass
+class MatchResult:
+    winner: Team
+    duration_s: float
+    ticks: int
+    captures: int
+    overtime: bool
+    time_added_s: int = 0
+    # hit max_match_s with no winner (e.g. a 3CP tie, or nobody ever took a KOTH point)
+    stalemate: bool = False
+
+
+@dataclass
+class SimStats:
+    matches: int = 0
+    wins: Dict[str, int] = field(default_factory=dict)
+    stalemates: int = 0
+    overtimes: int = 0
+    duration_s_mean: float = 0.0
+    duration_s_p50: float = 0.0
+    duration_s_p95: float = 0.0
+    duration_s_max: float = 0.0
+    captures_mean: float = 0.0
+    time_added_s_mean: float = 0.0
+    ticks: int = 0
+    wall_s: float = 0.0
+
+    @classmethod
+    def from_results(cls, results: Sequence[MatchResult], wall_s: float) -> "SimStats":
+        n = len(results)
+        stats = cls(matches=n, wall_s=wall_s)
+        if n == 0:
+            return stats
+        for r in results:
+            key = team_text(r.winner)
+            stats.wins[key] = stats.wins.get(key, 0) + 1
+        durations = sorted(r.duration_s for r in results)
+        stats.stalemates = sum(1 for r in results if r.stalemate)
+        stats.overtimes = sum(1 for r in results if r.overtime)
+        stats.duration_s_mean = sum(durations) / n
+        stats.duration_s_p50 = durations[n // 2]
+        stats.duration_s_p95 = durations[min(n - 1, int(n * 0.95))]
+        stats.duration_s_max = durations[-1]
+        stats.captures_mean = sum(r.captures for r in results) / n
+        stats.time_added_s_mean = sum(r.time_added_s for r in results) / n
+        stats.ticks = sum(r.ticks for r in results)
+        return stats
+
+    @property
+    def matches_per_s(self) -> float:
+        return self.matches / self.wall_s if self.wall_s > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "matches": self.matches,
+            "wins": dict(self.wins),
+            "stalemates": self.stalemates,
+            "overtime_rate": round(self.overtimes / self.matches, 3) if self.matches else 0.0,
+            "duration_s": {
+                "mean": round(self.duration_s_mean, 1),
+                "p50": round(self.duration_s_p50, 1),
+                "p95": round(self.duration_s_p95, 1),
+                "max": round(self.duration_s_max, 1),
+            },
+            "captures_mean": round(self.captures_mean, 2),
+            "time_added_s_mean": round(self.time_added_s_mean, 1),
+            "ticks": self.ticks,
+            "wall_s": round(self.wall_s, 3),
+            "matches_per_s": round(self.matches_per_s, 1),
+        }
+
+
+# ----------------------------------------------------------------------
+# per-mode drivers: one match each, mirroring the backend update() order
+# ----------------------------------------------------------------------
+
+class _KothMatch:
+    def __init__(self, options: GameOptions, clock: SimClock, events: SimEventManager):
+        self.proximities = [Proximity(options, clock)]
+        self.control_point = ControlPoint(events, clock)
+        self.game = KothGame()
+        self.game.init(
+            self.control_point, options, events,
+            LedMeter('owner', 20), LedMeter('capture', 20),
+            LedMeter('timer1', 20), LedMeter('timer2', 20),
+            clock,
+        )
+
+    def step(self) -> bool:
+        self.control_point.update(self.proximities[0])
+        self.game.update()
+        return self.game.is_over()
+
+    def next_event_ms(self) -> Optional[int]:
+        times = (self.game.next_event_ms(), self.control_point.next_event_ms())
+        return min((t for t in times if t is not None), default=None)
+
+
+class _MultiPointMatch:
+    """ThreeCPBackend / ADBackend update(), minus the scanner."""
+
+    def __init__(self, game, events: SimEventManager):
+        self.game = game
+        self.events = events
+
+    def step(self) -> bool:
+        game = self.game
+        for i in range(3):
+            game.update_control_point(i, self.proximities[i])
+        winner = game.check_victory()
+        if winner != Team.NOBODY:
+            game._winner = winner
+            self.events.victory(winner)
+            return True
+        if game.check_overtime():
+            self.events.overtime()
+        self.events.ends_in_seconds(game.get_remaining_seconds())
+        return False
+
+    def next_event_ms(self) -> Optional[int]:
+        times = [self.game.next_event_ms()] + [cp.next_event_ms() for cp in self.game.control_points]
+        return min((t for t in times if t is not None), default=None)
+
+
+class _ThreeCPMatch(_MultiPointMatch):
+    def __init__(self, options: ThreeCPOptions, clock: SimClock, events: SimEventManager):
+        super().__init__(ThreeCPGame(), events)
+        self.proximities = [
+            Proximity(GameOptions(capture_button_threshold_seconds=options.capture_button_threshold_seconds), clock)
+            for _ in range(3)
+        ]
+        cps = [ControlPoint(events, clock) for _ in range(3)]
+        self.game.init_3cp(cps, options, events, clock)
+
+
+class _ADMatch(_MultiPointMatch):
+    def __init__(self, options: ThreeCPOptions, clock: SimClock, events: SimEventManager):
+        super().__init__(ADGame(), events)
+        self.proximities = [
+            Proximity(GameOptions(capture_button_threshold_seconds=options.capture_button_threshold_seconds), clock)
+            for _ in range(3)
+        ]
+        mapping = options.control_square_mapping
+        cp_used = [bool(mapping.get_squares_for_cp(n)) for n in (1, 2, 3)]
+        cps = [ControlPoint(events, clock) for _ in range(3)]
+        self.game.init_ad(cps, options, events, clock, cp_used)
+
+
+_MODES = {
+    "koth": (_KothMatch, GameOptions, 1),
+    "3cp": (_ThreeCPMatch, ThreeCPOptions, 3),
+    "ad": (_ADMatch, ThreeCPOptions, 3),
+}
+_MODE_ALIASES = {GameMode.KOTH: "koth", GameMode.CP: "3cp", GameMode.AD: "ad"}
+
+
+class MatchSimulator:
+    """
+    Runs whole matches of one mode/options back to back, as fast as the
+    engines go. Each match starts at virtual t=0 (the start countdown is
+    skipped) and steps from event to event (or every tick_ms, if given)
+    until there is a winner or max_match_s passes. Event stepping skips the
+    per-second "ends in" announcements between events; they don't change
+    the outcome.
+    """
+
+    def __init__(
+        self,
+        mode: Union[str, GameMode],
+        options: Union[GameOptions, ThreeCPOptions, None] = None,
+        tick_ms: Optional[int] = None,
+        max_match_s: Optional[int] = None,
+        quiet: bool = True,
+    ):
+        mode = _MODE_ALIASES.get(mode, mode)
+        if mode not in _MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {sorted(_MODES)}")
+        self.mode = mode
+        self._driver, options_cls, self.cps = _MODES[mode]
+        self.options = options if options is not None else options_cls()
+        self.options.validate()
+        self.tick_ms = max(1, int(tick_ms)) if tick_ms else None
+        # longest jump while someone is on a point: Proximity treats a
+        # longer gap between sightings as the team having left
+        threshold_ms = int(self.options.capture_button_threshold_seconds * 1000)
+        self._sighting_ms = max(1, threshold_ms, PRESENCE_RUN_GAP_MS)
+        self.max_match_s = max_match_s if max_match_s is not None else self._default_max_match_s()
+        self.quiet = quiet
+
+    def _default_max_match_s(self) -> int:
+        limit = self.options.time_limit_seconds
+        if self.mode == "koth":
+            # both team clocks have to run down, plus the fighting in between
+            return 3 * limit
+        return 2 * (limit + 3 * self.options.add_time_per_first_capture_seconds)
+
+    def run(self, script: Sequence[PresenceStep]) -> MatchResult:
+        with contextlib.redirect_stdout(_NULL) if self.quiet else contextlib.nullcontext():
+            return self._run(script)
+
+    def _run(self, script: Sequence[PresenceStep]) -> MatchResult:
+        clock = SimClock()
+        events = SimEventManager(clock)
+        match = self._driver(self.options, clock, events)
+        game = match.game
+        game.start()
+
+        steps = sorted(script, key=lambda s: s.at_s)
+        step_ms = [math.ceil(s.at_s * 1000) for s in steps]
+        next_step = 0
+        counts = [(0, 0)] * self.cps
+        proximities = match.proximities
+        tick_ms = self.tick_ms
+        end_ms = self.max_match_s * 1000
+
+        ticks = 0
+        over = False
+        now = clock.milliseconds()
+        while not over and now < end_ms:
+            if tick_ms:
+                target = now + tick_ms
+            else:
+                next_step_ms = step_ms[next_step] if next_step < len(steps) else None
+                target = self._next_wakeup(match, counts, next_step_ms, now)
+            clock.advance(max(1, min(target, end_ms) - now))
+            now = clock.milliseconds()
+            # whoever was on a point stayed until now
+            for prox, (red, blu) in zip(proximities, counts):
+                prox.update_counts(red, blu)
+            if next_step < len(steps) and step_ms[next_step] <= now:
+                while next_step < len(steps) and step_ms[next_step] <= now:
+                    s = steps[next_step]
+                    if 0 <= s.cp < self.cps:
+                        counts[s.cp] = (s.red, s.blu)
+                    next_step += 1
+                for prox, (red, blu) in zip(proximities, counts):
+                    prox.update_counts(red, blu)
+            over = match.step()
+            ticks += 1
+
+        winner = game.get_winner()
+        return MatchResult(
+            winner=winner,
+            duration_s=clock.milliseconds() / 1000.0,
+            ticks=ticks,
+            captures=events.captures,
+            overtime=events.overtime_seen,
+            time_added_s=getattr(game, "time_added_total", 0),
+            stalemate=winner == Team.NOBODY,
+        )
+
+    def _next_wakeup(self, match, counts, next_step_ms: Optional[int], now: int) -> int:
+        """Earliest virtual time at which stepping `match` can change anything."""
+        times = [next_step_ms, match.next_event_ms()]
+        # presence is re-sighted at every step, so it never lapses in between
+        if any(red or blu for red, blu in counts):
+            times.append(now + self._sighting_ms)
+        return min((t for t in times if t is not None), default=now + self.max_match_s * 1000)
+
+    def run_many(
+        self,
+        matches: int,
+        script_factory: Callable[[random.Random], Sequence[PresenceStep]],
+        seed: int = 0,
+        workers: int = 1,
+    ) -> SimStats:
+        """
+        Run `matches` matches, match i with the script script_factory(rng)
+        draws from an rng seeded by (seed, i). The same seed gives the same
+        scripts however the matches are split across workers, so option sets
+        compared with equal seeds see identical player behaviour. With
+        workers > 1 the factory must be picklable (e.g. RandomPresence).
+        """
+        started = time.perf_counter()
+        if workers <= 1:
+            results = self._run_range(script_factory, seed, 0, matches)
+        else:
+            chunk = -(-matches // workers)
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [
+                    pool.submit(self._run_range, script_factory, seed, start, min(chunk, matches - start))
+                    for start in range(0, matches, chunk)
+                ]
+                results = [r for f in futures for r in f.result()]
+        return SimStats.from_results(results, time.perf_counter() - started)
+
+    def _run_range(self, script_factory, seed: int, start: int, count: int) -> List[MatchResult]:
+        return [
+            self.run(script_factory(random.Random(f"{seed}:{i}")))
+            for i in range(start, start + count)
+        ]
+
+
+class _NullWriter:
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+_NULL = _NullWriter()
+
+
+def _parse_sets(values: List[str]) -> Dict[str, List[int]]:
+    sweeps = {}
+    for item in values:
+        name, _, raw = item.partition("=")
+        sweeps[name] = [int(v) for v in raw.split(",") if v]
+    return sweeps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate BattlePoint matches on a virtual clock")
+    parser.add_argument("--mode", choices=sorted(_MODES), default="koth")
+    parser.add_argument("--matches", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tick-ms", type=int, default=None,
+        help=f"step a fixed tick (the live loop uses {LIVE_TICK_MS}); default: jump from event to event",
+    )
+    parser.add_argument("--mean-hold-s", type=float, default=10.0)
+    parser.add_argument("--presence-p", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=1, help="processes; 0 = one per CPU")
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="OPTION=V1,V2",
+        help="option values to sweep, e.g. capture_seconds=20,30",
+    )
+    args = parser.parse_args(argv)
+
+    _, options_cls, cps = _MODES[args.mode]
+    base = options_cls()
+    combos = [{}]
+    for name, values in _parse_sets(args.set).items():
+        combos = [dict(c, **{name: v}) for c in combos for v in values]
+
+    for overrides in combos:
+        sim = MatchSimulator(args.mode, replace(base, **overrides), tick_ms=args.tick_ms)
+        factory = RandomPresence(cps, sim.max_match_s, args.mean_hold_s, args.presence_p)
+        stats = sim.run_many(args.matches, factory, seed=args.seed, workers=args.workers or os.cpu_count() or 1)
+        print(json.dumps({"mode": args.mode, "options": overrides, **stats.to_dict()}))
+
+
+if __name__ == "__main__":
+    main()
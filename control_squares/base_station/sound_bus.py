@@ -1,13 +1,45 @@
-from nicegui import ui, app, Client
+from nicegui import ui, app, background_tasks, Client
 from starlette.staticfiles import StaticFiles
-from typing import Optional, Callable
+from typing import Callable, Dict, Optional
+import asyncio
+import json
 import random
+import time
+from urllib.parse import parse_qs
 from battlepoint_game import SOUND_MAP  # or adjust import
-from battlepoint_game import SoundSystem
+from battlepoint_game import SoundSystem, build_sound_manifest, SOUND_LATENCY
 # Mount sounds
 from multimode_app_static import AUDIO_JS
 
-app.mount('/sounds', StaticFiles(directory='sounds'), name='sounds')
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with long-lived caching for manifest urls, which carry a
+    ?v= token. Plain urls (battlepoint_app.py, _src_for_id) revalidate
+    instead, so a replaced sound file is picked up.
+    """
+
+    cache_control = 'public, max-age=31536000, immutable'
+    unversioned_cache_control = 'no-cache'
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        response.headers['Cache-Control'] = (
+            self.cache_control if 'v' in query else self.unversioned_cache_control
+        )
+        return response
+
+
+app.mount('/sounds', CachedStaticFiles(directory='sounds'), name='sounds')
+
+# built once at startup; sent inline to each page by install_audio_js()
+SOUND_MANIFEST = build_sound_manifest('sounds', '/sounds')
+
+
+@app.get('/api/sound/manifest')
+async def sound_manifest():
+    return SOUND_MANIFEST
 
 
 class BrowserSoundClient:
@@ -16,10 +48,6 @@ class BrowserSoundClient:
         self.audio = audio
         self.enabled = False
 
-from typing import Dict, Optional
-import random
-
-from nicegui import ui, app, background_tasks, Client  # make sure background_tasks, Client are imported
 
 class BrowserSoundBus:
     def __init__(self, base_url: str = '/sounds'):
@@ -65,67 +93,19 @@ class BrowserSoundBus:
         print(f"[BROWSER_SOUND] set_volume({self.volume})")
 
     def stop(self) -> None:
-        # stop "music" channel on all clients
+        # stop "music" channel on all clients, including ones that have since
+        # disabled sound; pages without install_audio_js() have no `bp`
         print("[BROWSER_SOUND] stop() music")
-        for cid, client in list(self.clients.items()):
-            try:
-                with client:
-                    client.run_javascript("""
-                        (function() {
-                          try {
-                            if (!window.bpChannels) return;
-                            const m = window.bpChannels["music"];
-                            if (m) {
-                              try { m.pause(); m.currentTime = 0; } catch (e) {}
-                              delete window.bpChannels["music"];
-                            }
-                          } catch (e) {
-                            console.error('bp stop music error', e);
-                          }
-                        })();
-                    """)
-            except Exception as e:
-                print(f"[BROWSER_SOUND] error stop() on {cid}: {e}")
-                self.enabled.discard(cid)
+        self._broadcast("window.bp && bp.stopMusic()", list(self.clients))
 
     def play_menu_track(self) -> None:
         if not self._menu_tracks:
             return
         sound_id = random.choice(self._menu_tracks)
-        src = self._src_for_id(sound_id)
-        if not src:
+        if not self._src_for_id(sound_id):
             return
-        vol = self.volume / 30.0
-        print(f"[BROWSER_SOUND] play_menu_track {src}")
-        for cid in list(self.enabled):
-            client = self.clients.get(cid)
-            if not client:
-                self.enabled.discard(cid)
-                continue
-            try:
-                with client:
-                    client.run_javascript(f"""
-                        (function() {{
-                          try {{
-                            window.bpChannels = window.bpChannels || {{}};
-                            const existing = window.bpChannels["music"];
-                            if (existing) {{
-                              try {{ existing.pause(); existing.currentTime = 0; }} catch (e) {{}}
-                            }}
-                            const a = new Audio("{src}");
-                            a.volume = {vol:.3f};
-                            a.loop = true;
-                            a.play().catch(e => console.warn("music blocked", e));
-                            window.bpChannels["music"] = a;
-                          }} catch (e) {{
-                            console.error("music error", e);
-                          }}
-                        }})();
-                    """)
-                print(f"[BROWSER_SOUND] menu -> {cid}")
-            except Exception as e:
-                print(f"[BROWSER_SOUND] error (menu) {cid}: {e}")
-                self.enabled.discard(cid)
+        print(f"[BROWSER_SOUND] play_menu_track {sound_id}")
+        self._broadcast(f"bp.music({sound_id},{self.volume / 30.0:.2f})")
 
     def loop(self, sound_id: int) -> None:
         self.play(sound_id)
@@ -134,34 +114,53 @@ class BrowserSoundBus:
         self.play(sound_id)
 
     def play(self, sound_id: int) -> None:
-        src = self._src_for_id(sound_id)
-        if not src:
+        if not self._src_for_id(sound_id):
+            return
+        print(f"[BROWSER_SOUND] play {sound_id}")
+        self._broadcast(f"bp.play({sound_id},{self.volume / 30.0:.2f})", timed=True)
+
+    def _broadcast(self, js: str, client_ids=None, timed: bool = False) -> None:
+        """
+        Send one short bp.* call to every enabled client (or `client_ids`).
+
+        The player itself is installed once per page (install_audio_js), so
+        each message is a few dozen bytes. Sending happens in a background
+        task when a loop is running, so a dead client is dropped from
+        `enabled` there instead of inside the game tick. With `timed`, the
+        delay until it was sent goes to bp_sound_latency_seconds{output="browser"}.
+        """
+        targets = [
+            (cid, self.clients.get(cid))
+            for cid in (self.enabled if client_ids is None else client_ids)
+        ]
+        if not targets:
+            return
+        triggered = time.monotonic() if timed else None
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._send(js, targets, triggered)
             return
-        vol = self.volume / 30.0
-        print(f"[BROWSER_SOUND] play {sound_id} -> {src}")
+        background_tasks.create(self._send_async(js, targets, triggered), name='bp-sound')
 
-        for cid in list(self.enabled):
-            client = self.clients.get(cid)
-            if not client:
+    async def _send_async(self, js: str, targets, triggered: Optional[float] = None) -> None:
+        self._send(js, targets, triggered)
+
+    def _send(self, js: str, targets, triggered: Optional[float] = None) -> None:
+        for cid, client in targets:
+            if client is None:
                 self.enabled.discard(cid)
                 continue
             try:
                 with client:
-                    client.run_javascript(f"""
-                        (function() {{
-                          try {{
-                            const a = new Audio("{src}");
-                            a.volume = {vol:.3f};
-                            a.play().catch(e => console.warn("audio blocked for {cid}", e));
-                          }} catch (e) {{
-                            console.error("audio error for {cid}", e);
-                          }}
-                        }})();
-                    """)
-                print(f"[BROWSER_SOUND] -> {cid}")
+                    client.run_javascript(js)
             except Exception as e:
                 print(f"[BROWSER_SOUND] error on {cid}: {e}")
                 self.enabled.discard(cid)
+        if triggered is not None:
+            _BROWSER_LATENCY.observe(time.monotonic() - triggered)
+
+_BROWSER_LATENCY = SOUND_LATENCY.labels('browser')
 
 browser_sound_bus = BrowserSoundBus( base_url='/sounds')
 
@@ -175,24 +174,27 @@ app.on_connect(_on_connect)
 app.on_disconnect(_on_disconnect)
 
 
-_audio_js_injected = False
-
-def inject_audio_js_once():
-    global _audio_js_injected
-    if _audio_js_injected:
-        return
-    _audio_js_injected = True
-
-    ui.add_head_html(AUDIO_JS)
+def install_audio_js():
+    """Install the bp.* player on the current page and start preloading sounds."""
+    ui.add_head_html(
+        AUDIO_JS
+        + f"<script>bp.loadManifest({json.dumps(SOUND_MANIFEST)});</script>"
+    )
 
 SILENT_WAV = (
     "data:audio/wav;base64,"
     "UklGRiQAAABXQVZFZm10IBAAAAABAAEAIlYAAESsAAACABAAZGF0YQAAAAA="
 )
 
-def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
+def attach_sound_opt_in(
+    on_enabled: Optional[Callable[[Client], None]] = None,
+    bus: Optional[BrowserSoundBus] = None,
+):
     """Client-side sound gate with real capability check.
 
+    `bus` is the BrowserSoundBus this page listens to (an arena's own bus,
+    see arenas.py); every client is already on the global one.
+
     - If we THINK sound was enabled for this browser, we re-test.
     - If test passes -> mark 'Sound on', enable this client in bus.
     - If not -> show 'Enable sound' button.
@@ -200,6 +202,13 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
     """
 
     client = ui.context.client
+    install_audio_js()
+
+    if bus is None:
+        bus = browser_sound_bus
+    elif client.id not in bus.clients:
+        bus.register_client(client)
+        client.on_disconnect(lambda: bus.unregister_client(client))
 
     # If this browser is marked as kiosk / no browser sound, bail out
     if app.storage.user.get('is_kiosk'):
@@ -207,24 +216,11 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
         app.storage.user['bp_sound_enabled'] = False
         app.storage.user['browser_sound_disabled'] = True
         # make sure bus doesn't think this client is enabled
-        browser_sound_bus.disable_for_client(client.id)
+        bus.disable_for_client(client.id)
 
         # also kill any music already running in this tab
         with client:
-            client.run_javascript("""
-                (function () {
-                  try {
-                    if (!window.bpChannels) return;
-                    const m = window.bpChannels["music"];
-                    if (m) {
-                      try { m.pause(); m.currentTime = 0; } catch (e) {}
-                      delete window.bpChannels["music"];
-                    }
-                  } catch (e) {
-                    console.error('bp kiosk stop music error', e);
-                  }
-                })();
-            """)
+            client.run_javascript("bp.stopMusic()")
 
         return
 
@@ -245,6 +241,7 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
             a.src = "{SILENT_WAV}";
             a.volume = 0.0;
             await a.play();
+            if (window.bp && bp.unlock) bp.unlock();
             return true;
           }} catch (e) {{
             console.warn('bp prime failed', e);
@@ -256,7 +253,7 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
         if ok:
             with client:
                 app.storage.user['bp_sound_enabled'] = True
-                browser_sound_bus.enable_for_client(client.id)
+                bus.enable_for_client(client.id)
 
                 status.set_text('🔊 Sound on')
                 status.style(
@@ -296,6 +293,7 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
             a.src = "{SILENT_WAV}";
             a.volume = 0.0;
             await a.play();
+            if (window.bp && bp.unlock) bp.unlock();
             return true;
           }} catch (e) {{
             console.warn('bp auto-check failed', e);
@@ -306,7 +304,7 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
 
         if ok:
             with client:
-                browser_sound_bus.enable_for_client(client.id, from_auto=True)
+                bus.enable_for_client(client.id, from_auto=True)
 
                 status.set_text('🔊 Sound on')
                 status.style(
@@ -323,7 +321,7 @@ def attach_sound_opt_in(on_enabled: Optional[Callable[[Client], None]] = None):
             # Stored flag is wrong; force explicit click
             with client:
                 app.storage.user['bp_sound_enabled'] = False
-                browser_sound_bus.disable_for_client(client.id)
+                bus.disable_for_client(client.id)
 
                 status.set_text('🔇 Tap to enable sound')
                 status.style('font-size:0.7rem;color:#fdd835;')
@@ -0,0 +1,180 @@
+"""
+In-process publish/subscribe for backend game state.
+
+The game loop publishes one state snapshot per backend per tick and pages
+subscribe to it directly, instead of every open browser GETting
+/api/<mode>/state over loopback. N spectator tablets then cost one
+get_state() per tick, not N HTTP round trips.
+
+Snapshots are shared between all subscribers: treat them as read-only.
+Subscribers only ever see the latest snapshot (a slow page skips
+intermediate ones rather than queueing them). The HTTP /state endpoints
+are unchanged for external clients.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+# get_state_since() rebuilds the backend state at most this often; between
+# rebuilds every poller is answered from the last diff
+STATE_REFRESH_MS = 50
+
+
+class _Topic:
+    __slots__ = ("state", "version", "changed", "subscribers", "closed")
+
+    def __init__(self):
+        self.state: Optional[dict] = None
+        self.version = 0
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.closed = False
+
+
+class StateBus:
+    def __init__(self):
+        self._topics: Dict[str, _Topic] = {}
+
+    def _topic(self, name: str) -> _Topic:
+        topic = self._topics.get(name)
+        if topic is None:
+            topic = _Topic()
+            self._topics[name] = topic
+        return topic
+
+    def has_subscribers(self, name: str) -> bool:
+        topic = self._topics.get(name)
+        return topic is not None and topic.subscribers > 0
+
+    def publish(self, name: str, state: dict) -> None:
+        topic = self._topic(name)
+        topic.state = state
+        topic.version += 1
+        changed = topic.changed
+        topic.changed = asyncio.Event()
+        changed.set()
+
+    def close(self, name: str) -> None:
+        """Forget `name` (e.g. a removed arena); its subscribers' loops end."""
+        topic = self._topics.pop(name, None)
+        if topic is not None:
+            topic.closed = True
+            topic.changed.set()
+
+    def latest(self, name: str) -> Optional[dict]:
+        topic = self._topics.get(name)
+        return topic.state if topic is not None else None
+
+    async def subscribe(self, name: str) -> AsyncIterator[dict]:
+        """
+        Yield each new snapshot of `name` as it is published, starting with
+        the current one if there is one. Runs until the consumer stops or
+        the topic is closed.
+        """
+        topic = self._topic(name)
+        topic.subscribers += 1
+        seen = 0
+        try:
+            while not topic.closed:
+                if topic.version == seen or topic.state is None:
+                    await topic.changed.wait()
+                    continue
+                seen = topic.version
+                yield topic.state
+        finally:
+            topic.subscribers -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            name: {"subscribers": t.subscribers, "version": t.version}
+            for name, t in self._topics.items()
+        }
+
+
+class VersionedState:
+    """
+    Version counter and top-level key diff over successive get_state() dicts.
+
+    `refresh(state)` bumps `version` only if some top-level key changed, and
+    remembers the version at which each key last changed (or disappeared),
+    so `since(v)` can answer any earlier version with just the keys that
+    differ.
+
+    Backends pass a `key` from their state_key(), a cheap fingerprint of
+    what get_state() shows: while it matches the last refresh, `stale(key)`
+    is False and `since()` skips the rebuild altogether.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.state: Dict[str, Any] = {}
+        self._key_versions: Dict[str, int] = {}
+        self._removed: Dict[str, int] = {}
+        self._refreshed_ms: Optional[int] = None
+        self.key: Any = None
+
+    def stale(self, key: Any) -> bool:
+        """True unless `key` is the key of the last refresh (None is always stale)."""
+        return key is None or key != self.key
+
+    def refresh(self, state: dict, key: Any = None) -> bool:
+        self.key = key
+        old = self.state
+        changed = [k for k, v in state.items() if k not in old or old[k] != v]
+        removed = [k for k in old if k not in state]
+        if not changed and not removed:
+            return False
+
+        self.version += 1
+        v = self.version
+        for k in changed:
+            self._key_versions[k] = v
+            self._removed.pop(k, None)
+        for k in removed:
+            self._key_versions.pop(k, None)
+            self._removed[k] = v
+        self.state = state
+        return True
+
+    def since(
+        self,
+        version: int,
+        build: Optional[Callable[[], dict]] = None,
+        now_ms: Optional[int] = None,
+        key: Any = None,
+    ) -> dict:
+        """
+        Changes after `version`:
+          {'version': v, 'unchanged': True}                  nothing new
+          {'version': v, 'full': True, 'state': {...}}       unknown version
+          {'version': v, 'full': False, 'changed': {...}, 'removed': [...]}
+
+        If `build` is given it is called to refresh first, at most once per
+        STATE_REFRESH_MS of `now_ms`, and not at all while `key` is unchanged.
+        """
+        if build is not None and self.stale(key):
+            if (
+                self._refreshed_ms is None
+                or now_ms is None
+                or now_ms - self._refreshed_ms >= STATE_REFRESH_MS
+            ):
+                self.refresh(build(), key)
+                self._refreshed_ms = now_ms
+
+        current = self.version
+        if version <= 0 or version > current:
+            # first poll, or a version from before a restart
+            return {'version': current, 'full': True, 'state': self.state}
+        if version == current:
+            return {'version': current, 'unchanged': True}
+
+        changed = {
+            k: self.state[k]
+            for k, kv in self._key_versions.items()
+            if kv > version
+        }
+        removed = [k for k, kv in self._removed.items() if kv > version]
+        return {'version': current, 'full': False, 'changed': changed, 'removed': removed}
+
+
+state_bus = StateBus()
@@ -3,11 +3,26 @@ BattlePoint Unit Tests
 Following the patterns from platformio_cpp_tests
 """
 
+import asyncio
 import pytest
 from battlepoint_core import get_team_color,team_text_char,game_mode_text, CooldownTimer, BluetoothTag, TagType, EventManager, Team, TeamColor, Proximity, GameOptions, LedMeter,GameMode,team_text,RealClock,ControlPoint
-from battlepoint_game import KothGame,CPGame,ADGame,BaseGame
-from battlepoint_app import EnhancedBLEScanner
+from battlepoint_game import KothGame,BaseGame,SoundCache,AudioMixer,MUSIC_DUCK,AudioWorker,build_sound_manifest
+from threecp_game import ThreeCPGame
+from ad_game import ADGame
+from ble_scanner import EnhancedBLEScanner
+from ble_scanner import decode_tile_advert, BleLog, BleLogLevel, parse_hciconfig, resolve_adapters, PresenceScopes
+from ble_sources import SyntheticAdvertSource, ReplayAdvertSource, write_capture_text, advert_source_from_spec
+from ble_capture import CaptureRecorder, CaptureWriter, iter_capture, read_index
+from state_bus import StateBus, VersionedState
+from tick_scheduler import TickScheduler
+from settings import SettingsStore, UnifiedSettingsManager, ThreeCPOptions, SETTINGS_SCHEMA_VERSION
+from simulator import MatchSimulator, PresenceStep, RandomPresence
+from arenas import ArenaRegistry, ArenaConfig, ScannerLease
+from settings import ControlSquareMapping
+from bench_battlepoint import compare as bench_compare, measure as bench_measure
+from metrics import MetricsRegistry, Histogram, REGISTRY
 from test_stubs import MockEventManager,MockControlPoint, MockClock
+import threading
 import time
 
 
@@ -47,6 +62,13 @@ class _TestProximity:
     def get_blu_count(self):
         return 0
 
+    # no arrival/leave times: ControlPoint credits the whole gap
+    def present_since_ms(self, team):
+        return None
+
+    def present_until_ms(self, team):
+        return None
+
 
 # ---------------------------------------------------------------------------
 # TEAM UTILITY TESTS
@@ -472,227 +494,169 @@ def test_koth_game_ends_after_capture_cppstyle():
 # AD GAME TESTS (mirror C++)
 # ---------------------------------------------------------------------------
 
-def _std_game_options():
-    return GameOptions(
-        mode=GameMode.CP,  # C++ uses CP as "std" for AD/CP tests
+def _std_3cp_options():
+    return ThreeCPOptions(
         time_limit_seconds=20,
         start_delay_seconds=0,
         capture_seconds=5,
         capture_button_threshold_seconds=1,
+        add_time_per_first_capture_seconds=0,
     )
 
 
 def test_ad_game_initial_state_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.AD
-
+    go = _std_3cp_options()
     game = ADGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
-    game.update()  # C++ calls update once
+    game.init_ad(cps, go, em, tc, [True, False, False])
 
     assert not game.is_running()
     assert game.get_winner() == Team.NOBODY
     assert game.get_seconds_elapsed() == 0
     assert game.get_remaining_seconds() == go.time_limit_seconds
-    assert cp.get_owner() == Team.RED  # red defends
-    assert owner.getValue() == 100
-    assert capture.getValue() == 0
+    assert cps[0].get_owner() == Team.RED  # red defends
+    assert cps[1].get_owner() == Team.NOBODY  # unused
+    assert cps[0].blu_capture and not cps[0].red_capture
 
 
 def test_ad_game_keeps_time_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.AD
-
+    go = _std_3cp_options()
     game = ADGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
+    game.init_ad(cps, go, em, tc, [True, False, False])
     game.start()
 
     assert game.get_winner() == Team.NOBODY
     assert game.is_running()
     assert game.get_remaining_seconds() == go.time_limit_seconds
-    assert cp.get_owner() == Team.RED
+    assert cps[0].get_owner() == Team.RED
 
     CAP_TIME = 5
     tc.add_seconds(CAP_TIME)
-    game.update()
 
     assert abs(game.get_seconds_elapsed() - CAP_TIME) <= 1
     assert game.get_remaining_seconds() == go.time_limit_seconds - CAP_TIME
-    assert game.get_accumulated_seconds(Team.RED) == CAP_TIME
-    assert game.get_accumulated_seconds(Team.BLU) == 0
+    assert game.check_victory() == Team.NOBODY
 
 
 def test_ad_game_ends_after_capture_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.AD
-
+    go = _std_3cp_options()
     game = ADGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
+    game.init_ad(cps, go, em, tc, [True, True, False])
     game.start()
 
-    cp.set_owner(Team.BLU)
+    # the second point stays locked until the first falls
+    assert not cps[1].blu_capture
+
+    cps[0].queue_capture(Team.BLU)
     tc.add_seconds(1)
-    game.update()
+    game.update_control_point(0, None)
+    assert cps[1].blu_capture
+    assert game.check_victory() == Team.NOBODY
 
-    assert game.get_winner() == Team.BLU
-    assert not game.is_running()
-    assert owner.getValue() == 100
-    assert cp.get_owner() == Team.BLU
-    assert game.get_remaining_seconds() == 0
+    cps[1].queue_capture(Team.BLU)
+    game.update_control_point(1, None)
+    assert game.check_victory() == Team.BLU
 
 
 def test_ad_game_ends_after_time_limit_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.AD
-
+    go = _std_3cp_options()
     game = ADGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
+    game.init_ad(cps, go, em, tc, [True, False, False])
     game.start()
 
     tc.add_seconds(go.time_limit_seconds + 1)
-    game.update()
 
-    assert game.get_winner() == Team.RED
-    assert not game.is_running()
-    assert owner.getValue() == 100
-    assert cp.get_owner() == Team.RED
     assert game.get_remaining_seconds() == 0
+    assert game.check_victory() == Team.RED
+    assert cps[0].get_owner() == Team.RED
 
 
 # ---------------------------------------------------------------------------
-# CP GAME TESTS (mirror C++)
+# 3CP GAME TESTS (mirror C++)
 # ---------------------------------------------------------------------------
 
 def test_cp_game_initial_state_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.CP
-
-    game = CPGame()
+    go = _std_3cp_options()
+    game = ThreeCPGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
+    game.init_3cp(cps, go, em, tc)
 
     assert not game.is_running()
     assert game.get_winner() == Team.NOBODY
     assert game.get_seconds_elapsed() == 0
     assert game.get_remaining_seconds() == go.time_limit_seconds
-    assert owner.getValue() == 0
-    assert capture.getValue() == 0
+    assert [cp.get_owner() for cp in cps] == [Team.RED, Team.NOBODY, Team.BLU]
+    # only the middle point is open to both teams
+    assert not cps[0].blu_capture and not cps[2].red_capture
+    assert cps[1].red_capture and cps[1].blu_capture
 
 
 def test_cp_game_keeps_time_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.CP
-
-    game = CPGame()
+    go = _std_3cp_options()
+    game = ThreeCPGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
+    game.init_3cp(cps, go, em, tc)
     game.start()
 
     assert game.get_winner() == Team.NOBODY
     assert game.is_running()
-    assert cp.get_owner() == Team.NOBODY
+    assert cps[1].get_owner() == Team.NOBODY
 
     CAP_TIME = 5
     tc.add_seconds(CAP_TIME)
-    cp.set_owner(Team.RED)
-    game.update()
+    cps[1].queue_capture(Team.RED)
+    game.update_control_point(1, None)
 
     assert abs(game.get_seconds_elapsed() - CAP_TIME) <= 1
     assert game.get_remaining_seconds() == go.time_limit_seconds - CAP_TIME
-    assert game.get_accumulated_seconds(Team.RED) == CAP_TIME
-    assert game.get_accumulated_seconds(Team.BLU) == 0
+    assert cps[2].red_capture  # red may now push on to blu's point
+    assert game.check_victory() == Team.NOBODY
 
 
 def test_cp_game_ends_after_time_limit_cppstyle():
-    go = _std_game_options()
-    go.mode = GameMode.CP
-
-    game = CPGame()
+    go = _std_3cp_options()
+    go.add_time_per_first_capture_seconds = 10
+    game = ThreeCPGame()
     tc = MockClock()
-    cp = MockControlPoint()
+    cps = [MockControlPoint() for _ in range(3)]
     em = MockEventManager()
 
-    owner = LedMeter("Owner", 100)
-    capture = LedMeter("Capture", 100)
-    timer1 = LedMeter("Timer1", 100)
-    timer2 = LedMeter("Timer2", 100)
-
-    game.init(cp, go, em, owner, capture, timer1, timer2, tc)
+    game.init_3cp(cps, go, em, tc)
     game.start()
 
-    BLUE_CAP_TIME = 5
-    RED_CAP_TIME = 20
+    cps[1].queue_capture(Team.RED)
+    tc.add_seconds(5)
+    game.update_control_point(1, None)
 
-    cp.set_owner(Team.BLU)
-    tc.add_seconds(BLUE_CAP_TIME)
-    game.update()
+    # first capture of the middle extends the round
+    tc.add_seconds(go.time_limit_seconds - 5)
+    assert game.get_remaining_seconds() == go.add_time_per_first_capture_seconds
+    assert game.check_victory() == Team.NOBODY
 
-    cp.set_owner(Team.RED)
-    tc.add_seconds(RED_CAP_TIME)
-    game.update()
-
-    assert game.get_accumulated_seconds(Team.RED) == RED_CAP_TIME
-    assert game.get_accumulated_seconds(Team.BLU) == BLUE_CAP_TIME
-    assert game.get_winner() == Team.RED
-    assert not game.is_running()
-    assert owner.getValue() == 100
-    assert cp.get_owner() == Team.RED
+    tc.add_seconds(go.add_time_per_first_capture_seconds)
     assert game.get_remaining_seconds() == 0
-    # display meters
-    assert timer2.getValue() == RED_CAP_TIME
-    assert timer1.getValue() == BLUE_CAP_TIME
+    assert game.check_victory() == Team.RED  # two points to one
 
 
 # ---------------------------------------------------------------------------
@@ -817,38 +781,1201 @@ import time
 def test_ble_scanner_counts_from_cs_ads():
     clk = MockClock()
     s = EnhancedBLEScanner(clk)
+    clk.set_time(10000)
 
-    now = time.time()  # fresh timestamp
-
-    with s._lock:
-        s.devices.clear()
-        s.devices["AA:BB:CC:DD:EE:01"] = {
-            'name': 'CS-01',
-            'rssi': -50,
-            'address': 'AA:BB:CC:DD:EE:01',
-            'last_seen': now,
-            'manufacturer_data': 'B,CS-01,PLB-07,999',
-        }
-        s.devices["AA:BB:CC:DD:EE:02"] = {
-            'name': 'CS-02',
-            'rssi': -60,
-            'address': 'AA:BB:CC:DD:EE:02',
-            'last_seen': now,
-            'manufacturer_data': 'R,CS-01,PLR-02,-72',
-        }
-        s.devices["AA:BB:CC:DD:EE:03"] = {
-            'name': 'Random',
-            'rssi': -40,
-            'address': 'AA:BB:CC:DD:EE:03',
-            'last_seen': now,  # value doesn’t matter; name isn’t CS-*
-            'manufacturer_data': 'junk',
-        }
+    s._record_observation(
+        address='aa:bb:cc:dd:ee:01',
+        rssi=-50,
+        advert=decode_tile_advert('CS-01,B,PT-07,999'),
+        now_ms=clk.milliseconds(),
+    )
+    s._record_observation(
+        address='aa:bb:cc:dd:ee:02',
+        rssi=-60,
+        advert=decode_tile_advert('CS-02,R,PT-02,72'),
+        now_ms=clk.milliseconds(),
+    )
 
     counts = s.get_player_counts()
     assert counts['blu'] == 1
     assert counts['red'] == 1
 
+    counts = s.get_player_counts_for_squares([2])
+    assert counts['blu'] == 0
+    assert counts['red'] == 1
+
+    # stale tiles stop counting
+    clk.add_millis(s.fresh_window_ms + 1)
+    counts = s.get_player_counts()
+    assert counts['blu'] == 0
+    assert counts['red'] == 0
+
+def test_ble_scanner_tile_slots_update_in_place():
+    clk = MockClock()
+    s = EnhancedBLEScanner(clk)
+
+    s._record_observation('aa:bb:cc:dd:ee:01', -50, decode_tile_advert('CS-03,N,PT-UNK,0'), 1000)
+    assert s.process_pending() == 1
+    slot = s.tiles.get(3)
+    s._record_observation('aa:bb:cc:dd:ee:01', -45, decode_tile_advert('CS-03,R,PT-01,0'), 1080)
+    assert s.tiles.get(3).cb_count == 1   # queued, not applied yet
+    assert s.process_pending() == 1
+
+    assert s.tiles.get(3) is slot
+    assert s.tiles.active == [3]
+    assert slot.team_char == 'R'
+    assert slot.cb_count == 2
+    assert slot.last_gap_ms == 80
+    assert slot.player_id == 'PT-01'
+
+def test_ble_scanner_queued_adverts_apply_only_on_drain():
+    clk = MockClock()
+    s = EnhancedBLEScanner(clk)
+
+    s._record_observation('aa:bb:cc:dd:ee:01', -50, decode_tile_advert('CS-01,R,PT-01,0'), 1000)
+    s._record_observation('aa:bb:cc:dd:ee:02', -50, decode_tile_advert('CS-02,B,PT-02,0'), 1000)
+    assert len(s._pending) == 2
+    assert s.tiles.active == []          # nothing applied on the radio thread
+    assert s.process_pending() == 2
+    assert len(s._pending) == 0
+    assert sorted(s.tiles.active) == [1, 2]
+
+    # a read drains the queue too
+    s._record_observation('aa:bb:cc:dd:ee:03', -50, decode_tile_advert('CS-03,R,PT-03,0'), 1000)
+    assert 3 not in s.tiles.active
+    counts = s.get_player_counts()
+    assert len(s._pending) == 0
+    assert counts['red'] == 2
+    assert counts['blu'] == 1
+
+def test_decode_tile_advert():
+    adv = decode_tile_advert(' CS-04,b,PT-012,17 ')
+    assert adv.index == 4
+    assert adv.name == 'CS-04'
+    assert adv.team_char == 'B'
+    assert adv.player_id == 'PT-012'
+    assert adv.strength == 17
+
+    assert decode_tile_advert('') is None
+    assert decode_tile_advert('junk') is None
+    assert decode_tile_advert('PT-01,R') is None
+    assert decode_tile_advert('CS-XX,R') is None
+
+def test_ble_scanner_square_counters_follow_ingest_and_expiry():
+    clk = MockClock()
+    s = EnhancedBLEScanner(clk)
+    clk.set_time(1000)
+
+    def advert(payload):
+        s._record_observation('aa:bb:cc:dd:ee:01', -50, decode_tile_advert(payload), clk.milliseconds())
+
+    # group for CP squares [1, 2] exists before any tile is seen
+    assert s.get_player_counts_for_squares([1, 2]) == {'red': 0, 'blu': 0, 'mag': 0}
+
+    advert('CS-01,R,PT-01,0')
+    advert('CS-02,T,PT-02,0')
+    advert('CS-05,M,PT-03,0')
+    assert s.get_player_counts_for_squares([1, 2]) == {'red': 2, 'blu': 1, 'mag': 0}
+    assert s.get_player_counts_for_squares([5]) == {'red': 0, 'blu': 0, 'mag': 1}
+    assert s.get_player_counts() == {'red': 2, 'blu': 1, 'mag': 1}
+
+    # confirmed team change on a tile moves its contribution
+    advert('CS-01,B,PT-01,0')
+    advert('CS-01,B,PT-01,0')
+    assert s.get_player_counts_for_squares([1, 2]) == {'red': 1, 'blu': 2, 'mag': 0}
+
+    # CS-01 keeps advertising, the others age out
+    clk.add_millis(s.fresh_window_ms // 2)
+    advert('CS-01,B,PT-01,0')
+    clk.add_millis(s.fresh_window_ms // 2 + 1)
+    assert s.get_player_counts_for_squares([1, 2]) == {'red': 0, 'blu': 1, 'mag': 0}
+    assert s.get_player_counts() == {'red': 0, 'blu': 1, 'mag': 0}
+
+def test_ble_scanner_presence_hysteresis_and_adaptive_timeout():
+    clk = MockClock()
+    s = EnhancedBLEScanner(clk)
+    s.configure_presence(confirm_adverts=3, min_timeout_ms=300, max_timeout_ms=1000)
+    clk.set_time(1000)
+
+    def advert(team, rssi=-50):
+        s._record_observation('aa:bb:cc:dd:ee:01', rssi, decode_tile_advert(f'CS-01,{team},PT-01,0'), clk.milliseconds())
+        clk.add_millis(50)
+
+    # first advert counts straight away
+    advert('R')
+    assert s.get_player_counts() == {'red': 1, 'blu': 0, 'mag': 0}
+
+    # a single stray advert does not flip the team
+    advert('B')
+    advert('R')
+    advert('B')
+    advert('B')
+    assert s.get_player_counts() == {'red': 1, 'blu': 0, 'mag': 0}
+    advert('B')
+    assert s.get_player_counts() == {'red': 0, 'blu': 1, 'mag': 0}
+
+    # fast advertiser (50ms) -> timeout clamps to the 300ms floor, not 1000ms
+    dev = s.get_devices_summary()['devices'][0]
+    assert dev['timeout_ms'] == 300
+    assert dev['present_team'] == 'B'
+    clk.add_millis(300)
+    assert s.get_player_counts() == {'red': 0, 'blu': 0, 'mag': 0}
+
+    # back after ageing out: counted immediately with the new team
+    advert('R', rssi=-80)
+    assert s.get_player_counts() == {'red': 1, 'blu': 0, 'mag': 0}
+    dev = s.get_devices_summary()['devices'][0]
+    assert -80 < dev['rssi_avg'] < -50
+
+
+def test_ble_scanner_rssi_floor_drops_a_distant_tile():
+    clk = MockClock()
+    s = EnhancedBLEScanner(clk)
+    s.configure_presence(min_rssi=-70, rssi_alpha=1.0)
+    clk.set_time(1000)
+    s._record_observation('aa:bb:cc:dd:ee:01', -60, decode_tile_advert('CS-01,R,PT-01,0'), clk.milliseconds())
+    assert s.get_player_counts()['red'] == 1
+    clk.add_millis(50)
+    s._record_observation('aa:bb:cc:dd:ee:01', -85, decode_tile_advert('CS-01,R,PT-01,0'), clk.milliseconds())
+    assert s.get_player_counts()['red'] == 0
+    assert s.get_devices_summary()['devices'][0]['present_team'] is None
+
+
+def test_arenas_keep_their_own_presence_settings(tmp_path):
+    clk = MockClock()
+    scanner = EnhancedBLEScanner(clk)
+    scanner.configure_presence(confirm_adverts=1)
+    registry = ArenaRegistry(scanner, store=SettingsStore(write_delay_s=0), path=str(tmp_path / 'arenas.json'))
+    slow = _arena_config('slow', 'koth', [1])
+    slow.options['presence_confirm_adverts'] = 3
+    registry.add(slow)
+    fast = _arena_config('fast', '3cp', [10, 11, 12])
+    fast.options['presence_confirm_adverts'] = 2
+    fast.options['presence_rssi_alpha'] = 0.5
+    registry.add(fast)
+
+    by_tile = scanner.presence_scopes.by_tile
+    assert by_tile[1].confirm_adverts == 3
+    assert [by_tile[sq].confirm_adverts for sq in (10, 11, 12)] == [2, 2, 2]
+    assert by_tile[11].rssi_alpha == 0.5
+    assert by_tile[2] is scanner.presence and scanner.presence.confirm_adverts == 1
+
+    # a new mapping moves the arena's settings with it
+    registry.set_mapping('slow', ControlSquareMapping(cp_1_squares=[5]))
+    assert by_tile is not scanner.presence_scopes.by_tile
+    assert scanner.presence_scopes.by_tile[5].confirm_adverts == 3
+    assert scanner.presence_scopes.by_tile[1] is scanner.presence
+
+    # the child process gets the same per-tile settings
+    copy = PresenceScopes()
+    copy.load(scanner.presence_scopes.to_dict())
+    assert [p.confirm_adverts for p in copy.by_tile] == [p.confirm_adverts for p in scanner.presence_scopes.by_tile]
+
+
+def test_ble_log_rate_limits_prints_but_keeps_ring(capsys):
+    log = BleLog(level=BleLogLevel.DEBUG, advert_interval_ms=1000, ring_size=10)
+
+    log.advert(0, 'aa', 'CS-01', -50, None, 'CS-01,R,PT-01,0')   # first: INFO
+    for t in range(100, 1000, 100):
+        log.advert(t, 'aa', 'CS-01', -50, 100, 'CS-01,R,PT-01,0')
+
+    printed = [l for l in capsys.readouterr().out.splitlines() if l.startswith('[BLE]')]
+    assert len(printed) == 2           # first-seen + one rate-limited advert line
+    assert log.suppressed == 8
+    assert len(log.lines(100)) == 10   # ring is full, not rate limited
+
+    log.set_level(BleLogLevel.INFO)
+    log.advert(5000, 'aa', 'CS-01', -50, 100, 'CS-01,R,PT-01,0')
+    assert capsys.readouterr().out == ''
+
 
 
 if __name__ == '__main__':
-    pytest.main([__file__, '-v'])
\ No newline at end of file
+    pytest.main([__file__, '-v'])
+
+
+def test_state_bus_delivers_latest_snapshot_to_each_subscriber():
+    import asyncio
+
+    async def run():
+        bus = StateBus()
+        assert not bus.has_subscribers('koth')
+        got_a, got_b = [], []
+
+        async def follow(out, n):
+            async for state in bus.subscribe('koth'):
+                out.append(state['tick'])
+                if len(out) == n:
+                    return
+
+        a = asyncio.create_task(follow(got_a, 2))
+        b = asyncio.create_task(follow(got_b, 1))
+        await asyncio.sleep(0)
+        assert bus.has_subscribers('koth')
+
+        bus.publish('koth', {'tick': 1})
+        await asyncio.sleep(0)
+        # published twice before the subscriber ran: only the latest is seen
+        bus.publish('koth', {'tick': 2})
+        bus.publish('koth', {'tick': 3})
+        await asyncio.wait_for(asyncio.gather(a, b), 1.0)
+
+        assert got_a == [1, 3]
+        assert got_b == [1]
+        assert not bus.has_subscribers('koth')
+        assert bus.latest('koth') == {'tick': 3}
+
+    asyncio.run(run())
+
+
+def test_versioned_state_deltas():
+    vs = VersionedState()
+    vs.refresh({'phase': 'idle', 'meters': {'a': 1}, 'events': []})
+    assert vs.version == 1
+    assert vs.since(0) == {'version': 1, 'full': True, 'state': vs.state}
+    assert vs.since(1) == {'version': 1, 'unchanged': True}
+
+    # identical rebuild: no new version
+    assert not vs.refresh({'phase': 'idle', 'meters': {'a': 1}, 'events': []})
+    assert vs.version == 1
+
+    vs.refresh({'phase': 'countdown', 'meters': {'a': 1}, 'events': [], 'countdown_remaining': 5})
+    vs.refresh({'phase': 'countdown', 'meters': {'a': 2}, 'events': [], 'countdown_remaining': 5})
+    assert vs.since(2) == {'version': 3, 'full': False, 'changed': {'meters': {'a': 2}}, 'removed': []}
+    d = vs.since(1)
+    assert set(d['changed']) == {'phase', 'meters', 'countdown_remaining'}
+
+    vs.refresh({'phase': 'running', 'meters': {'a': 2}, 'events': []})
+    d = vs.since(3)
+    assert d['changed'] == {'phase': 'running'}
+    assert d['removed'] == ['countdown_remaining']
+    # a version from before a restart gets the full state
+    assert vs.since(99)['full'] is True
+
+
+def test_versioned_state_since_rebuilds_at_most_every_refresh_interval():
+    from state_bus import STATE_REFRESH_MS
+    vs = VersionedState()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'n': len(builds)}
+
+    assert vs.since(0, build, 1000)['state'] == {'n': 1}
+    assert vs.since(1, build, 1000 + STATE_REFRESH_MS - 1) == {'version': 1, 'unchanged': True}
+    assert len(builds) == 1
+    assert vs.since(1, build, 1000 + STATE_REFRESH_MS)['changed'] == {'n': 2}
+
+
+def test_get_state_since_rebuilds_only_when_state_key_moves():
+    from threecp_game import ThreeCPBackend
+    clk = MockClock()
+    b = ThreeCPBackend(scanner=EnhancedBLEScanner(clk))
+    b.clock = clk
+    builds = []
+    get_state = b.get_state
+    b.get_state = lambda: builds.append(1) or get_state()
+
+    v = b.get_state_since(0)['version']
+    key = b.state_key()
+    for _ in range(5):
+        clk.add_millis(1000)
+        assert b.get_state_since(v) == {'version': v, 'unchanged': True}
+    assert len(builds) == 1 and b.state_key() == key
+
+    b.event_manager._add_event("Time Extended: +2 minutes")
+    clk.add_millis(1000)
+    d = b.get_state_since(v)
+    assert len(builds) == 2
+    assert list(d['changed']) == ['events']
+
+
+class _FieldScanner:
+    """Scanner stand-in whose per-square teams the test sets directly."""
+
+    def __init__(self):
+        self.on = {}
+
+    def configure_presence(self, **changes):
+        pass
+
+    async def start_scanning(self):
+        pass
+
+    async def stop_scanning(self):
+        pass
+
+    def get_player_counts_for_squares(self, square_ids):
+        counts = {'red': 0, 'blu': 0, 'mag': 0}
+        for sq in square_ids:
+            if self.on.get(sq):
+                counts[self.on[sq]] += 1
+        return counts
+
+    def get_player_counts(self):
+        return self.get_player_counts_for_squares(list(self.on))
+
+
+def test_state_key_moves_whenever_get_state_does(monkeypatch):
+    import random
+    from battlepoint_game import EnhancedGameBackend
+    from threecp_game import ThreeCPBackend
+    from ad_game import ADBackend
+    now = [1_000_000]
+    monkeypatch.setattr(RealClock, 'milliseconds', lambda self: now[0])
+
+    koth = EnhancedGameBackend(scanner=_FieldScanner())
+    koth.configure(GameOptions(capture_seconds=5, capture_button_threshold_seconds=1,
+                               time_limit_seconds=20, start_delay_seconds=2))
+    koth.square_ids = [1]
+    backends = [koth]
+    mapping = ControlSquareMapping(cp_1_squares=[1], cp_2_squares=[2], cp_3_squares=[3])
+    for cls in (ThreeCPBackend, ADBackend):
+        b = cls(scanner=_FieldScanner())
+        b.configure(ThreeCPOptions(capture_seconds=5, capture_button_threshold_seconds=1, time_limit_seconds=30,
+                                   start_delay_seconds=2, add_time_per_first_capture_seconds=5,
+                                   control_square_mapping=mapping))
+        backends.append(b)
+
+    # a random match per backend: whenever two moments share a key, they must
+    # show the same state, or a client would be told "unchanged" wrongly
+    rng = random.Random(8)
+    for b in backends:
+        b.start_game()
+        shown = {}
+        for _ in range(600):
+            if rng.random() < 0.15:
+                b.scanner.on = {sq: rng.choice((None, 'red', 'blu')) for sq in (1, 2, 3)}
+            now[0] += rng.choice((0, 50, 300, 1000))
+            b.update()
+            state = b.get_state()
+            assert shown.setdefault(b.state_key(), state) == state, type(b).__name__
+        assert len(shown) > 20
+        assert b.get_state()['phase'] == 'ended'
+
+
+def test_event_manager_ring_buffer_and_cursor():
+    from battlepoint_core import EVENT_LOG_SIZE
+    clk = MockClock()
+    em = EventManager(clk)
+    for i in range(EVENT_LOG_SIZE + 5):
+        em._add_event(f"e{i}")
+
+    assert len(em.events) == EVENT_LOG_SIZE
+    assert em.last_seq() == EVENT_LOG_SIZE + 5
+    assert [e.text for e in em.get_events(2)] == [f"e{EVENT_LOG_SIZE + 3}", f"e{EVENT_LOG_SIZE + 4}"]
+    assert em.get_events(2)[0].to_display().endswith(f"e{EVENT_LOG_SIZE + 3}")
+
+    after = em.get_events_after(em.last_seq() - 3)
+    assert [e.seq for e in after] == [em.last_seq() - 2, em.last_seq() - 1, em.last_seq()]
+    assert em.get_events_after(em.last_seq()) == []
+    # a cursor older than the ring returns what is left
+    assert len(em.get_events_after(0)) == EVENT_LOG_SIZE
+
+    # clearing for a new game keeps the sequence going
+    seq = em.last_seq()
+    em.starting_game()
+    assert all(e.seq > seq for e in em.get_events_after(seq))
+    assert em.get_events_after(0) == em.get_events(0)
+
+
+def test_tick_scheduler_uses_phase_rates_and_wake():
+    from enum import Enum
+
+    class Phase(Enum):
+        IDLE = "idle"
+        RUNNING = "running"
+
+    class Backend:
+        def __init__(self):
+            self._phase = Phase.IDLE
+            self.ticks = 0
+
+        def update(self):
+            self.ticks += 1
+
+    now = [0.0]
+    sched = TickScheduler(intervals={"idle": 1.0, "running": 0.1}, time_fn=lambda: now[0])
+    b = Backend()
+    published = []
+    sched.register("koth", b, lambda: published.append(b.ticks))
+
+    # first tick runs immediately, then idle rate
+    assert sched.run_due() == pytest.approx(1.0)
+    now[0] = 0.5
+    sched.run_due()
+    assert b.ticks == 1
+
+    # start the game: wake ticks at once, then 10 Hz
+    b._phase = Phase.RUNNING
+    sched.wake("koth")
+    assert sched.run_due() == pytest.approx(0.1)
+    assert b.ticks == 2
+    now[0] = 0.65
+    sched.run_due()
+    assert b.ticks == 3
+    assert published == [1, 2, 3]
+
+    stats = sched.get_stats()["koth"]
+    assert stats["phase"] == "running"
+    assert stats["ticks"] == 3
+    assert stats["jitter_ms_max"] == pytest.approx(50.0)
+
+
+def test_sound_cache_is_lru_capped_by_bytes():
+    loads = []
+
+    def loader(sound_id):
+        loads.append(sound_id)
+        if sound_id == 99:
+            return None
+        return (f"snd{sound_id}", 10)
+
+    cache = SoundCache(loader, max_bytes=30)
+    assert cache.warm([1, 2, 3, 4]) == 3      # stops once full
+    assert loads == [1, 2, 3]
+
+    assert cache.get(1) == "snd1"             # hit, 1 is now most recent
+    assert loads == [1, 2, 3]
+    cache.get(4)                              # evicts 2, the least recent
+    assert 2 not in cache and 1 in cache and 4 in cache
+    assert cache.bytes == 30
+
+    # failed loads are retried, not cached
+    assert cache.get(99) is None
+    assert cache.get(99) is None
+    assert loads.count(99) == 2
+
+
+class _FakeChannel:
+    def __init__(self):
+        self.playing = None
+        self.played = []
+        self.volume = 1.0
+
+    def play(self, sound):
+        self.playing = sound
+        self.played.append(sound)
+
+    def get_busy(self):
+        return self.playing is not None
+
+    def stop(self):
+        self.playing = None
+
+    def set_volume(self, v):
+        self.volume = v
+
+
+def test_audio_mixer_priorities_coalescing_and_ducking():
+    now = [0.0]
+    vo, sfx, music = _FakeChannel(), _FakeChannel(), _FakeChannel()
+    mixer = AudioMixer(vo, sfx, music, lambda sid: sid, time_fn=lambda: now[0])
+    mixer.set_volume(1.0)
+
+    # capture cue goes to SFX and does not touch VO or music volume
+    mixer.play(14)
+    assert sfx.playing == 14 and vo.playing is None
+    assert music.volume == 1.0
+
+    # announcer talks: music ducks
+    mixer.play(13)
+    assert vo.playing == 13
+    assert music.volume == MUSIC_DUCK
+
+    # countdown calls while VO busy: only the newest survives in the queue
+    mixer.play(43)    # ends in 5
+    mixer.play(42)    # ends in 4
+    assert [e[1] for e in mixer.vo_queue] == [42]
+
+    # victory preempts the current line immediately
+    mixer.play(12)
+    assert vo.playing == 12
+
+    # VO done: queued countdown starts on the next pump...
+    vo.stop()
+    mixer.pump()
+    assert vo.playing == 42
+
+    # ...unless it went stale while waiting
+    mixer.play(12)
+    mixer.play(41)
+    mixer.play(9)
+    assert [e[1] for e in mixer.vo_queue] == [41, 9]
+    now[0] += 5.0
+    vo.stop()
+    mixer.pump()
+    assert vo.playing == 9
+    vo.stop()
+    mixer.pump()
+    assert vo.playing is None
+    assert mixer.dropped == 2     # 43 coalesced, 41 stale
+    assert music.volume == 1.0
+
+
+def test_audio_worker_never_blocks_and_drops_stale_countdowns():
+    handled = []
+    w = AudioWorker(lambda cmd, arg: handled.append((cmd, arg)), maxsize=3)
+
+    w.submit("play", 43, coalesce=True)
+    w.submit("play", 12)
+    w.submit("play", 42, coalesce=True)     # replaces the pending 43
+    assert w.pending() == 2 and w.dropped == 1
+
+    w.submit("play", 14)
+    w.submit("play", 9)                      # full: the countdown goes first
+    assert w.pending() == 3 and w.dropped == 2
+    w.submit("volume", 5)                    # full, nothing coalescible: oldest goes
+    assert w.run_pending() == 3
+    assert handled == [("play", 14), ("play", 9), ("volume", 5)]
+
+
+def test_audio_worker_thread_runs_commands():
+    import threading
+    done = threading.Event()
+    seen = []
+
+    def handle(cmd, arg):
+        seen.append(arg)
+        if len(seen) == 2:
+            done.set()
+
+    w = AudioWorker(handle)
+    w.start()
+    try:
+        w.submit("play", 1)
+        w.submit("play", 2)
+        assert done.wait(2.0)
+        assert seen == [1, 2]
+    finally:
+        w.shutdown()
+
+
+def test_sound_manifest_versions_urls_and_marks_preload(tmp_path):
+    (tmp_path / "0023_announcer_victory.mp3").write_bytes(b"x" * 10)
+    (tmp_path / "0031_gamestartup4.mp3").write_bytes(b"y" * 20)
+
+    m = build_sound_manifest(str(tmp_path), "/sounds")
+    assert set(m["sounds"]) == {"12", "19"}          # missing files are skipped
+    victory = m["sounds"]["12"]
+    assert victory["url"].startswith("/sounds/0023_announcer_victory.mp3?v=")
+    assert victory["preload"] is True
+    assert m["sounds"]["19"]["preload"] is False     # menu music streams
+
+    (tmp_path / "0023_announcer_victory.mp3").write_bytes(b"x" * 11)
+    assert build_sound_manifest(str(tmp_path))["sounds"]["12"]["url"] != victory["url"]
+
+
+def test_settings_store_caches_and_writes_behind_atomically(tmp_path):
+    import json
+    store = SettingsStore(write_delay_s=60)
+    mgr = UnifiedSettingsManager(koth_file=str(tmp_path / "koth.json"), store=store)
+
+    opts = GameOptions(mode=GameMode.KOTH, capture_seconds=33)
+    assert mgr.save_koth_settings(opts, volume=7)
+    assert not (tmp_path / "koth.json").exists()     # write is deferred
+    loaded, volume, _ = mgr.load_koth_settings()     # but reads see it
+    assert loaded.capture_seconds == 33 and volume == 7
+
+    store.flush()
+    on_disk = json.loads((tmp_path / "koth.json").read_text())
+    assert on_disk["schema_version"] == SETTINGS_SCHEMA_VERSION
+    assert on_disk["capture_seconds"] == 33
+    assert not (tmp_path / "koth.json.tmp").exists()
+
+
+def test_settings_store_migrates_legacy_ad_file(tmp_path):
+    import json
+    legacy = ThreeCPOptions(time_limit_seconds=123).to_dict()
+    (tmp_path / "ad.json").write_text(json.dumps({"options": legacy}))
+
+    mgr = UnifiedSettingsManager(ad_file=str(tmp_path / "ad.json"), store=SettingsStore())
+    assert mgr.load_ad_settings().time_limit_seconds == 123
+
+
+def test_settings_store_flush_covers_a_write_in_flight(tmp_path):
+    import json
+    path = str(tmp_path / "a.json")
+    store = SettingsStore(write_delay_s=60)
+    store.put(path, {"n": 1})
+    with store._cond:
+        # as if the writer thread had just taken it
+        store._dirty.clear()
+        store._writing.add(path)
+    store.flush()
+    assert json.loads((tmp_path / "a.json").read_text())["n"] == 1
+
+
+def test_settings_manager_migrates_legacy_koth_file(tmp_path):
+    import json
+    from settings import koth_options_to_dict, LEGACY_KOTH_FILE
+    legacy = koth_options_to_dict(GameOptions(mode=GameMode.KOTH, capture_seconds=44), volume=3)
+    (tmp_path / LEGACY_KOTH_FILE).write_text(json.dumps(legacy))
+
+    store = SettingsStore(write_delay_s=60)
+    mgr = UnifiedSettingsManager(koth_file=str(tmp_path / "battlepoint_settings.json"), store=store)
+    options, volume, _ = mgr.load_koth_settings()
+    assert options.capture_seconds == 44 and volume == 3
+
+    store.flush()
+    assert json.loads((tmp_path / "battlepoint_settings.json").read_text())["capture_seconds"] == 44
+
+
+def test_simulator_scripted_koth_match():
+    opts = GameOptions(capture_seconds=20, time_limit_seconds=60, capture_button_threshold_seconds=5)
+    sim = MatchSimulator("koth", opts)
+    result = sim.run([PresenceStep(0, 0, red=1)])
+    assert result.winner == Team.RED
+    assert result.captures == 1
+    # 20s to capture, then RED's 60s clock runs down
+    assert 79 <= result.duration_s <= 82
+    assert not result.stalemate
+
+
+def test_simulator_jumps_between_events_like_a_ticked_run():
+    opts = GameOptions(capture_seconds=20, time_limit_seconds=60, capture_button_threshold_seconds=5)
+    script = [PresenceStep(0, 0, red=1)]
+    fast = MatchSimulator("koth", opts).run(script)
+    ticked = MatchSimulator("koth", opts, tick_ms=100).run(script)
+    assert fast.winner == ticked.winner == Team.RED
+    assert abs(fast.duration_s - ticked.duration_s) <= 0.2
+    # re-sighted every 5s while RED stands there, plus capture and victory
+    assert fast.ticks < 25 < ticked.ticks
+
+
+def test_simulator_run_many_is_reproducible():
+    sim = MatchSimulator("3cp", tick_ms=1000)
+    factory = RandomPresence(cps=3, horizon_s=sim.max_match_s)
+    a = sim.run_many(5, factory, seed=7)
+    b = sim.run_many(5, factory, seed=7)
+    assert a.matches == 5
+    assert a.wins == b.wins and a.duration_s_mean == b.duration_s_mean
+
+
+def test_bench_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"a": 100.0, "b": 100.0, "c": 100.0}
+    results = {"a": 120.0, "b": 130.0, "c": 50.0, "new": 1.0}
+    assert bench_compare(results, baseline, 0.25) == ["b"]
+    assert bench_measure(lambda: None, ops=1, repeat=2, min_time_s=0.001) > 0
+
+
+def test_synthetic_source_emits_on_schedule_with_loss():
+    src = SyntheticAdvertSource(tiles=[1, 2], interval_ms=100, jitter=0.0, teams="RB", seed=1)
+    src.schedule(0.0)
+    got = []
+    src.emit_due(1.0, lambda addr, rssi, payload: got.append(payload))
+    # every tile, once per 100ms, over ~1s
+    assert sum(p.startswith("CS-01,R") for p in got) in (10, 11)
+    assert sum(p.startswith("CS-02,B") for p in got) in (10, 11)
+
+    lossy = SyntheticAdvertSource(tiles=1, interval_ms=10, loss=1.0, seed=1)
+    lossy.schedule(0.0)
+    lossy.emit_due(1.0, lambda *a: pytest.fail("lost adverts must not be emitted"))
+    assert lossy.lost > 0 and lossy.emitted == 0
+
+
+def test_scanner_ingests_from_replay_source(tmp_path):
+    import asyncio
+    path = str(tmp_path / "cap.txt")
+    write_capture_text(path, [(t, "AA:BB:CC:DD:EE:01", -60, "CS-03,R,PT-001,0") for t in range(0, 500, 100)])
+
+    clk = RealClock()
+    s = EnhancedBLEScanner(clk, source=ReplayAdvertSource(path, speed=0))
+    asyncio.run(s.start_scanning())
+    deadline = time.time() + 2.0
+    while s.get_player_counts_for_squares([3])["red"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    asyncio.run(s.stop_scanning())
+    assert s.get_player_counts_for_squares([3])["red"] == 1
+
+    assert isinstance(advert_source_from_spec("synthetic:tiles=5,loss=0.2"), SyntheticAdvertSource)
+    assert advert_source_from_spec("") is None
+
+
+def test_capture_recorder_round_trips_rotates_and_indexes(tmp_path, monkeypatch):
+    import ble_capture
+    monkeypatch.setattr(ble_capture, "INDEX_EVERY", 10)
+    rec = CaptureRecorder(str(tmp_path), max_bytes=1200, max_files=100)
+    rec.start()
+    for i in range(100):
+        rec.record("aa:bb:cc:dd:ee:%02x" % (i % 4), -60 - (i % 5), f"CS-{i % 4:02d},R,PT-001,0", t_us=i * 1000)
+    rec.record("0BE3F6A1-UUID", -70, "CS-07,B", t_us=100_000)
+    rec.close()
+    assert rec.recorded == 101 and rec.dropped == 0
+    assert len(rec.files) > 1                                  # rotated by size
+
+    got = [obs for path in rec.files for obs in iter_capture(path)]
+    assert len(got) == 101
+    assert got[5] == (5000, "aa:bb:cc:dd:ee:01", -60, "CS-01,R,PT-001,0", 0)
+    assert got[-1][1] == "0BE3F6A1-UUID"
+
+    first = rec.files[0]
+    index = read_index(first)
+    assert index and sum(count for *_, count in index) == sum(1 for _ in iter_capture(first))
+    late = list(iter_capture(first, start_ms=15))
+    assert late and all(t >= 15000 for t, *_ in late)
+
+
+def test_capture_reader_stops_at_torn_frame_and_replays(tmp_path):
+    path = str(tmp_path / "torn.bpcap")
+    w = CaptureWriter(path)
+    for t in range(3):
+        w.write((t * 100_000, "aa:bb:cc:dd:ee:09", -55, "CS-09,B,PT-002,0", 0))
+    w.close()
+    with open(path, "ab") as f:
+        f.write(b"\xb5\x01\x40\x00partial")
+    assert len(list(iter_capture(path))) == 3
+
+    from ble_sources import read_capture
+    assert [r[0] for r in read_capture(path)] == [0, 100, 200]
+
+
+def test_multi_adapter_capture_replays_with_its_adapters(tmp_path):
+    import asyncio
+    from ble_sources import read_capture
+    rec = CaptureRecorder(str(tmp_path))
+    rec.start()
+    for i in range(5):
+        for adapter in (0, 1):
+            rec.record("aa:bb:cc:dd:ee:04", -60 - adapter, "CS-04,R,PT-001,0", t_us=i * 100_000 + adapter, adapter=adapter)
+    rec.close()
+    assert [r[4] for r in read_capture(rec.files[0])] == [0, 1] * 5
+
+    text = str(tmp_path / "cap.txt")
+    write_capture_text(text, read_capture(rec.files[0]))
+    assert list(read_capture(text)) == list(read_capture(rec.files[0]))
+
+    source = ReplayAdvertSource(text, speed=0)
+    s = EnhancedBLEScanner(RealClock(), source=source)
+    asyncio.run(s.start_scanning())
+    deadline = time.time() + 2.0
+    while source.emitted < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    asyncio.run(s.stop_scanning())
+    s.process_pending()
+    dev = s.get_devices_summary()["devices"][0]
+    assert dev["cb_count"] == 5                                # copies merged, not doubled
+    assert [(a["adapter"], a["duplicates"]) for a in s.get_adapter_stats()] == [("hci0", 0), ("hci1", 5)]
+
+
+def test_control_point_capture_completes_at_exact_time_despite_slow_ticks():
+    tc = MockClock()
+    cp = ControlPoint(MockEventManager(), tc)
+    prox = _TestProximity()
+    cp.init(2)
+    prox.set_blu_close(True)
+
+    cp.update(prox)
+    tc.add_millis(500)
+    cp.update(prox)
+    assert cp.next_event_ms() == 2000
+
+    # one stalled 3s tick: capture is not clamped away, and is stamped at 2000
+    tc.add_millis(3000)
+    cp.update(prox)
+    assert cp.get_owner() == Team.BLU
+    assert cp.get_last_capture() == (2000, Team.NOBODY)
+    assert cp.next_event_ms() is None
+
+
+def test_control_point_credits_a_stalled_gap_only_from_arrival():
+    tc = MockClock()
+    cp = ControlPoint(MockEventManager(), tc)
+    prox = Proximity(GameOptions(capture_button_threshold_seconds=5), tc)
+    cp.init(2)
+    cp.update(prox)
+
+    # BLU steps on 100ms before the end of a 5s stall
+    tc.add_millis(4900)
+    prox.update_counts(0, 1)
+    tc.add_millis(100)
+    prox.update_counts(0, 1)
+    cp.update(prox)
+    assert cp.get_owner() == Team.NOBODY
+    assert cp.get_value() == 100
+
+    tc.add_millis(1900)
+    prox.update_counts(0, 1)
+    cp.update(prox)
+    assert cp.get_last_capture() == (6900, Team.NOBODY)
+
+
+def test_control_point_credits_a_stall_the_team_was_on_the_point_throughout():
+    for threshold in (0, 1, 5):
+        tc = MockClock()
+        cp = ControlPoint(MockEventManager(), tc)
+        prox = Proximity(GameOptions(capture_button_threshold_seconds=threshold), tc)
+        cp.init(10)
+        prox.update_counts(0, 1)
+        cp.update(prox)
+        tc.add_millis(100)
+        prox.update_counts(0, 1)
+        cp.update(prox)
+        assert cp.get_value() == 100
+
+        # the loop stalls 4s; BLU is still there when it resumes
+        tc.add_millis(4000)
+        prox.update_counts(0, 1)
+        cp.update(prox)
+        assert cp.get_value() == 4100, threshold
+
+        # a read that saw BLU gone ends the visit: the next one starts fresh
+        tc.add_millis(threshold * 1000 + 2000)
+        cp.update(prox)
+        tc.add_millis(3000)
+        prox.update_counts(0, 1)
+        assert prox.present_since_ms(Team.BLU) == tc.milliseconds()
+
+
+def test_koth_accumulates_from_exact_capture_time_and_schedules_victory():
+    go = _koth_game_options()
+    tc = MockClock()
+    em = MockEventManager()
+    cp = ControlPoint(em, tc)
+    prox = _TestProximity()
+    game = KothGame()
+    game.init(cp, go, em, LedMeter("o", 10), LedMeter("c", 10), LedMeter("t1", 10), LedMeter("t2", 10), tc)
+    game.start()
+
+    prox.set_blu_close(True)
+    cp.update(prox)
+    game.update()
+    tc.add_millis(go.capture_seconds * 1000 + 700)
+    cp.update(prox)
+    game.update()
+
+    assert cp.get_owner() == Team.BLU
+    assert game._blu_accum_ms == 700
+    assert game.next_event_ms() == tc.milliseconds() + go.time_limit_seconds * 1000 - 700
+
+
+def test_tick_scheduler_wakes_backend_for_its_next_event():
+    class Backend:
+        _phase = None
+
+        def __init__(self):
+            self.clock = MockClock()
+            self.ticks = 0
+
+        def update(self):
+            self.ticks += 1
+
+        def next_wakeup_ms(self):
+            return self.clock.milliseconds() + 30
+
+    now = [0.0]
+    sched = TickScheduler(intervals={"running": 0.1}, time_fn=lambda: now[0])
+    sched.register("koth", Backend())
+    assert sched.run_due() == pytest.approx(0.03)
+
+
+def _arena_config(arena_id, mode, squares):
+    cps = [list(squares[i:i + 1]) for i in range(3)] if mode != 'koth' else [list(squares), [], []]
+    return ArenaConfig(
+        arena_id=arena_id,
+        mode=mode,
+        mapping=ControlSquareMapping(cp_1_squares=cps[0], cp_2_squares=cps[1], cp_3_squares=cps[2]),
+        options={'start_delay_seconds': 0},
+    )
+
+
+def test_arena_registry_hosts_six_fields_on_one_scanner(tmp_path):
+    clk = MockClock()
+    scanner = EnhancedBLEScanner(clk)
+    registry = ArenaRegistry(scanner, store=SettingsStore(write_delay_s=0), path=str(tmp_path / 'arenas.json'))
+    sched = TickScheduler(time_fn=lambda: 0.0)
+    registry.attach(sched)
+
+    layout = [('k1', 'koth', [1, 2]), ('k2', 'koth', [3]), ('c1', '3cp', [10, 11, 12]),
+              ('c2', '3cp', [20, 21, 22]), ('a1', 'ad', [30, 31, 32]), ('a2', 'ad', [40, 41, 42])]
+    for arena_id, mode, squares in layout:
+        registry.add(_arena_config(arena_id, mode, squares))
+
+    with pytest.raises(ValueError):
+        registry.add(_arena_config('clash', 'koth', [2]))
+    with pytest.raises(ValueError):
+        registry.add(_arena_config('k1', 'koth', [90]))
+
+    assert set(sched.get_stats()) == {f'arena/{a}' for a, _, _ in layout}
+    backends = [registry.get(a).backend for a, _, _ in layout]
+    assert len({id(b.event_manager) for b in backends}) == 6
+    assert all(isinstance(b.scanner, ScannerLease) for b in backends)
+
+    # BLU on CS-02 (k1) and RED on CS-21 (c2's middle point) only
+    for t in (1000, 1050):
+        clk.add_millis(t - clk.milliseconds())
+        scanner._record_observation('aa:00:00:00:00:02', -50, decode_tile_advert('CS-02,B,PT-01,0'), t)
+        scanner._record_observation('aa:00:00:00:00:21', -50, decode_tile_advert('CS-21,R,PT-02,0'), t)
+    for b in backends:
+        b._update_proximity()
+
+    assert registry.get('k1').backend.proximity.get_blu_count() == 1
+    assert registry.get('k2').backend.proximity.get_blu_count() == 0
+    c2 = registry.get('c2').backend
+    assert [p.get_red_count() for p in c2.proximities] == [0, 1, 0]
+    assert [p.get_red_count() for p in registry.get('c1').backend.proximities] == [0, 0, 0]
+
+    # saved layout comes back in a fresh registry
+    registry.store.flush()
+    again = ArenaRegistry(scanner, store=SettingsStore(write_delay_s=0), path=str(tmp_path / 'arenas.json'))
+    assert [a.arena_id for a in again.load()] == [a for a, _, _ in layout]
+    assert again.get('c2').get_options()['control_square_mapping']['cp_2_squares'] == [21]
+
+    assert asyncio.run(registry.remove('k2'))
+    assert 'arena/k2' not in sched.get_stats()
+
+
+def test_scanner_lease_keeps_radio_on_while_any_holder_scans():
+    class Radio:
+        scanning = False
+
+        async def start_scanning(self):
+            self.scanning = True
+
+        async def stop_scanning(self):
+            self.scanning = False
+
+    radio = Radio()
+    registry = ArenaRegistry(radio, store=SettingsStore(write_delay_s=0))
+    a, b = registry.lease('a'), registry.lease('b')
+
+    asyncio.run(a.start_scanning())
+    asyncio.run(b.start_scanning())
+    asyncio.run(a.stop_scanning())
+    assert radio.scanning
+    asyncio.run(a.stop_scanning())
+    assert radio.scanning
+    asyncio.run(b.stop_scanning())
+    assert not radio.scanning
+
+
+def test_removing_an_arena_releases_its_lease_and_topic(tmp_path):
+    class Radio:
+        scanning = False
+
+        def __init__(self):
+            self.scopes = {}
+
+        async def start_scanning(self):
+            self.scanning = True
+
+        async def stop_scanning(self):
+            self.scanning = False
+
+        def configure_presence(self, scope=None, squares=None, **changes):
+            self.scopes[scope] = squares
+
+        def clear_presence(self, scope):
+            del self.scopes[scope]
+
+    radio, bus = Radio(), StateBus()
+    registry = ArenaRegistry(radio, store=SettingsStore(write_delay_s=0), path=str(tmp_path / 'arenas.json'), bus=bus)
+    arena = registry.add(_arena_config('f1', 'koth', [1]))
+    assert radio.scopes == {'arena/f1': {1}}
+    asyncio.run(arena.backend.scanner.start_scanning())
+    bus.publish(arena.topic, {'phase': 'idle'})
+
+    async def watch_then_remove():
+        seen = []
+
+        async def watch():
+            async for state in bus.subscribe(arena.topic):
+                seen.append(state)
+
+        watcher = asyncio.ensure_future(watch())
+        await asyncio.sleep(0)
+        assert await registry.remove('f1')
+        await asyncio.wait_for(watcher, 1.0)          # the page's loop ends
+        return seen
+
+    assert asyncio.run(watch_then_remove()) == [{'phase': 'idle'}]
+    assert not radio.scanning and radio.scopes == {}
+    assert arena.topic not in bus.get_stats()
+    assert not asyncio.run(registry.remove('f1'))
+
+
+HCICONFIG_SAMPLE = """hci2:	Type: Primary  Bus: USB
+	BD Address: 00:1A:7D:DA:71:13  ACL MTU: 310:10  SCO MTU: 64:8
+	UP RUNNING
+hci1:	Type: Primary  Bus: USB
+	BD Address: 00:1A:7D:DA:71:12  ACL MTU: 310:10  SCO MTU: 64:8
+hci0:	Type: Primary
+	Bus: UART
+	BD Address: B8:27:EB:00:00:01  ACL MTU: 1021:8  SCO MTU: 64:1
+"""
+
+
+def test_resolve_adapters_picks_usb_dongles_by_default():
+    found = parse_hciconfig(HCICONFIG_SAMPLE)
+    assert found == [(2, 'USB'), (1, 'USB'), (0, 'UART')]
+    assert resolve_adapters('usb', found) == [1, 2]
+    assert resolve_adapters('all', found) == [0, 1, 2]
+    assert resolve_adapters('0,hci2', found) == [0, 2]
+    assert resolve_adapters('usb', [(0, 'UART')]) == [0]
+
+
+def test_scanner_merges_same_advert_from_two_adapters():
+    clk = MockClock()
+    clk.set_time(10000)
+    s = EnhancedBLEScanner(clk, adapters=[0, 1])
+    advert = decode_tile_advert('CS-04,R,PT-004,0')
+
+    s._record_observation('aa:bb:cc:dd:ee:04', -70, advert, 10000, adapter=0)
+    s._record_observation('aa:bb:cc:dd:ee:04', -55, advert, 10008, adapter=1)
+    # the tile's next advert, heard by hci1 only
+    s._record_observation('aa:bb:cc:dd:ee:04', -58, advert, 10100, adapter=1)
+
+    summary = s.get_devices_summary()
+    dev = summary['devices'][0]
+    assert dev['cb_count'] == 2
+    assert dev['rssi_by_adapter'] == {'hci0': -70, 'hci1': -58}
+    assert s.get_player_counts_for_squares([4])['red'] == 1
+
+    stats = {a['adapter']: a for a in summary['adapters']}
+    assert stats['hci0']['unique'] == 1 and stats['hci0']['duplicates'] == 0
+    assert stats['hci1']['adverts'] == 2 and stats['hci1']['duplicates'] == 1
+
+    # a synthetic two-dongle source delivers every advert twice; one survives
+    src = SyntheticAdvertSource(tiles=1, interval_ms=100, jitter=0.0, seed=3, adapters=2)
+    src.schedule(0.0)
+    got = []
+    src.emit_due(0.95, lambda addr, rssi, payload, adapter: got.append(adapter))
+    assert got.count(0) == got.count(1) > 0
+
+
+def test_tile_table_seqlock_round_trip_and_torn_reads():
+    from ble_process import TABLE_SIZE, TileTable, TablePublisher
+    clk = MockClock()
+    clk.set_time(10000)
+    s = EnhancedBLEScanner(clk, adapters=[0])
+    s._record_observation('aa:bb:cc:dd:ee:05', -61, decode_tile_advert('CS-05,B,PT-005,0'), 10000)
+    s._record_observation('aa:bb:cc:dd:ee:06', -62, decode_tile_advert('CS-06,R,PT-006,0'), 10000)
+
+    table = TileTable(bytearray(TABLE_SIZE))
+    TablePublisher(s, table).publish()
+    assert list(table.active_indices()) == [5, 6]
+    assert table.counts([5, 6], 10001) == [1, 1, 0]
+    assert table.counts([6], 10000 + s.fresh_window_ms + 1) == [0, 0, 0]
+
+    # a writer stuck mid-record (odd seq) is never read as data
+    offset = table._slot_offset(5)
+    table._buf[offset] |= 1
+    assert table.counts([5], 10001) == [0, 0, 0]
+    assert table.torn_reads == 1
+
+
+def test_process_scanner_counts_tiles_from_child(tmp_path):
+    from ble_process import ProcessBLEScanner
+    s = ProcessBLEScanner(RealClock(), source_spec='synthetic:tiles=4,interval_ms=20,teams=R,seed=2')
+    try:
+        asyncio.run(s.start_scanning())
+        deadline = time.time() + 10.0
+        while s.get_player_counts_for_squares([1, 2])['red'] < 2 and time.time() < deadline:
+            time.sleep(0.02)
+        assert s.get_player_counts_for_squares([1, 2]) == {'red': 2, 'blu': 0, 'mag': 0}
+        summary = s.get_devices_summary()
+        assert summary['scanning'] and summary['device_count'] == 4
+        assert summary['process']['alive']
+        while not s.get_adapter_stats() and time.time() < deadline:
+            time.sleep(0.02)
+        assert s.get_adapter_stats()[0]['adverts'] > 0          # filled in off the caller's thread
+
+        # a child that stops answering must not stall the (async) caller
+        hung = threading.Event()
+        answer = s._call
+        s._call = lambda command, **args: hung.wait(5.0) and answer(command, **args)
+        s._stats_at = 0.0
+        started = time.monotonic()
+        assert s.get_devices_summary()['adapters']               # the previous reply
+        s.configure_presence(confirm_adverts=3)
+        assert time.monotonic() - started < 0.5
+        assert s.presence.confirm_adverts == 3
+        hung.set()
+        s._call = answer
+        asyncio.run(s.stop_scanning())
+    finally:
+        s.close()
+    assert not s.alive
+
+
+def test_metrics_histogram_renders_prometheus_text():
+    reg = MetricsRegistry()
+    h = reg.histogram('bp_test_seconds', 'Test "timing"', ('backend',), buckets=(0.01, 0.1))
+    assert reg.histogram('bp_test_seconds', 'again') is h
+    for v in (0.005, 0.01, 0.05, 3.0):
+        h.labels('koth').observe(v)
+    text = reg.render()
+    assert '# HELP bp_test_seconds Test \\"timing\\"' in text
+    assert '# TYPE bp_test_seconds histogram' in text
+    assert 'bp_test_seconds_bucket{backend="koth",le="0.01"} 2' in text
+    assert 'bp_test_seconds_bucket{backend="koth",le="0.1"} 3' in text
+    assert 'bp_test_seconds_bucket{backend="koth",le="+Inf"} 4' in text
+    assert 'bp_test_seconds_count{backend="koth"} 4' in text
+
+    copy = Histogram('bp_test_seconds', 'copy', ('backend',))
+    copy.load(h.snapshot())
+    assert copy.render()[2:] == h.render()[2:]
+
+
+def test_tick_and_scanner_metrics_reach_the_registry():
+    now = [0.0]
+    sched = TickScheduler(intervals={'idle': 0.1}, time_fn=lambda: now[0])
+
+    class Slow:
+        def update(self):
+            now[0] += 0.25
+
+    sched.register('metrics-test', Slow())
+    sched.run_due()
+    text = REGISTRY.render()
+    assert 'bp_tick_duration_seconds_count{backend="metrics-test"} 1' in text
+    assert 'bp_tick_overrun_seconds_bucket{backend="metrics-test",le="0.25"} 1' in text
+    sched.unregister('metrics-test')
+    assert 'backend="metrics-test"' not in REGISTRY.render()
+
+    clk = MockClock()
+    s = EnhancedBLEScanner(clk, adapters=[0])
+    advert = decode_tile_advert('CS-07,R,PT-007,0')
+    for t in (1000, 1050, 1100, 1250):
+        clk.set_time(t)
+        s._record_observation('aa:bb:cc:dd:ee:07', -60, advert, t)
+    lines = [line for m in s.collect_metrics() for line in m.render()]
+    assert 'bp_ble_tile_adverts_total{tile="CS-07"} 4' in lines
+    assert 'bp_ble_adapter_adverts_total{adapter="hci0"} 4' in lines
+    assert 'bp_ble_advert_gap_seconds_bucket{tile="CS-07",le="0.05"} 2' in lines
+    assert 'bp_ble_advert_gap_seconds_count{tile="CS-07"} 3' in lines
+
+class _SoundClient:
+    def __init__(self, cid, fail=False):
+        self.id = cid
+        self.fail = fail
+        self.sent = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run_javascript(self, js):
+        if self.fail:
+            raise RuntimeError('socket closed')
+        self.sent.append(js)
+
+def test_browser_sound_bus_sends_compact_play_to_enabled_clients_only():
+    sound_bus = pytest.importorskip('sound_bus')
+    bus = sound_bus.BrowserSoundBus()
+    clients = [_SoundClient('a'), _SoundClient('b'), _SoundClient('c'), _SoundClient('d', fail=True)]
+    for client in clients:
+        bus.clients[client.id] = client
+    bus.enable_for_client('a')
+    bus.enable_for_client('b')
+    bus.enable_for_client('d')
+
+    bus.play(12)   # no running loop: sent inline
+
+    assert clients[0].sent == ['bp.play(12,0.33)']
+    assert clients[1].sent == ['bp.play(12,0.33)']
+    assert clients[2].sent == []
+    assert bus.enabled == {'a', 'b'}   # the failing client is dropped
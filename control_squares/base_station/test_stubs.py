@@ -56,9 +56,18 @@ class MockEventManager:
     def ends_in_seconds(self, secs: int):
         pass
 
+    def _add_event(self, message: str):
+        self.events.append(message)
+
     def get_events(self, limit: int = 100):
         return []
 
+    def get_events_after(self, seq: int):
+        return []
+
+    def last_seq(self) -> int:
+        return 0
+
 
 class MockControlPoint:
     """
@@ -72,6 +81,9 @@ class MockControlPoint:
         self._capturing = Team.NOBODY
         self._on = Team.NOBODY
         self._percent_captured = 0
+        self.red_capture = True
+        self.blu_capture = True
+        self._captured_by = None
 
     def init(self, seconds_to_capture: int):
         # C test just calls init, it doesn't expect behavior here
@@ -93,6 +105,20 @@ class MockControlPoint:
     def set_percent_captured(self, pct: int):
         self._percent_captured = pct
 
+    # ---- capture locks the 3CP/AD games set ----
+    def set_red_capture(self, enabled: bool):
+        self.red_capture = enabled
+
+    def set_blu_capture(self, enabled: bool):
+        self.blu_capture = enabled
+
+    def restart_clock(self):
+        pass
+
+    def queue_capture(self, team: Team):
+        """The next update() hands the point to `team`, like a finished capture."""
+        self._captured_by = team
+
     # ---- getters the games/tests use ----
     def get_owner(self) -> Team:
         return self._owner
@@ -113,5 +139,7 @@ class MockControlPoint:
     # ---- no-op update (important!) ----
     def update(self, *args, **kwargs):
         # real ControlPoint updates proximity;
-        # this test double must NOT do that
-        pass
+        # this test double must NOT do that, it only applies a queued capture
+        if self._captured_by is not None:
+            self._owner = self._captured_by
+            self._captured_by = None
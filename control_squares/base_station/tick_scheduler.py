@@ -0,0 +1,237 @@
+"""
+One scheduler task driving every backend's update().
+
+Replaces the four independent `while True: backend.update(); sleep(0.1)`
+loops. Each backend ticks at a rate picked from its current phase, so an
+idle base station wakes about once a second per backend instead of ten
+times, and a game in overtime ticks faster than normal play. Commands that
+change phase (start/stop) call wake() so the new rate applies at once.
+Backends with next_wakeup_ms() are also ticked exactly when a capture
+completes or a timer runs out, so those don't wait for the next tick.
+
+Per-backend tick jitter (how late a tick ran), duration and overruns
+(a tick taking longer than its own interval) are kept for /api/scheduler,
+and as histograms for /metrics.
+"""
+
+import asyncio
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from metrics import REGISTRY
+
+# seconds between ticks, by backend phase (see backend_phase)
+PHASE_INTERVALS: Dict[str, float] = {
+    "idle": 1.0,
+    "ended": 1.0,
+    "countdown": 0.1,
+    "running": 0.1,
+    "overtime": 0.05,
+}
+DEFAULT_INTERVAL = 0.1
+
+# weight of the newest sample in the jitter / duration averages
+_STATS_ALPHA = 0.1
+
+TICK_SECONDS = REGISTRY.histogram(
+    "bp_tick_duration_seconds", "Time in one backend update() plus its after-tick hook", ("backend",)
+)
+TICK_LATENESS = REGISTRY.histogram(
+    "bp_tick_lateness_seconds", "How late a tick started after it was due", ("backend",)
+)
+TICK_OVERRUN = REGISTRY.histogram(
+    "bp_tick_overrun_seconds", "How far an overrunning tick ran past its own interval", ("backend",)
+)
+
+
+def backend_phase(backend) -> str:
+    """Phase name of a backend: its _phase value, or 'overtime' when running in overtime."""
+    phase = getattr(backend, "_phase", None)
+    name = getattr(phase, "value", None) or "running"
+    if name == "running":
+        game = getattr(backend, "game", None)
+        check = getattr(game, "check_overtime", None)
+        if check is not None:
+            try:
+                if check():
+                    return "overtime"
+            except Exception:
+                pass
+    return name
+
+
+def _wakeup_in_s(backend) -> Optional[float]:
+    """Seconds until backend.next_wakeup_ms() (on the backend's own clock), if it has one."""
+    next_wakeup = getattr(backend, "next_wakeup_ms", None)
+    if next_wakeup is None:
+        return None
+    try:
+        at_ms = next_wakeup()
+        if at_ms is None:
+            return None
+        return max(0.0, (at_ms - backend.clock.milliseconds()) / 1000.0)
+    except Exception:
+        return None
+
+
+class TickStats:
+    __slots__ = (
+        "ticks",
+        "overruns",
+        "jitter_ms_avg",
+        "jitter_ms_max",
+        "duration_ms_avg",
+        "duration_ms_max",
+    )
+
+    def __init__(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.jitter_ms_avg = 0.0
+        self.jitter_ms_max = 0.0
+        self.duration_ms_avg = 0.0
+        self.duration_ms_max = 0.0
+
+    def record(self, jitter_ms: float, duration_ms: float, interval_s: float):
+        self.ticks += 1
+        self.jitter_ms_avg += _STATS_ALPHA * (jitter_ms - self.jitter_ms_avg)
+        self.duration_ms_avg += _STATS_ALPHA * (duration_ms - self.duration_ms_avg)
+        self.jitter_ms_max = max(self.jitter_ms_max, jitter_ms)
+        self.duration_ms_max = max(self.duration_ms_max, duration_ms)
+        if duration_ms > interval_s * 1000.0:
+            self.overruns += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "jitter_ms_avg": round(self.jitter_ms_avg, 2),
+            "jitter_ms_max": round(self.jitter_ms_max, 2),
+            "duration_ms_avg": round(self.duration_ms_avg, 3),
+            "duration_ms_max": round(self.duration_ms_max, 3),
+        }
+
+
+class _Entry:
+    __slots__ = ("name", "backend", "after_tick", "next_due", "interval", "phase", "woken", "stats", "metrics")
+
+    def __init__(self, name: str, backend, after_tick: Optional[Callable[[], None]], now: float):
+        self.name = name
+        self.backend = backend
+        self.after_tick = after_tick
+        self.next_due = now
+        self.interval = DEFAULT_INTERVAL
+        self.phase = "idle"
+        self.woken = False
+        self.stats = TickStats()
+        # (duration, lateness, overrun) histogram children for this backend
+        self.metrics = (TICK_SECONDS.labels(name), TICK_LATENESS.labels(name), TICK_OVERRUN.labels(name))
+
+
+class TickScheduler:
+    def __init__(
+        self,
+        intervals: Optional[Dict[str, float]] = None,
+        time_fn: Callable[[], float] = time.monotonic,
+    ):
+        self.intervals = dict(PHASE_INTERVALS if intervals is None else intervals)
+        self._time = time_fn
+        self._entries: List[_Entry] = []
+        self._by_name: Dict[str, _Entry] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, backend, after_tick: Optional[Callable[[], None]] = None):
+        """Tick `backend.update()` (then `after_tick()`) at its phase rate."""
+        entry = _Entry(name, backend, after_tick, self._time())
+        self._entries.append(entry)
+        self._by_name[name] = entry
+
+    def unregister(self, name: str) -> bool:
+        """Stop ticking `name`; True if it was registered."""
+        entry = self._by_name.pop(name, None)
+        if entry is None:
+            return False
+        self._entries = [e for e in self._entries if e is not entry]
+        for histogram in (TICK_SECONDS, TICK_LATENESS, TICK_OVERRUN):
+            histogram.remove(name)
+        return True
+
+    def wake(self, name: Optional[str] = None):
+        """Tick `name` (or every backend) as soon as possible, e.g. after a start/stop, configure or manual change."""
+        now = self._time()
+        for entry in self._entries:
+            if name is None or entry.name == name:
+                entry.next_due = now
+                entry.woken = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def run_due(self) -> float:
+        """Run every backend that is due; return seconds until the next one is."""
+        for entry in self._entries:
+            now = self._time()
+            if now < entry.next_due:
+                continue
+
+            # a woken tick was asked for early, it is not late
+            jitter_ms = 0.0 if entry.woken else (now - entry.next_due) * 1000.0
+            due = entry.next_due
+            entry.woken = False
+            try:
+                entry.backend.update()
+                if entry.after_tick is not None:
+                    entry.after_tick()
+            except Exception as e:
+                print(f"[TICK] {entry.name} update error: {e}")
+                traceback.print_exc()
+            done = self._time()
+
+            duration = done - now
+            entry.stats.record(jitter_ms, duration * 1000.0, entry.interval)
+            took, late, overrun = entry.metrics
+            took.observe(duration)
+            late.observe(jitter_ms / 1000.0)
+            if duration > entry.interval:
+                overrun.observe(duration - entry.interval)
+            entry.phase = backend_phase(entry.backend)
+            entry.interval = self.intervals.get(entry.phase, DEFAULT_INTERVAL)
+
+            # keep a steady cadence, but don't try to catch up on missed ticks
+            entry.next_due = due + entry.interval
+            if entry.next_due <= done:
+                entry.next_due = done + entry.interval
+
+            # ...and come back early for a capture/timer the backend expects
+            wake_in = _wakeup_in_s(entry.backend)
+            if wake_in is not None and done + wake_in < entry.next_due:
+                entry.next_due = done + wake_in
+
+        if not self._entries:
+            return max(self.intervals.values(), default=DEFAULT_INTERVAL)
+        return max(0.0, min(e.next_due for e in self._entries) - self._time())
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            delay = self.run_due()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # never hog the loop, even when a backend is behind
+                await asyncio.sleep(0)
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    def get_stats(self) -> dict:
+        return {
+            e.name: {"phase": e.phase, "interval_s": e.interval, **e.stats.to_dict()}
+            for e in self._entries
+        }